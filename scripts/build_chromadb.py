@@ -1,6 +1,5 @@
 import sys
 import os
-import json
 import argparse
 
 # --- 解析参数 ---
@@ -10,7 +9,7 @@ def get_args():
         "--input_dir",
         type=str,
         required=True,
-        help="Input directory containing processed legal documents (each law/ has articles/ under it)"
+        help="Input directory containing processed legal documents (each law/ has articles/ under it, or a _corpus/ artifact)"
     )
     parser.add_argument(
         "--output_dir",
@@ -29,37 +28,69 @@ def get_args():
         action="store_true",
         help="If the database directory already exists, should it be overwritten and recreated (default: False)"
     )
+    parser.add_argument(
+        "--partition_by",
+        type=str,
+        choices=["none", "law", "chapter"],
+        default="none",
+        help="Also write per-law ('law') or per-law and per-chapter ('chapter') partition collections (default: none)"
+    )
+    parser.add_argument(
+        "--encoder_backend",
+        type=str,
+        choices=["reference", "torch", "torchscript", "onnx"],
+        default="reference",
+        help="Embedding backend: 'reference' is HuggingFaceEmbeddings on GPU, the others are the CPU-optimized encoder (default: reference)"
+    )
+    parser.add_argument(
+        "--encoder_quantize",
+        action="store_true",
+        help="Use int8 dynamic quantization for the CPU encoder (default: False)"
+    )
+    parser.add_argument(
+        "--encoder_threads",
+        type=int,
+        default=0,
+        help="Intra-op thread count for the CPU encoder, 0 uses all cores (default: 0)"
+    )
     return parser.parse_args()
 
 # --- 设置路径 ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, "src"))
 
 # --- 依赖 ---
-from src.utils.parse_law_json import parse_law_json_to_docs
-from langchain_huggingface.embeddings.huggingface import HuggingFaceEmbeddings
+from utils.corpus_artifact import load_documents
+from src.utils.partitioned_store import law_partition_name, chapter_partition_name, partition_key
+from src.utils.query_encoder import get_embedding
 from langchain_chroma import Chroma
 
+BATCH_SIZE = 1000
+
+def write_collection(name, ids, texts, metadatas, embeddings, embedding, output_dir):
+    """
+    Write precomputed embeddings into a fresh collection, so each chunk is embedded only once
+    no matter how many partitions it belongs to.
+    """
+    store = Chroma(collection_name=name, embedding_function=embedding, persist_directory=output_dir)
+    for i in range(0, len(ids), BATCH_SIZE):
+        store._collection.upsert(
+            ids=ids[i:i + BATCH_SIZE],
+            documents=texts[i:i + BATCH_SIZE],
+            metadatas=metadatas[i:i + BATCH_SIZE],
+            embeddings=embeddings[i:i + BATCH_SIZE]
+        )
+
+
 def main():
     args = get_args()
 
-    embedding = HuggingFaceEmbeddings(
-        model_name="ai-forever/ru-en-RoSBERTa",
-        model_kwargs={'device': 'cuda'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-
-    all_enhanced_documents = []
+    embedding = get_embedding(args.encoder_backend, quantize=args.encoder_quantize, num_threads=args.encoder_threads)
 
-    for law in os.listdir(args.input_dir):
-        article_dir = os.path.join(args.input_dir, f"{law}/articles")
-        if not os.path.isdir(article_dir):
-            continue
-        for file in os.listdir(article_dir):
-            with open(os.path.join(article_dir, file), "r", encoding="utf-8") as f:
-                data = json.load(f)
-            all_enhanced_documents.extend(parse_law_json_to_docs(data))
+    # 片段以内容哈希为 ID 并已去重；有列式语料库（input_dir/_corpus）时直接从中读取
+    unique_documents = {doc.id: doc for doc in load_documents(args.input_dir)}
 
     # 初始化数据库
     vectorstore = Chroma(
@@ -67,25 +98,49 @@ def main():
         persist_directory=args.output_dir
     )
 
-    # 检查 collection 是否存在
-    existing_collections = [c.name for c in vectorstore._client.list_collections()]
-    if args.collection_name in existing_collections:
+    # 检查 collection 是否存在（包括旧的分区 collection）
+    existing_collections = [c if isinstance(c, str) else c.name for c in vectorstore._client.list_collections()]
+    stale_collections = [
+        name for name in existing_collections
+        if name == args.collection_name or name.startswith(f"{args.collection_name}__")
+    ]
+    if stale_collections:
         if args.overwrite:
             print(f"⚠️ Collection {args.collection_name} already exists, deleting and rebuilding...")
-            vectorstore._client.delete_collection(name=args.collection_name)
+            for name in stale_collections:
+                vectorstore._client.delete_collection(name=name)
         else:
             print(f"❌ Collection {args.collection_name} already exists. Use --overwrite to rebuild it.")
             sys.exit(1)
 
-    # 创建 collection 并写入数据
-    new_collection = Chroma.from_documents(
-        documents=all_enhanced_documents,
-        embedding=embedding,
-        persist_directory=args.output_dir,
-        collection_name=args.collection_name
-    )
+    # 只计算一次向量，主 collection 与各分区共用
+    ids = list(unique_documents.keys())
+    texts = [doc.page_content for doc in unique_documents.values()]
+    metadatas = [doc.metadata for doc in unique_documents.values()]
+    embeddings = embedding.embed_documents(texts)
 
+    # 创建 collection 并写入数据
+    write_collection(args.collection_name, ids, texts, metadatas, embeddings, embedding, args.output_dir)
     print(f"✅ Collection '{args.collection_name}' created successfully in database {args.output_dir}")
 
+    # 写入分区：chapter 模式同时生成法律分区与章节分区
+    levels = {"none": [], "law": ["law"], "chapter": ["law", "chapter"]}[args.partition_by]
+    for level in levels:
+        partitions = {}
+        for i, metadata in enumerate(metadatas):
+            partitions.setdefault(partition_key(metadata, level), []).append(i)
+        for key, rows in partitions.items():
+            name = law_partition_name(args.collection_name, key) if level == "law" else chapter_partition_name(args.collection_name, *key)
+            write_collection(
+                name,
+                [ids[i] for i in rows],
+                [texts[i] for i in rows],
+                [metadatas[i] for i in rows],
+                [embeddings[i] for i in rows],
+                embedding,
+                args.output_dir
+            )
+        print(f"✅ {len(partitions)} {level} partitions of '{args.collection_name}' created")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,46 @@
+import sys
+import os
+import argparse
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Building the citation graph between law articles and clauses")
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        default="data/processed/laws",
+        help="Input directory containing processed legal documents (each law/ has articles/ under it, or a _corpus/ artifact)"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="data/processed/citation_graph.npz",
+        help="Output file for the CSR citation graph (default: data/processed/citation_graph.npz)"
+    )
+    return parser.parse_args()
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+import numpy as np
+from utils.small_to_big import load_article_store
+from utils.citation_graph import build_citation_graph
+
+def write_citation_graph(input_dir, output):
+    arrays = build_citation_graph(load_article_store(input_dir))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    # 先写临时文件再替换，运行中的服务热重载时不会读到半个文件
+    tmp_output = f"{output}.tmp.npz"
+    np.savez(tmp_output, **arrays)
+    os.replace(tmp_output, output)
+    print(f"✅ Citation graph with {len(arrays['nodes'])} nodes and {len(arrays['out_indices'])} edges saved to {output}")
+
+def main():
+    args = get_args()
+    write_citation_graph(args.input_dir, args.output)
+
+if __name__ == "__main__":
+    main()
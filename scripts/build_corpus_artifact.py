@@ -0,0 +1,80 @@
+import sys
+import os
+import time
+import argparse
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Consolidating processed law articles into a memory-mappable columnar corpus (Arrow IPC)")
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        default="data/processed/laws",
+        help="Input directory containing processed legal documents (each law/ has articles/ under it)"
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Output directory for the corpus artifact (default: <input_dir>/_corpus, where all readers look for it)"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Re-open the artifact, check the content hashes and compare it with the article JSON files (default: False)"
+    )
+    return parser.parse_args()
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+import json
+from utils.parse_law_json import parse_law_json_to_docs, chunk_id
+from utils.corpus_artifact import CORPUS_DIR, CorpusArtifact, write_corpus_artifact, article_files
+
+def load_from_json(input_dir):
+    documents = {}
+    for rel_path in article_files(input_dir):
+        with open(os.path.join(input_dir, rel_path), "r", encoding="utf-8") as f:
+            for doc in parse_law_json_to_docs(json.load(f)):
+                documents.setdefault(chunk_id(doc), doc)
+    return documents
+
+def verify(input_dir, output_dir):
+    """
+    Check the content hashes, then compare the chunks read from the artifact with those parsed from the JSON files.
+    """
+    start = time.perf_counter()
+    artifact = CorpusArtifact(output_dir, verify=True)
+    documents = artifact.documents()
+    artifact_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    expected = load_from_json(input_dir)
+    json_ms = (time.perf_counter() - start) * 1000
+
+    mismatched = [
+        doc.id for doc in documents
+        if doc.id not in expected or (doc.page_content, doc.metadata) != (expected[doc.id].page_content, expected[doc.id].metadata)
+    ]
+    if mismatched or len(documents) != len(expected) or not artifact.is_current(input_dir):
+        print(f"❌ {output_dir} does not match the article JSON files in {input_dir} ({len(mismatched)} mismatched chunks)")
+        sys.exit(1)
+    print(f"✅ Hashes verified; {len(documents)} chunks match the JSON files")
+    print(f"   load time: artifact {artifact_ms:.1f} ms, JSON files {json_ms:.1f} ms")
+
+def main():
+    args = get_args()
+    output_dir = args.output_dir or os.path.join(args.input_dir, CORPUS_DIR)
+    start = time.perf_counter()
+    manifest = write_corpus_artifact(args.input_dir, output_dir)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {manifest['counts']['articles']} articles and {manifest['counts']['chunks']} chunks written to {output_dir} in {elapsed:.2f}s")
+    if args.verify:
+        verify(args.input_dir, output_dir)
+
+if __name__ == "__main__":
+    main()
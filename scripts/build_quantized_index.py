@@ -0,0 +1,161 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Building int8/binary quantized copies of the law embeddings and reporting recall, memory and latency")
+    parser.add_argument(
+        "--chroma_dir",
+        type=str,
+        default="data/chroma",
+        help="ChromaDB directory written by build_chromadb.py (default: data/chroma)"
+    )
+    parser.add_argument(
+        "--collection_name",
+        type=str,
+        default="law_articles",
+        help="ChromaDB collection name (default: law_articles)"
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="data/quantized/law_articles",
+        help="Output directory for the quantized index (default: data/quantized/law_articles)"
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["int8", "binary", "both"],
+        default="both",
+        help="Quantized copies to write (default: both)"
+    )
+    parser.add_argument(
+        "--queries_file",
+        type=str,
+        default=None,
+        help="Text file with one evaluation query per line; embedded with RoSBERTa (default: sample corpus vectors)"
+    )
+    parser.add_argument(
+        "--n_queries",
+        type=int,
+        default=200,
+        help="Number of corpus vectors sampled as evaluation queries when --queries_file is not given (default: 200)"
+    )
+    parser.add_argument(
+        "--noise",
+        type=float,
+        default=0.05,
+        help="Gaussian noise added to sampled corpus vectors so they do not trivially match themselves (default: 0.05)"
+    )
+    parser.add_argument(
+        "--k",
+        type=int,
+        default=20,
+        help="Number of results used for recall@k (default: 20)"
+    )
+    parser.add_argument(
+        "--rescore_factors",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Candidate multipliers for the first stage (k * factor candidates are rescored) (default: 1 2 4 8)"
+    )
+    parser.add_argument(
+        "--no_eval",
+        action="store_true",
+        help="Only write the index, skip the recall/latency report (default: False)"
+    )
+    return parser.parse_args()
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+import numpy as np
+from langchain_chroma import Chroma
+from utils.quantized_index import MODES, QuantizedIndex, write_quantized_index
+
+def load_queries(args, embeddings):
+    if args.queries_file:
+        from langchain_huggingface.embeddings.huggingface import HuggingFaceEmbeddings
+        embedding = HuggingFaceEmbeddings(
+            model_name="ai-forever/ru-en-RoSBERTa",
+            model_kwargs={'device': 'cuda'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        return np.asarray(embedding.embed_documents(queries), dtype=np.float32)
+
+    rng = np.random.default_rng(0)
+    sample = embeddings[rng.choice(len(embeddings), size=min(args.n_queries, len(embeddings)), replace=False)]
+    queries = sample + rng.normal(scale=args.noise, size=sample.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def evaluate(index, queries, truth, k, rescore):
+    recalls = []
+    start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        rows, _ = index.search(query, k, rescore=rescore)
+        recalls.append(len(set(rows.tolist()) & expected) / len(expected))
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return float(np.mean(recalls)), latency_ms
+
+def report(args, modes):
+    exact = QuantizedIndex(args.output_dir, mode="float")
+    embeddings = np.asarray(exact.vectors)
+    queries = load_queries(args, embeddings)
+    # 全精度全量扫描作为基准
+    truth = [set(exact.search(query, args.k)[0].tolist()) for query in queries]
+    _, float_latency = evaluate(exact, queries, truth, args.k, rescore=False)
+
+    rows = [{
+        "mode": "float", "rescore_factor": None, "recall_stage1": 1.0, "recall": 1.0,
+        "memory_bytes": exact.memory_bytes(), "latency_ms": float_latency
+    }]
+    for mode in modes:
+        for factor in args.rescore_factors:
+            index = QuantizedIndex(args.output_dir, mode=mode, rescore_factor=factor)
+            recall_stage1, _ = evaluate(index, queries, truth, args.k, rescore=False)
+            recall, latency = evaluate(index, queries, truth, args.k, rescore=True)
+            rows.append({
+                "mode": mode, "rescore_factor": factor, "recall_stage1": recall_stage1, "recall": recall,
+                "memory_bytes": index.memory_bytes(), "latency_ms": latency
+            })
+
+    print(f"\n📊 recall@{args.k} over {len(queries)} queries ({len(embeddings)} vectors, dim {embeddings.shape[1]})")
+    print(f"{'mode':<8}{'factor':>8}{'stage1':>10}{'rescored':>10}{'memory':>14}{'latency':>12}")
+    for row in rows:
+        factor = "-" if row["rescore_factor"] is None else row["rescore_factor"]
+        memory = f"{row['memory_bytes'] / 2**20:.2f} MiB ({row['memory_bytes'] / exact.memory_bytes():.0%})"
+        print(f"{row['mode']:<8}{factor:>8}{row['recall_stage1']:>10.3f}{row['recall']:>10.3f}{memory:>14}{row['latency_ms']:>10.2f}ms")
+
+    report_path = os.path.join(args.output_dir, "report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"k": args.k, "n_queries": len(queries), "results": rows}, f, indent=2)
+    print(f"✅ Report saved to {report_path}")
+
+def main():
+    args = get_args()
+    modes = list(MODES) if args.mode == "both" else [args.mode]
+
+    # 直接读取 Chroma 中已保存的向量，不重新计算 embedding
+    store = Chroma(collection_name=args.collection_name, persist_directory=args.chroma_dir)
+    raw = store._collection.get(include=["embeddings"])
+    if not raw["ids"]:
+        print(f"❌ Collection '{args.collection_name}' in {args.chroma_dir} is empty.")
+        sys.exit(1)
+    embeddings = np.asarray(raw["embeddings"], dtype=np.float32)
+    write_quantized_index(args.output_dir, raw["ids"], embeddings, modes=modes, collection=args.collection_name)
+    print(f"✅ Quantized index ({', '.join(modes)}) for {len(raw['ids'])} vectors saved to {args.output_dir}")
+
+    if not args.no_eval:
+        report(args, modes)
+
+if __name__ == "__main__":
+    main()
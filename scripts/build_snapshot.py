@@ -0,0 +1,147 @@
+import sys
+import os
+import json
+import shutil
+import argparse
+import datetime
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Ingest processed laws as an immutable, versioned index snapshot")
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        default="data/processed/laws",
+        help="Input directory containing processed legal documents (each law/ has articles/ under it, or a _corpus/ artifact)"
+    )
+    parser.add_argument(
+        "--snapshot_root",
+        type=str,
+        default="data/snapshots",
+        help="Root directory holding the shared chunk store, article objects and snapshot manifests (default: data/snapshots)"
+    )
+    parser.add_argument(
+        "--as_of",
+        type=str,
+        default=datetime.date.today().isoformat(),
+        help="Date (YYYY-MM-DD) from which this version of the laws is in effect (default: today)"
+    )
+    parser.add_argument(
+        "--no_activate",
+        action="store_true",
+        help="Build the snapshot without switching CURRENT to it (default: False)"
+    )
+    return parser.parse_args()
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+from utils.parse_law_json import parse_law_json_to_docs, chunk_id
+from utils.corpus_artifact import iter_article_sources
+from src.utils.snapshots import (
+    STORE_DIR, OBJECTS_DIR, SNAPSHOTS_DIR, CURRENT_FILE, SNAPSHOT_COLLECTION, OPEN_END,
+    date_key, write_atomic, list_manifests
+)
+from langchain_huggingface.embeddings.huggingface import HuggingFaceEmbeddings
+from langchain_chroma import Chroma
+
+BATCH_SIZE = 1000
+
+def main():
+    args = get_args()
+    as_of = datetime.date.fromisoformat(args.as_of).isoformat()
+    as_of_key = date_key(as_of)
+
+    # 快照按生效日期单调递增，区间过滤才能准确还原每个快照的内容
+    manifests = list_manifests(args.snapshot_root)
+    if manifests and manifests[-1]["as_of"] >= as_of:
+        print(f"❌ Snapshot {manifests[-1]['as_of']} already exists; --as_of must be later than it.")
+        sys.exit(1)
+
+    # 读取条文，条文 JSON 按内容寻址保存，未变化的条文在各版本间共享
+    objects_dir = os.path.join(args.snapshot_root, OBJECTS_DIR)
+    os.makedirs(objects_dir, exist_ok=True)
+    articles = {}
+    documents = {}
+    # 有列式语料库时从中读取原始 JSON 文本，摘要与直接读取文件相同
+    for digest, raw in iter_article_sources(args.input_dir):
+        data = json.loads(raw)
+        object_path = os.path.join(objects_dir, f"{digest}.json")
+        if not os.path.exists(object_path):
+            write_atomic(object_path, raw)
+        articles[f"{data['law_index']}/{data['article_index']}"] = digest
+        for doc in parse_law_json_to_docs(data):
+            documents.setdefault(chunk_id(doc), doc)
+
+    embedding = HuggingFaceEmbeddings(
+        model_name="ai-forever/ru-en-RoSBERTa",
+        model_kwargs={'device': 'cuda'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+    store = Chroma(
+        collection_name=SNAPSHOT_COLLECTION,
+        embedding_function=embedding,
+        persist_directory=os.path.join(args.snapshot_root, STORE_DIR)
+    )
+    collection = store._collection
+
+    # 当前仍有效的片段：内容未变的直接沿用，不再重复写入
+    # 存储 ID 可能带有 "@日期" 后缀（见下文），按内容哈希对齐
+    open_chunks = collection.get(where={"valid_to": OPEN_END}, include=["metadatas"])
+    open_metadatas = dict(zip(open_chunks["ids"], open_chunks["metadatas"]))
+    open_ids = {store_id.split("@")[0]: store_id for store_id in open_metadatas}
+    unchanged = [open_ids[doc_id] for doc_id in documents if doc_id in open_ids]
+    added = [doc_id for doc_id in documents if doc_id not in open_ids]
+    retired = [store_id for doc_id, store_id in open_ids.items() if doc_id not in documents]
+
+    # 新增片段；曾经失效又重新出现的内容使用带日期后缀的 ID，避免覆盖其历史有效期
+    existing = set(collection.get(ids=added, include=[])["ids"]) if added else set()
+    store_ids = {doc_id: (f"{doc_id}@{as_of}" if doc_id in existing else doc_id) for doc_id in added}
+    for i in range(0, len(added), BATCH_SIZE):
+        batch = added[i:i + BATCH_SIZE]
+        texts = [documents[doc_id].page_content for doc_id in batch]
+        collection.upsert(
+            ids=[store_ids[doc_id] for doc_id in batch],
+            documents=texts,
+            metadatas=[{**documents[doc_id].metadata, "valid_from": as_of_key, "valid_to": OPEN_END} for doc_id in batch],
+            embeddings=embedding.embed_documents(texts)
+        )
+
+    # 不再出现的片段只关闭有效期，历史快照仍可检索到
+    for i in range(0, len(retired), BATCH_SIZE):
+        batch = retired[i:i + BATCH_SIZE]
+        collection.update(
+            ids=batch,
+            metadatas=[{**open_metadatas[store_id], "valid_to": as_of_key} for store_id in batch]
+        )
+
+    # 写入不可变的快照清单：先写临时目录，再整体改名
+    manifest = {
+        "snapshot_id": as_of,
+        "as_of": as_of,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "collection": SNAPSHOT_COLLECTION,
+        "articles": articles,
+        "chunk_ids": sorted(unchanged + list(store_ids.values())),
+        "stats": {"added": len(added), "unchanged": len(unchanged), "retired": len(retired)}
+    }
+    snapshot_dir = os.path.join(args.snapshot_root, SNAPSHOTS_DIR, as_of)
+    tmp_dir = f"{snapshot_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_dir, snapshot_dir)
+    print(f"✅ Snapshot {as_of}: {len(added)} added, {len(unchanged)} shared with previous version, {len(retired)} retired")
+
+    # 原子切换 CURRENT，服务端在下一次请求时使用新快照
+    if not args.no_activate:
+        write_atomic(os.path.join(args.snapshot_root, CURRENT_FILE), as_of)
+        print(f"✅ CURRENT -> {as_of}")
+
+if __name__ == "__main__":
+    main()
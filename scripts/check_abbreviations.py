@@ -0,0 +1,67 @@
+import sys
+import os
+import argparse
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Checking that abbreviation expansion leaves legal identifiers untouched")
+    parser.add_argument(
+        "--abbreviation_file",
+        type=str,
+        default=None,
+        help="Abbreviation dictionary to check (default: data/processed/abbreviations/abbreviations.json under the project root)"
+    )
+    return parser.parse_args()
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+from utils.abbreviation_map import ABBREVIATION_FILE
+from utils.abbreviation_matcher import AbbreviationMatcher
+from utils.process_query import get_abbreviation_matcher
+
+# 法律编号与正式引用，须原样保留
+UNCHANGED = [
+    "Федеральный закон N 115-ФЗ",
+    "ст. 8 115-ФЗ РФ",
+    "Указ Президента РФ от 05.05.2014 N 6-ИП",
+    "62-ФЗ о гражданстве",
+]
+
+# 口语缩写，须被展开
+EXPANDED = {
+    "как продлить ВНЖ": 'как продлить "Вид на жительство (ВНЖ)"',
+    "рвп по браку": '"Разрешение на временное проживание (рвп)" по браку',
+}
+
+
+def check(name: str, ok: bool, detail: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {name}: {detail}")
+    return ok
+
+
+def main():
+    args = get_args()
+    path = args.abbreviation_file or os.path.join(project_root, ABBREVIATION_FILE)
+    matcher = get_abbreviation_matcher(path)
+
+    results = []
+    for text in UNCHANGED:
+        processed, n_expanded = matcher.expand(text)
+        results.append(check("unchanged", processed == text and n_expanded == 0, f"{text!r} -> {processed!r}"))
+    for text, expected in EXPANDED.items():
+        processed, _ = matcher.expand(text)
+        results.append(check("expanded", processed == expected, f"{text!r} -> {processed!r}"))
+
+    # 即使词典中含有 "фз"，编号中的 "ФЗ" 也不应被替换
+    guarded, _ = AbbreviationMatcher({"фз": "Федеральный закон"}).expand("115-ФЗ и 115 - ФЗ")
+    results.append(check("number-dash guard", guarded == "115-ФЗ и 115 - ФЗ", f"{guarded!r}"))
+
+    print(f"📚 Dictionary version: {matcher.version}")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
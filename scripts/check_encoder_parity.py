@@ -0,0 +1,126 @@
+import sys
+import os
+import time
+import random
+import argparse
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Checking that an optimized RoSBERTa encoder matches the reference model used to build the index")
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["torch", "torchscript", "onnx"],
+        default="onnx",
+        help="Optimized encoder backend to check (default: onnx)"
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Check the int8 dynamically quantized variant (default: False)"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="Intra-op thread count for the optimized encoder, 0 uses all cores (default: 0)"
+    )
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        default="data/processed/laws",
+        help="Processed laws used to sample chunk texts (default: data/processed/laws)"
+    )
+    parser.add_argument(
+        "--queries_file",
+        type=str,
+        default=None,
+        help="Optional text file with one query per line, checked in addition to the sampled chunks (default: None)"
+    )
+    parser.add_argument(
+        "--n_samples",
+        type=int,
+        default=200,
+        help="Number of chunk texts sampled from the corpus (default: 200)"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="Maximum allowed 1 - cosine similarity (default: 1e-4 for fp32, 2e-2 for int8)"
+    )
+    parser.add_argument(
+        "--chroma_dir",
+        type=str,
+        default=None,
+        help="Also compare top-k results on this ChromaDB index (default: skip)"
+    )
+    parser.add_argument(
+        "--collection_name",
+        type=str,
+        default="law_articles",
+        help="ChromaDB collection name (default: law_articles)"
+    )
+    parser.add_argument(
+        "--k",
+        type=int,
+        default=10,
+        help="Number of results compared on the index (default: 10)"
+    )
+    return parser.parse_args()
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+from utils.corpus_artifact import load_documents
+from utils.query_encoder import OptimizedEmbeddings, get_embedding, check_parity
+
+def sample_texts(args):
+    texts = [doc.page_content for doc in load_documents(args.input_dir)]
+    texts = random.Random(0).sample(texts, min(args.n_samples, len(texts)))
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            texts.extend(line.strip() for line in f if line.strip())
+    return texts
+
+def mean_latency_ms(embedding, texts):
+    start = time.perf_counter()
+    for text in texts:
+        embedding.embed_query(text)
+    return (time.perf_counter() - start) * 1000 / len(texts)
+
+def main():
+    args = get_args()
+    texts = sample_texts(args)
+    # 参考模型与建索引时一致，在 CPU 上运行以便比较延迟
+    reference = get_embedding("reference", device="cpu")
+    optimized = OptimizedEmbeddings(backend=args.backend, quantize=args.quantize, num_threads=args.threads)
+
+    result = check_parity(optimized, reference, texts, args.tolerance)
+    print(f"📐 {args.backend} ({optimized.precision}) on {len(texts)} texts: "
+          f"max 1-cos {result['max']:.2e}, mean {result['mean']:.2e}, tolerance {result['tolerance']:.0e}")
+
+    queries = [text for text in texts if len(text) < 300] or texts
+    print(f"⏱️ Mean query latency: reference {mean_latency_ms(reference, queries):.1f}ms, "
+          f"optimized {mean_latency_ms(optimized, queries):.1f}ms")
+
+    if args.chroma_dir:
+        from langchain_chroma import Chroma
+        store = Chroma(collection_name=args.collection_name, persist_directory=args.chroma_dir)
+        overlaps = []
+        for query in queries:
+            expected = {doc.id for doc in store.similarity_search_by_vector(reference.embed_query(query), k=args.k)}
+            actual = {doc.id for doc in store.similarity_search_by_vector(optimized.embed_query(query), k=args.k)}
+            overlaps.append(len(expected & actual) / max(len(expected), 1))
+        print(f"🔎 Top-{args.k} overlap on {args.collection_name}: {sum(overlaps) / len(overlaps):.3f}")
+
+    if not result["passed"]:
+        print("❌ Parity check failed: the optimized encoder must not be used with the existing index.")
+        sys.exit(1)
+    print("✅ Parity check passed.")
+
+if __name__ == "__main__":
+    main()
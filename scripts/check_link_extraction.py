@@ -0,0 +1,118 @@
+import sys
+import os
+import asyncio
+import argparse
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Checking link extraction against locally served fixture pages")
+    parser.add_argument(
+        "--fixtures_dir",
+        type=str,
+        default=None,
+        help="Directory to write and serve the fixture pages from (default: a temporary directory)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=2,
+        help="Browser contexts used by extract_links_many (default: 2)"
+    )
+    return parser.parse_args()
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+import tempfile
+import requests
+from fetch.fetch_and_extract_links import extract_links_static, extract_links_many
+
+NAV = "".join(f'<a href="/section/{i}">Раздел {i}</a>' for i in range(8))
+FOOTER = "".join(f'<a href="/about/{i}">О портале {i}</a>' for i in range(4))
+
+# 静态页面：正文中的链接直接写在 HTML 中
+STATIC_PAGE = f"""<html><body>
+<header><nav>{NAV}</nav></header>
+<main>{"".join(f'<p><a href="/services/{i}">Услуга {i}</a></p>' for i in range(6))}<a href="#top">Наверх</a></main>
+<footer>{FOOTER}</footer>
+</body></html>"""
+
+# 单页应用外壳：页眉、页脚有足够多的静态链接，正文链接由 JavaScript 插入
+SPA_SHELL_PAGE = f"""<html><body>
+<header><nav>{NAV}</nav></header>
+<main class="page"></main>
+<footer>{FOOTER}</footer>
+<script>
+document.querySelector("main").innerHTML =
+  [0, 1, 2].map(i => '<a href="/rendered/' + i + '">Документ ' + i + '</a>').join("");
+</script>
+</body></html>"""
+
+FIXTURES = {"static.html": STATIC_PAGE, "spa_shell.html": SPA_SHELL_PAGE}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *_):
+        pass
+
+
+def check(name: str, ok: bool, detail: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {name}: {detail}")
+    return ok
+
+
+async def check_many(base_url: str, dead_url: str, concurrency: int):
+    urls = [f"{base_url}/static.html", f"{base_url}/spa_shell.html", dead_url]
+    links, errors = await extract_links_many(urls, concurrency=concurrency)
+    results = [
+        check("static page in batch", len(links.get(urls[0], [])) == 18, f"{len(links.get(urls[0], []))} links"),
+        check("unreachable page", dead_url in errors and dead_url not in links, errors.get(dead_url, "no error recorded")),
+    ]
+    if urls[1] in links:
+        rendered = [link for link in links[urls[1]] if "/rendered/" in link["href"]]
+        results.append(check("SPA page rendered in browser", len(rendered) == 3, f"{len(rendered)} rendered links"))
+    else:
+        # 没有可用的 Chromium 时浏览器路径无法验证，但不应影响其他页面
+        print(f"⚠️ SPA page could not be rendered (is Chromium installed? `playwright install chromium`): {errors.get(urls[1])}")
+    return results
+
+
+def main():
+    args = get_args()
+    fixtures_dir = args.fixtures_dir or tempfile.mkdtemp(prefix="link_fixtures_")
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for name, content in FIXTURES.items():
+        with open(os.path.join(fixtures_dir, name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    handler = partial(QuietHandler, directory=fixtures_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # 先占用再释放一个端口，作为无法连接的地址
+    probe = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    dead_url = f"http://127.0.0.1:{probe.server_address[1]}/missing.html"
+    probe.server_close()
+
+    session = requests.Session()
+    try:
+        static_links, static_dynamic = extract_links_static(f"{base_url}/static.html", session)
+        shell_links, shell_dynamic = extract_links_static(f"{base_url}/spa_shell.html", session)
+        results = [
+            check("static page", not static_dynamic and len(static_links) == 18, f"{len(static_links)} links, browser needed: {static_dynamic}"),
+            check("SPA shell detected", shell_dynamic, f"{len(shell_links)} header/footer links, browser needed: {shell_dynamic}"),
+        ]
+        results += asyncio.run(check_many(base_url, dead_url, args.concurrency))
+    finally:
+        server.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
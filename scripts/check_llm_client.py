@@ -0,0 +1,203 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Checking the pooled LLM client against a local OpenAI-compatible stub server")
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=4,
+        help="Process-wide concurrency cap under test (default: 4)"
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.2,
+        help="Seconds the stub server waits before answering each request (default: 0.2)"
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=16,
+        help="Number of distinct requests sent in the concurrency check, half sync and half async (default: 16)"
+    )
+    return parser.parse_args()
+
+args = get_args()
+
+# 上限在导入时读取，须在导入 llm_client 之前设置
+os.environ["STD_MIGRATION_LLM_MAX_CONCURRENCY"] = str(args.max_concurrency)
+os.environ["STD_MIGRATION_LLM_MODEL_CONCURRENCY"] = str(args.max_concurrency)
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, os.path.join(project_root, "src"))
+
+# --- 依赖 ---
+from utils.llm_client import get_llm, get_llm_stats
+
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+
+    def reset(self):
+        with self.lock:
+            self.active = self.max_active = self.requests = 0
+
+
+state = StubState()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    最小的 OpenAI 兼容 /chat/completions 接口：等待固定时间后回显最后一条消息。
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with state.lock:
+            state.requests += 1
+            state.active += 1
+            state.max_active = max(state.max_active, state.active)
+        try:
+            time.sleep(args.delay)
+        finally:
+            with state.lock:
+                state.active -= 1
+        payload = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": body["messages"][-1]["content"]}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # 被取消的请求已断开连接
+            pass
+
+    def log_message(self, *_):
+        pass
+
+
+def check(name: str, ok: bool, detail: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {name}: {detail}")
+    return ok
+
+
+def check_concurrency(llm) -> bool:
+    state.reset()
+    half = args.requests // 2
+
+    async def run_async():
+        await asyncio.gather(*(llm.ainvoke(f"async {i}") for i in range(half)))
+
+    threads = [threading.Thread(target=llm.invoke, args=(f"sync {i}",)) for i in range(args.requests - half)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(run_async())
+    for thread in threads:
+        thread.join()
+    return check(
+        "shared concurrency cap",
+        state.max_active <= args.max_concurrency and state.requests == args.requests,
+        f"{state.requests} requests, at most {state.max_active} in flight (cap {args.max_concurrency}, sync and async together)"
+    )
+
+
+def check_single_flight(llm) -> bool:
+    state.reset()
+
+    async def run():
+        return await asyncio.gather(*(llm.ainvoke("same question") for _ in range(5)))
+
+    answers = asyncio.run(run())
+    return check(
+        "single flight",
+        state.requests == 1 and all(answer.content == "same question" for answer in answers),
+        f"5 identical calls, {state.requests} request(s) sent"
+    )
+
+
+def check_leader_cancelled(llm) -> bool:
+    state.reset()
+
+    async def run():
+        leader = asyncio.create_task(llm.ainvoke("cancelled leader"))
+        await asyncio.sleep(args.delay / 4)
+        followers = [asyncio.create_task(llm.ainvoke("cancelled leader")) for _ in range(3)]
+        await asyncio.sleep(args.delay / 4)
+        leader.cancel()
+        return await asyncio.gather(*followers, return_exceptions=True)
+
+    answers = asyncio.run(run())
+    ok = all(not isinstance(answer, BaseException) and answer.content == "cancelled leader" for answer in answers)
+    return check(
+        "leader cancellation",
+        ok and state.requests == 2,
+        f"followers got {[type(answer).__name__ for answer in answers]}, {state.requests} request(s) sent"
+    )
+
+
+def check_event_loops(llm) -> bool:
+    state.reset()
+    errors = []
+    per_loop = 2 * args.max_concurrency
+
+    def run_in_new_loop(name):
+        # 每个事件循环中的请求数超过上限，确保等待名额的路径也被用到
+        async def run():
+            await asyncio.gather(*(llm.ainvoke(f"{name} {i}") for i in range(per_loop)))
+        try:
+            asyncio.run(run())
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    run_in_new_loop("loop 1")
+    run_in_new_loop("loop 2")
+    thread = threading.Thread(target=run_in_new_loop, args=("loop 3",))
+    thread.start()
+    thread.join()
+    return check(
+        "event loop reuse",
+        not errors and state.requests == 3 * per_loop,
+        f"3 event loops, {state.requests} request(s) answered" + (f", errors: {errors}" if errors else "")
+    )
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm = get_llm(model="stub-model", api_key="stub", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        results = [
+            check_concurrency(llm),
+            check_single_flight(llm),
+            check_leader_cancelled(llm),
+            check_event_loops(llm),
+        ]
+    finally:
+        server.shutdown()
+    print(json.dumps(get_llm_stats(), ensure_ascii=False, indent=2))
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import sys
+import os
+import time
+import argparse
+import subprocess
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Starting one local retrieval node per law partition, for testing scatter-gather retrieval on one machine")
+    parser.add_argument(
+        "--chroma_dir",
+        type=str,
+        default="data/chroma",
+        help="ChromaDB directory written by build_chromadb.py --partition_by law (default: data/chroma)"
+    )
+    parser.add_argument(
+        "--collection_name",
+        type=str,
+        default="law_articles",
+        help="Base collection name; every '<name>__law_<index>' partition becomes one shard (default: law_articles)"
+    )
+    parser.add_argument(
+        "--base_port",
+        type=int,
+        default=8101,
+        help="Port of the first node, the others use consecutive ports (default: 8101)"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Host used in the printed --shard_nodes value (default: 127.0.0.1)"
+    )
+    args, node_args = parser.parse_known_args()
+    # 其余参数（如 --use_reranker、--query_backend local_first）原样传给每个节点
+    return args, node_args
+
+# --- 设置路径 ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+
+# --- 依赖 ---
+import chromadb
+
+def main():
+    args, node_args = get_args()
+    prefix = f"{args.collection_name}__law_"
+    collections = [c if isinstance(c, str) else c.name for c in chromadb.PersistentClient(path=args.chroma_dir).list_collections()]
+    shards = sorted(name for name in collections if name.startswith(prefix))
+    if not shards:
+        print(f"❌ No '{prefix}*' partitions in {args.chroma_dir}; build them with build_chromadb.py --partition_by law")
+        sys.exit(1)
+
+    server = os.path.join(project_root, "src", "tools", "lawyer_tools.py")
+    processes = []
+    nodes = []
+    for i, shard in enumerate(shards):
+        port = args.base_port + i
+        command = [
+            sys.executable, server,
+            "--retrieval_node",
+            "--chroma_dir", args.chroma_dir,
+            "--law_collection_name", shard,
+            "--port", str(port),
+            *node_args
+        ]
+        processes.append(subprocess.Popen(command, cwd=project_root))
+        nodes.append(f"http://{args.host}:{port}")
+        print(f"✅ {shard} -> {nodes[-1]}")
+
+    print(f"Start the gateway with: --shard_nodes {','.join(nodes)}")
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        print("❌ A retrieval node exited, stopping the others")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+if __name__ == "__main__":
+    main()
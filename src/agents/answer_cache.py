@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import numpy as np
+from typing import List, Dict, Any, Optional, Callable, Iterable, Set
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存：以问题向量为键保存 Agent 的最终报告。
+
+    每条缓存同时记录报告所依据的法律片段 ID（见 parse_law_json.chunk_id，由内容哈希生成），
+    命中时先确认这些片段仍存在于索引中；任何片段被修改或删除，该条缓存即被丢弃。
+    没有片段 ID 的结果（small-to-big 条文块、引用扩展）记录为 "law_index:article_index" 及条文内容的哈希，
+    命中时与当前条文的哈希比较。依据无法校验的报告不会被缓存。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedding,
+        threshold: float = 0.95,
+        chunk_exists: Optional[Callable[[List[str]], Set[str]]] = None,
+        article_hashes: Optional[Callable[[], Dict[str, str]]] = None,
+        max_entries: int = 5000,
+    ):
+        self.path = path
+        self.embedding = embedding
+        self.threshold = threshold
+        self.chunk_exists = chunk_exists
+        self.article_hashes = article_hashes
+        self.max_entries = max_entries
+        self.entries: List[Dict[str, Any]] = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        self._vectors = self._stack_vectors()
+
+    def _stack_vectors(self):
+        if not self.entries:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray([e["embedding"] for e in self.entries], dtype=np.float32)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _drop(self, indices: Iterable[int]):
+        indices = set(indices)
+        self.entries = [e for i, e in enumerate(self.entries) if i not in indices]
+        self._vectors = self._stack_vectors()
+        self._save()
+
+    def _is_valid(self, entry: Dict[str, Any]) -> bool:
+        chunk_ids = entry["chunk_ids"]
+        article_refs = entry.get("article_refs", {})
+        if not chunk_ids and not article_refs:
+            return False
+        if chunk_ids:
+            if self.chunk_exists is None:
+                return False
+            existing = self.chunk_exists(chunk_ids)
+            if not all(chunk in existing for chunk in chunk_ids):
+                return False
+        if article_refs:
+            if self.article_hashes is None:
+                return False
+            current = self.article_hashes()
+            return all(current.get(ref) == digest for ref, digest in article_refs.items())
+        return True
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        查找与 question 相似度不低于阈值的缓存报告，返回 {"report", "question", "similarity", ...}，未命中返回 None。
+        """
+        if not self.entries:
+            return None
+        query_vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        # 向量已归一化，点积即余弦相似度
+        similarities = self._vectors @ query_vector
+
+        stale = []
+        hit = None
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.threshold:
+                break
+            if self._is_valid(self.entries[i]):
+                hit = dict(self.entries[i], similarity=float(similarities[i]))
+                hit.pop("embedding")
+                break
+            stale.append(int(i))
+
+        if stale:
+            self._drop(stale)
+        return hit
+
+    def store(self, question: str, report: str, chunk_ids: List[str], article_refs: Iterable[str] = ()) -> bool:
+        """
+        保存一条新的最终报告及其依据的片段 ID 与条文引用，超出容量时淘汰最早的条目。
+        依据为空或无法校验（没有对应的校验函数、条文已不存在）时不缓存，返回 False。
+        """
+        chunk_ids = sorted(set(chunk_ids))
+        article_refs = sorted(set(article_refs))
+        if not chunk_ids and not article_refs:
+            return False
+        if chunk_ids and self.chunk_exists is None:
+            return False
+        hashes = {}
+        if article_refs:
+            if self.article_hashes is None:
+                return False
+            current = self.article_hashes()
+            if not all(ref in current for ref in article_refs):
+                return False
+            hashes = {ref: current[ref] for ref in article_refs}
+
+        vector = self.embedding.embed_query(question)
+        self.entries.append({
+            "question": question,
+            "report": report,
+            "chunk_ids": chunk_ids,
+            "article_refs": hashes,
+            "created_at": time.time(),
+            "embedding": [float(x) for x in vector],
+        })
+        if len(self.entries) > self.max_entries:
+            self.entries = self.entries[-self.max_entries:]
+        self._vectors = self._stack_vectors()
+        self._save()
+        return True
+
+
+def extract_chunk_ids(tool_output) -> List[str]:
+    """
+    从 search_law_articles 的工具输出（Document 列表或紧凑 JSON）中提取片段 ID。
+    """
+    if isinstance(tool_output, list):
+        texts = [part.get("text", "") if isinstance(part, dict) else str(part) for part in tool_output]
+    else:
+        texts = [str(tool_output)]
+
+    chunk_ids = []
+
+    def collect(node):
+        if isinstance(node, dict):
+            if "page_content" in node and node.get("id"):
+                chunk_ids.append(node["id"])
+            chunk_ids.extend(node.get("ids", []))
+            for value in node.values():
+                if isinstance(value, (dict, list)):
+                    collect(value)
+        elif isinstance(node, list):
+            for item in node:
+                collect(item)
+
+    for text in texts:
+        try:
+            collect(json.loads(text))
+        except (json.JSONDecodeError, TypeError):
+            continue
+    return chunk_ids
+
+
+def extract_article_refs(tool_output) -> List[str]:
+    """
+    从工具输出中提取没有片段 ID 的结果（small-to-big 条文块、引用扩展）及紧凑格式中各结果所属的条文，
+    格式为 "law_index:article_index"。
+    """
+    if isinstance(tool_output, list):
+        texts = [part.get("text", "") if isinstance(part, dict) else str(part) for part in tool_output]
+    else:
+        texts = [str(tool_output)]
+
+    refs = []
+
+    def collect(node, law_index=None):
+        if isinstance(node, dict):
+            if "page_content" in node:
+                meta = node.get("metadata") or {}
+                if not node.get("id") and meta.get("law_index") is not None:
+                    refs.append(f"{meta['law_index']}:{meta.get('article_index')}")
+                return
+            # 紧凑格式按条文合并结果，同一条文下可能混有无 ID 的条文块，整条条文都按哈希校验
+            if "article_index" in node and "text" in node and law_index is not None:
+                refs.append(f"{law_index}:{node['article_index']}")
+            law_index = node.get("law_index", law_index)
+            for value in node.values():
+                if isinstance(value, (dict, list)):
+                    collect(value, law_index)
+        elif isinstance(node, list):
+            for item in node:
+                collect(item, law_index)
+
+    for text in texts:
+        try:
+            collect(json.loads(text))
+        except (json.JSONDecodeError, TypeError):
+            continue
+    return refs
@@ -0,0 +1,146 @@
+import json
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from langchain_core.messages import BaseMessage, AIMessage, ToolMessage
+from utils.tokens import estimate_tokens
+
+# 返回法律片段、可以压缩为引用的工具
+COMPACTABLE_TOOLS = {"search_law_articles", "search_law_articles_batch", "get_law_chunks"}
+
+COMPACTED_MARK = "[已压缩]"
+
+
+def _text_parts(content) -> List[str]:
+    if isinstance(content, list):
+        return [part.get("text", "") if isinstance(part, dict) else str(part) for part in content]
+    return [str(content)]
+
+
+def _snippet(lines: List[str], limit: int) -> str:
+    text = " ".join(line.strip() for line in lines if line.strip())
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+def iter_chunk_refs(node, summary_chars: int = 100) -> Iterator[Tuple[str, str, str]]:
+    """
+    从工具输出（Document 列表或 compact_results 的紧凑 JSON）中逐个取出 (引用, 条文标题, 摘要)。
+    引用优先使用片段 ID；没有 ID 的条文块（small-to-big）使用 "law_index:article_index"。
+    """
+    if isinstance(node, list):
+        for item in node:
+            yield from iter_chunk_refs(item, summary_chars)
+        return
+    if not isinstance(node, dict):
+        return
+
+    if "page_content" in node:
+        meta = node.get("metadata") or {}
+        lines = node["page_content"].split("\n")
+        title, body = (lines[2], lines[3:]) if len(lines) > 3 else ("", lines)
+        ref = node.get("id") or f"{meta.get('law_index')}:{meta.get('article_index')}"
+        yield ref, title or f"Статья {meta.get('article_index')}", _snippet(body, summary_chars)
+    elif "laws" in node:
+        for law in node["laws"]:
+            for article in law.get("articles", []):
+                refs = article.get("ids") or [f"{law.get('law_index')}:{article.get('article_index')}"]
+                # 每个引用单独一行，get_law_chunks 按引用逐个匹配；同一条文的摘要只出现在第一行
+                snippet = _snippet(article.get("text", []), summary_chars)
+                for i, ref in enumerate(refs):
+                    yield ref, article.get("article", ""), snippet if i == 0 else ""
+    else:
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                yield from iter_chunk_refs(value, summary_chars)
+
+
+def summarize_observation(message: ToolMessage, summary_chars: int = 100) -> Optional[str]:
+    """
+    把已使用过的检索结果替换为紧凑引用：每个片段一行 "引用 | 条文标题 | 摘要"。无法解析时返回 None（保留原文）。
+    """
+    entries = []
+    for text in _text_parts(message.content):
+        try:
+            entries.extend(iter_chunk_refs(json.loads(text), summary_chars))
+        except (json.JSONDecodeError, TypeError):
+            continue
+    if not entries:
+        return None
+    lines = [
+        f"{COMPACTED_MARK} {message.name} 的结果已压缩为 {len(entries)} 条引用；"
+        f"需要引用原文时调用 get_law_chunks(ids=[...])，传入下列引用即可取回全文："
+    ]
+    lines.extend(f"- {ref} | {title} | {snippet}" if snippet else f"- {ref} | {title}" for ref, title, snippet in entries)
+    return "\n".join(lines)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    tokens = sum(estimate_tokens(text) for text in _text_parts(message.content))
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(json.dumps(call.get("args", {}), ensure_ascii=False))
+    return tokens
+
+
+class ContextManager:
+    """
+    Agent 的上下文管理，作为 create_react_agent 的 pre_model_hook 在每次调用模型前执行：
+    - 检索结果被模型使用过（其后已有模型回复）且相隔超过 keep_recent_turns 轮时，替换为片段引用与摘要；
+    - 输入仍超过 token_budget 时，按从旧到新的顺序继续压缩已使用过的检索结果；
+    - 尚未被模型看到的结果与对话、工具调用本身不做改动；
+    - 只修改发送给模型的消息（llm_input_messages），图状态中的消息保持完整。
+    """
+
+    def __init__(self, token_budget: int = 12000, keep_recent_turns: int = 1, summary_chars: int = 100, max_cached: int = 10000):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summary_chars = summary_chars
+        self.max_cached = max_cached
+        # 消息 ID -> 压缩后的文本（None 表示无法压缩），同一条消息在后续每轮中只解析一次
+        self._summaries: Dict[str, Optional[str]] = {}
+        self.counters = {"turns": 0, "compacted": 0, "tokens_before": 0, "tokens_after": 0}
+
+    def _summary(self, message: ToolMessage) -> Optional[str]:
+        key = message.id or message.tool_call_id
+        if key not in self._summaries:
+            if len(self._summaries) >= self.max_cached:
+                self._summaries.clear()
+            self._summaries[key] = summarize_observation(message, self.summary_chars)
+        return self._summaries[key]
+
+    def compact(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        # 每条工具结果之后的模型回复数，>= 1 表示模型已经看过该结果
+        turns_after = [0] * len(messages)
+        seen_turns = 0
+        for i in range(len(messages) - 1, -1, -1):
+            turns_after[i] = seen_turns
+            if isinstance(messages[i], AIMessage):
+                seen_turns += 1
+
+        candidates = [
+            i for i, message in enumerate(messages)
+            if isinstance(message, ToolMessage) and message.name in COMPACTABLE_TOOLS
+            and turns_after[i] >= 1 and not str(message.content).startswith(COMPACTED_MARK)
+        ]
+        tokens = [message_tokens(message) for message in messages]
+        total = sum(tokens)
+        self.counters["turns"] += 1
+        self.counters["tokens_before"] += total
+
+        result = list(messages)
+        for i in candidates:
+            if turns_after[i] <= self.keep_recent_turns and (not self.token_budget or total <= self.token_budget):
+                continue
+            summary = self._summary(messages[i])
+            if summary is None:
+                continue
+            result[i] = messages[i].model_copy(update={"content": summary})
+            total += message_tokens(result[i]) - tokens[i]
+            self.counters["compacted"] += 1
+
+        self.counters["tokens_after"] += total
+        return result
+
+    def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        return {"llm_input_messages": self.compact(state["messages"])}
+
+    def stats(self) -> Dict[str, Any]:
+        saved = self.counters["tokens_before"] - self.counters["tokens_after"]
+        return {**self.counters, "tokens_saved": saved}
@@ -3,12 +3,15 @@ import sys
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
-from langchain_openai import ChatOpenAI
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.prebuilt import create_react_agent
 from langchain.prompts import ChatPromptTemplate
 import asyncio
 from agents.prompts import lawyer_prompt
+from utils.llm_client import get_llm
+from agents.answer_cache import SemanticAnswerCache, extract_chunk_ids, extract_article_refs
+from agents.tool_runtime import ToolCallRuntime, current_runtime, wrap_tools
+from agents.context_manager import ContextManager
 import argparse
 
 # --- 解析参数 ---
@@ -19,32 +22,122 @@ def get_args():
         action="store_true",
         help="Show tool calling and observation content (default: False)"
     )
+    parser.add_argument(
+        "--question",
+        type=str,
+        default="РВПО换ВНЖ文件列表？",
+        help="Question to ask the lawyer agent"
+    )
+    parser.add_argument(
+        "--mcp_url",
+        type=str,
+        default="http://127.0.0.1:8000/sse",
+        help="SSE endpoint of the law MCP server (default: http://127.0.0.1:8000/sse)"
+    )
+    parser.add_argument(
+        "--answer_cache",
+        type=str,
+        default=None,
+        help="Path of the semantic answer cache file, e.g. data/cache/answer_cache.json (default: disabled)"
+    )
+    parser.add_argument(
+        "--cache_threshold",
+        type=float,
+        default=0.95,
+        help="Minimum cosine similarity between questions for a cache hit (default: 0.95)"
+    )
+    parser.add_argument(
+        "--chroma_dir",
+        type=str,
+        default="data/chroma",
+        help="ChromaDB directory used to check that cached answers still match the index (default: data/chroma)"
+    )
+    parser.add_argument(
+        "--law_collection_name",
+        type=str,
+        default="law_articles",
+        help="ChromaDB collection of law articles (default: law_articles)"
+    )
+    parser.add_argument(
+        "--laws_dir",
+        type=str,
+        default="data/processed/laws",
+        help="Directory of processed law articles, used to check that cached answers built from whole articles are still current (default: data/processed/laws)"
+    )
+    parser.add_argument(
+        "--context_budget",
+        type=int,
+        default=12000,
+        help="Token budget for the messages sent to the LLM each turn; used search results are compacted into chunk references beyond it, 0 disables compaction (default: 12000)"
+    )
+    parser.add_argument(
+        "--keep_recent_turns",
+        type=int,
+        default=1,
+        help="Search results used within this many recent LLM turns keep their full text unless the budget is exceeded (default: 1)"
+    )
     return parser.parse_args()
 
 
-async def main():
-    args = get_args()
+def get_answer_cache(args):
+    from chromadb import PersistentClient
+    from utils.corpus_artifact import load_article_hashes
+    from langchain_huggingface.embeddings.huggingface import HuggingFaceEmbeddings
+
+    # 与索引使用同一个 RoSBERTa 模型对问题编码
+    embedding = HuggingFaceEmbeddings(
+        model_name="ai-forever/ru-en-RoSBERTa",
+        model_kwargs={'device': 'cuda'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+    collection = PersistentClient(path=args.chroma_dir).get_collection(args.law_collection_name)
+
+    def chunk_exists(chunk_ids):
+        return set(collection.get(ids=chunk_ids, include=[])["ids"])
 
+    hashes = {}
+
+    def article_hashes():
+        # 每次运行只读取一次条文哈希
+        if not hashes:
+            hashes.update(load_article_hashes(args.laws_dir))
+        return hashes
+
+    return SemanticAnswerCache(
+        args.answer_cache,
+        embedding,
+        threshold=args.cache_threshold,
+        chunk_exists=chunk_exists,
+        article_hashes=article_hashes
+    )
+
+
+def get_mcp_client(mcp_url="http://127.0.0.1:8000/sse"):
     # 连接到部署在 127.0.0.1:8000/sse 的 MCP 工具
-    client = MultiServerMCPClient(
+    return MultiServerMCPClient(
         {
             "law": {
-                "url": "http://127.0.0.1:8000/sse",
+                "url": mcp_url,
                 "transport": "sse",
             }
         }
     )
 
-    llm = ChatOpenAI(
+
+def get_context_manager(args):
+    if not args.context_budget:
+        return None
+    return ContextManager(token_budget=args.context_budget, keep_recent_turns=args.keep_recent_turns)
+
+
+def build_agent(tools, context_manager: ContextManager = None):
+    llm = get_llm(
         model=os.getenv("STD_MIGRATION_MODEL_AGENT"),
         api_key=os.getenv("STD_MIGRATION_API_KEY_AGENT"),
         base_url=os.getenv("STD_MIGRATION_URL_AGENT"),
         temperature=0
     )
 
-    # 获取 MCP 工具列表
-    tools = await client.get_tools()
-
     prompt = ChatPromptTemplate.from_messages([
         ("system", lawyer_prompt),
         ("placeholder", "{chat_history}"),
@@ -52,35 +145,100 @@ async def main():
         ("placeholder", "{agent_scratchpad}"),
     ])
 
-    # 使用 ReAct 风格创建 LangGraph Agent
-    agent = create_react_agent(llm, tools, prompt=prompt)
+    # 工具调用经过会话级运行时（去重与记忆化）；允许模型在同一轮中发出多个互不依赖的工具调用，
+    # ToolNode 在异步模式下会并发执行同一轮中的所有调用
+    tools = wrap_tools(tools)
+    model = llm.bind_tools(tools, parallel_tool_calls=True)
 
-    # 流式调用 Agent
-    async for event in agent.astream_events(
-        {"messages": "РВПО换ВНЖ文件列表？"},
-        version="v1"
-    ):
+    # 使用 ReAct 风格创建 LangGraph Agent；上下文管理在每次调用模型前压缩已使用过的检索结果
+    return create_react_agent(model, tools, prompt=prompt, pre_model_hook=context_manager)
 
-        etype = event["event"]
 
-        # 工具调用开始
-        if etype == "on_tool_start":
-            if args.verbose:
-                print(f"\n[Action]: 调用工具 {event['name']}，参数={event['data']}")
+async def run_agent(agent, question, verbose=False, stream_output=True):
+    """
+    流式运行一次 Agent。
 
-        # 工具返回结果
-        elif etype == "on_tool_end":
-            if args.verbose:
+    Returns:
+        Dict: {"report": 最终报告, "chunk_ids": 检索到的法律片段 ID, "article_refs": 无片段 ID 的结果所属条文, "tool_calls": 工具调用时间线}
+    """
+    report = ""
+    chunk_ids = []
+    article_refs = []
+
+    # 每个会话使用独立的工具运行时，会话内相同的工具调用只执行一次
+    runtime = ToolCallRuntime()
+    token = current_runtime.set(runtime)
+
+    try:
+        async for event in agent.astream_events(
+            {"messages": question},
+            version="v1"
+        ):
+
+            etype = event["event"]
+
+            # 每轮模型调用开始时重置缓冲，最后一轮的输出即最终报告
+            if etype == "on_chat_model_start":
+                report = ""
+
+            # 工具调用开始
+            elif etype == "on_tool_start":
+                if verbose:
+                    print(f"\n[Action]: 调用工具 {event['name']}，参数={event['data']}")
+
+            # 工具返回结果
+            elif etype == "on_tool_end":
                 output = event["data"]["output"]
-                if len(output.content) > 200:
-                    output.content = output.content[:150] + " … " + output.content[-50:]
-                print(f"[Observation]: 工具 {event['name']} 返回 -> {output}")
-
-        # 模型输出 token
-        elif etype == "on_chat_model_stream":
-            delta = event["data"]["chunk"].content
-            if delta:
-                print(delta, end="", flush=True)
+                if event["name"] in ("search_law_articles", "search_law_articles_batch", "get_law_chunks"):
+                    chunk_ids.extend(extract_chunk_ids(output.content))
+                    article_refs.extend(extract_article_refs(output.content))
+                if verbose:
+                    if len(output.content) > 200:
+                        output.content = output.content[:150] + " … " + output.content[-50:]
+                    print(f"[Observation]: 工具 {event['name']} 返回 -> {output}")
+
+            # 模型输出 token
+            elif etype == "on_chat_model_stream":
+                delta = event["data"]["chunk"].content
+                if delta:
+                    report += delta
+                    if stream_output:
+                        print(delta, end="", flush=True)
+    finally:
+        current_runtime.reset(token)
+
+    if verbose and runtime.timeline:
+        print(f"\n[Timeline]: 工具调用时间线\n{runtime.format_timeline()}")
+
+    return {"report": report, "chunk_ids": chunk_ids, "article_refs": article_refs, "tool_calls": runtime.timeline}
+
+
+async def main():
+    args = get_args()
+
+    question = args.question
+
+    answer_cache = get_answer_cache(args) if args.answer_cache else None
+    if answer_cache is not None:
+        cached = answer_cache.lookup(question)
+        if cached is not None:
+            if args.verbose:
+                print(f"[Cache]: 命中缓存问题 \"{cached['question']}\"，相似度 {cached['similarity']:.3f}")
+            print(cached["report"])
+            return
+
+    client = get_mcp_client(args.mcp_url)
+
+    # 获取 MCP 工具列表
+    tools = await client.get_tools()
+    agent = build_agent(tools, get_context_manager(args))
+
+    # 流式调用 Agent
+    result = await run_agent(agent, question, verbose=args.verbose)
+
+    if answer_cache is not None and result["report"]:
+        if not answer_cache.store(question, result["report"], result["chunk_ids"], result["article_refs"]) and args.verbose:
+            print("\n[Cache]: 报告的依据无法校验，未写入缓存")
 
 
 if __name__ == "__main__":
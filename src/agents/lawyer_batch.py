@@ -0,0 +1,211 @@
+import os
+import sys
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+import json
+import time
+import random
+import asyncio
+import argparse
+from agents.lawyer_agent import get_mcp_client, get_context_manager, build_agent, run_agent
+
+# --- 解析参数 ---
+def get_args():
+    parser = argparse.ArgumentParser(description="Run the lawyer agent over a queue of questions")
+    parser.add_argument(
+        "--input",
+        type=str,
+        default="-",
+        help="JSONL file with one {\"id\", \"question\"} object per line, '-' reads from stdin (default: -)"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="JSONL file for reports, timings and tool-call traces; also serves as the resume checkpoint"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of agent sessions running at once (default: 4)"
+    )
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=3,
+        help="Retries per question after the first failure (default: 3)"
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        default=2.0,
+        help="Base delay in seconds for exponential backoff between retries (default: 2.0)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=600.0,
+        help="Timeout in seconds for a single agent session (default: 600)"
+    )
+    parser.add_argument(
+        "--mcp_url",
+        type=str,
+        default="http://127.0.0.1:8000/sse",
+        help="SSE endpoint of the law MCP server (default: http://127.0.0.1:8000/sse)"
+    )
+    parser.add_argument(
+        "--context_budget",
+        type=int,
+        default=12000,
+        help="Token budget for the messages sent to the LLM each turn; used search results are compacted into chunk references beyond it, 0 disables compaction (default: 12000)"
+    )
+    parser.add_argument(
+        "--keep_recent_turns",
+        type=int,
+        default=1,
+        help="Search results used within this many recent LLM turns keep their full text unless the budget is exceeded (default: 1)"
+    )
+    return parser.parse_args()
+
+
+def read_questions(path):
+    """
+    读取问题队列。每行为 {"id": ..., "question": ...}，缺少 id 时使用行号；纯文本行视为问题本身。
+    """
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    questions = []
+    try:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = line
+            if isinstance(item, str):
+                item = {"question": item}
+            if not isinstance(item, dict) or not isinstance(item.get("question"), str):
+                print(f"⚠️ Skipping line {line_no}: expected a question or an object with a \"question\" string", file=sys.stderr)
+                continue
+            item.setdefault("id", str(line_no))
+            questions.append(item)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return questions
+
+
+def truncate_partial_line(path):
+    """
+    截掉输出文件末尾未写完的半行（上次运行在写入时被中断），续跑追加的记录不会接在半行后面。
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        # 从末尾按块向前查找最后一个换行符
+        while end > 0:
+            block_start = max(0, end - 65536)
+            f.seek(block_start)
+            newline = f.read(end - block_start).rfind(b"\n")
+            if newline >= 0:
+                end = block_start + newline + 1
+                break
+            end = block_start
+        if end < size:
+            f.truncate(end)
+            print(f"⚠️ Removed an incomplete record at the end of {path}", file=sys.stderr)
+
+
+def load_checkpoint(path):
+    """
+    返回输出文件中已成功完成的问题 id，用于中断后续跑。
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断时可能留下半行
+                continue
+            if record.get("status") == "ok":
+                done.add(str(record["id"]))
+    return done
+
+
+async def run_one(agent, item, args, semaphore, write_record):
+    start = time.perf_counter()
+    attempts = 0
+    error = None
+    result = None
+    while attempts <= args.max_retries:
+        attempts += 1
+        # 只在执行会话时占用并发名额，退避等待期间让给其他问题
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(
+                    run_agent(agent, item["question"], stream_output=False),
+                    timeout=args.timeout
+                )
+                error = None
+                break
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+        if attempts <= args.max_retries:
+            # 指数退避 + 抖动，避免所有会话同时重试
+            await asyncio.sleep(args.backoff * 2 ** (attempts - 1) * (1 + random.random()))
+
+    record = {
+        "id": item["id"],
+        "question": item["question"],
+        "status": "ok" if error is None else "error",
+        "attempts": attempts,
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+    if error is None:
+        record.update(result)
+    else:
+        record["error"] = error
+    await write_record(record)
+    print(f"[{record['status']}] {item['id']} ({record['elapsed']}s, {attempts} attempt(s))", file=sys.stderr)
+
+
+async def main():
+    args = get_args()
+
+    questions = read_questions(args.input)
+    done = load_checkpoint(args.output)
+    pending = [q for q in questions if str(q["id"]) not in done]
+    print(f"共 {len(questions)} 个问题，已完成 {len(questions) - len(pending)} 个，待处理 {len(pending)} 个", file=sys.stderr)
+    if not pending:
+        return
+
+    # 所有会话共享同一个 MCP 客户端与 Agent 图
+    client = get_mcp_client(args.mcp_url)
+    tools = await client.get_tools()
+    agent = build_agent(tools, get_context_manager(args))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    write_lock = asyncio.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    truncate_partial_line(args.output)
+
+    with open(args.output, "a", encoding="utf-8") as out:
+        async def write_record(record):
+            async with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+
+        await asyncio.gather(*(run_one(agent, item, args, semaphore, write_record) for item in pending))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -24,11 +24,18 @@ lawyer_prompt = """
   用于检索相关法律条文。在以下场景必须使用：  
   1. 用户问题宽泛（如“как можно упростить получение ВНЖ”），需要尽可能全面列举相关法律路径。  
   2. 用户的个人情况涉及多种可能的法律结果，需要展开论证。 
+- **search_law_articles_batch(queries, n_results)**  
+  一次完成多个互不依赖的检索（如分别针对 РВП、ВНЖ、гражданство 等法律路径），开销约等于一次 `search_law_articles`。  
+  `results` 中每个查询给出按相关度排序的引用，`union` 中是去重后的条文全文。需要检索两个及以上的路径时优先使用。
+- **get_law_chunks(ids)**  
+  早先的检索结果在对话中会被压缩为以 "[已压缩]" 开头的引用列表（每行 "引用 | 条文标题 | 摘要"）。  
+  需要逐字引用或核对其中某些条文的原文时，用这些引用调用此工具取回全文，不要为此重新调用 `search_law_articles`；只需摘要即可判断时无需调用。  
 
 - **策略应用**  
   1. **文件办理类问题** → 判断输入查询是否具体可靠 + 视情况调用 `rewrite_query_for_law_search` + `doc_list_matcher`（列表检索）。  
   2. **宽泛/个人情况类问题** → 判断输入查询是否具体可靠 + 视情况调用 `rewrite_query_for_law_search` + `search_law_articles`（全面检索）。  
   3. **结合场景** → 若用户的问题既涉及法律路径又涉及具体申请文件，应结合策略 1 与 2：先通过 `search_law_articles` 说明所有可能途径，再调用 `doc_list_matcher` 给出所需材料清单。  
+  4. **并行调用** → 互不依赖的工具调用应在同一轮中一次性发出，不要逐个等待结果；针对 РВП、ВНЖ、гражданство 等多个法律路径的检索合并为一次 `search_law_articles_batch` 调用；同一会话中不要重复相同参数的调用。  
 
 报告结构（输出格式必须统一为正式意见书风格）：
 1. **概要**（结论摘要）  
@@ -0,0 +1,80 @@
+import json
+import time
+import asyncio
+import contextvars
+from typing import List, Dict, Any, Optional
+from langchain_core.tools import BaseTool, StructuredTool
+
+# 当前会话的工具运行时；Agent 图在多个会话间共享，缓存与时间线必须按会话隔离
+current_runtime: contextvars.ContextVar[Optional["ToolCallRuntime"]] = contextvars.ContextVar(
+    "tool_call_runtime", default=None
+)
+
+
+class ToolCallRuntime:
+    """
+    单个会话内的工具调用运行时：
+    - 相同工具、相同参数的调用只执行一次，并发的重复调用共享同一个进行中的任务；
+    - 记录每次调用的起止时间，用于展示调用时间线。
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.results: Dict[tuple, asyncio.Task] = {}
+        self.timeline: List[Dict[str, Any]] = []
+
+    def _now(self) -> float:
+        return round(time.perf_counter() - self.start_time, 3)
+
+    async def call(self, tool: BaseTool, kwargs: Dict[str, Any]):
+        key = (tool.name, json.dumps(kwargs, ensure_ascii=False, sort_keys=True, default=str))
+        entry = {"tool": tool.name, "input": kwargs, "start": self._now(), "cached": key in self.results}
+
+        task = self.results.get(key)
+        if task is None:
+            task = asyncio.ensure_future(tool.coroutine(**kwargs))
+            self.results[key] = task
+        try:
+            # shield：某个调用方被取消时不影响其他共享该任务的调用方
+            return await asyncio.shield(task)
+        except Exception:
+            # 失败的调用不缓存，允许 Agent 重试
+            if self.results.get(key) is task:
+                del self.results[key]
+            raise
+        finally:
+            entry["end"] = self._now()
+            self.timeline.append(entry)
+
+    def format_timeline(self) -> str:
+        lines = []
+        for entry in sorted(self.timeline, key=lambda e: e["start"]):
+            tag = " (缓存)" if entry["cached"] else ""
+            lines.append(f"  {entry['start']:>8.3f}s → {entry['end']:>8.3f}s  {entry['tool']}{tag}")
+        return "\n".join(lines)
+
+
+def wrap_tools(tools: List[BaseTool]) -> List[BaseTool]:
+    """
+    包装 MCP 工具，使其调用经过当前会话的 ToolCallRuntime。
+    未设置运行时（例如单独调用工具）时直接执行原工具。
+    """
+    wrapped = []
+    for tool in tools:
+        def make_coroutine(tool):
+            async def coroutine(**kwargs):
+                runtime = current_runtime.get()
+                if runtime is None:
+                    return await tool.coroutine(**kwargs)
+                return await runtime.call(tool, kwargs)
+            return coroutine
+
+        wrapped.append(StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=make_coroutine(tool),
+            response_format=tool.response_format,
+            metadata=tool.metadata,
+        ))
+    return wrapped
@@ -1,17 +1,13 @@
-import os
-from langchain_openai import ChatOpenAI
+from contextlib import aclosing
+from utils.llm_client import get_llm
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage
 from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import JsonOutputParser
-from utils.process_query import preprocess_data
-
-def get_rewrite_chain(rewrite_prompt: str):
-    rewrite_llm = ChatOpenAI(
-        model=os.getenv("STD_MIGRATION_MODEL"),
-        api_key=os.getenv("STD_MIGRATION_API_KEY"),
-        base_url=os.getenv("STD_MIGRATION_URL"),
-        temperature=0
-    )
+from utils.process_query import preprocess_data, expand_abbreviations
+
+def get_rewrite_chain(rewrite_prompt: str, rewrite_gate=None):
+    rewrite_llm = get_llm()
     # 使用 ChatPromptTemplate 构建可复用的提示词
     rewrite_prompt_template = ChatPromptTemplate.from_messages(
         [
@@ -20,15 +16,21 @@ def get_rewrite_chain(rewrite_prompt: str):
         ]
     )
     rewrite_chain = RunnableLambda(preprocess_data) | rewrite_prompt_template | rewrite_llm
-    return rewrite_chain
+    if rewrite_gate is None:
+        return rewrite_chain
+
+    def route(inputs: dict):
+        # 查询已经是规范的俄语法律表述时，直接返回规范化结果，省去一次 LLM 调用
+        user_query = inputs["user_query"]
+        _, n_expanded = expand_abbreviations(user_query)
+        if rewrite_gate.needs_rewrite(user_query, n_expanded):
+            return rewrite_chain
+        return AIMessage(content=" ".join(user_query.split()))
+
+    return RunnableLambda(route)
 
 def get_doc_list_chain(doc_list_prompt: str, doc_lists: dict):
-    llm = ChatOpenAI(
-        model=os.getenv("STD_MIGRATION_MODEL"),
-        api_key=os.getenv("STD_MIGRATION_API_KEY"),
-        base_url=os.getenv("STD_MIGRATION_URL"),
-        temperature=0
-    )
+    llm = get_llm()
 
     prompt_template = ChatPromptTemplate.from_messages(
         [
@@ -49,3 +51,60 @@ def get_doc_list_chain(doc_list_prompt: str, doc_lists: dict):
     doc_list_chain = candidate_selector | prompt_template | llm | JsonOutputParser()
 
     return doc_list_chain
+
+
+async def astream_rewrite(rewrite_chain, inputs: dict) -> str:
+    """
+    流式执行改写链。改写结果只应是一行查询语句，收到第一行完整内容后立即停止生成，
+    丢弃模型偶尔附带的解释性文字。
+    """
+    content = ""
+    # aclosing：提前返回时立即关闭底层流，取消剩余的生成
+    async with aclosing(rewrite_chain.astream(inputs)) as stream:
+        async for chunk in stream:
+            content += chunk.content
+            first_line, sep, _ = content.strip().partition("\n")
+            if sep and first_line.strip():
+                return first_line.strip()
+    return content.strip()
+
+
+async def astream_doc_list_selection(doc_list_chain, inputs: dict, wait_for_reason: bool = False) -> dict:
+    """
+    流式执行文件清单匹配链，增量解析 JSON。
+
+    提示词要求 "selected_id" 作为第一个字段输出；仅当它确实是第一个字段且后续字段已开始出现时，
+    selected_id 才已完整，此时立即返回（并停止生成）。模型未按顺序输出时，流中的数字可能只是前缀
+    （如 "12" 中的 "1"），此时读完整个流。wait_for_reason=True 时总是等待完整的 reason。
+    """
+    response = {}
+    async with aclosing(doc_list_chain.astream(inputs)) as stream:
+        async for partial in stream:
+            response = partial
+            if wait_for_reason or not isinstance(partial, dict) or len(partial) < 2:
+                continue
+            if next(iter(partial)) == "selected_id" and isinstance(partial["selected_id"], int):
+                break
+    return response
+
+
+def get_local_doc_list_selector(score_pairs, doc_lists: dict, margin: float = 1.0):
+    """
+    本地文件清单匹配：用 cross-encoder 对 (查询, 候选描述) 打分，取得分最高的候选。
+
+    返回与 LLM 链相同结构的 {"selected_id", "reason"}，另附 "confident"：
+    最高分与次高分的差不小于 margin 时为 True，否则应交给远程 LLM 判断。
+    """
+    def select(inputs: dict) -> dict:
+        candidates = doc_lists.get(inputs["doc_type"], [])
+        scores = score_pairs([(inputs["user_query"], doc["text"]) for doc in candidates])
+        ranked = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
+        best, best_score = ranked[0]
+        gap = best_score - ranked[1][1] if len(ranked) > 1 else float("inf")
+        return {
+            "selected_id": best["id"],
+            "reason": f"Выбрано локальной моделью ранжирования (отрыв от следующего варианта: {gap:.2f})",
+            "confident": gap >= margin,
+        }
+
+    return select
@@ -0,0 +1,105 @@
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Any
+from utils.retriever import morph
+from utils.corpus_artifact import load_articles
+
+WORD_PATTERN = re.compile(r"[а-яА-ЯёЁ]+")
+
+
+@lru_cache(maxsize=200000)
+def _lemma(word: str) -> str:
+    parsed = morph.parse(word)
+    return parsed[0].normal_form if parsed else word
+
+
+def lemmas(text: str):
+    return [_lemma(word) for word in WORD_PATTERN.findall(text.lower())]
+
+
+def build_corpus_vocabulary(laws_dir: str) -> set:
+    """
+    从 laws_dir 的条文（列式语料库或 articles/*.json）中收集法律文本的词元（lemma）集合。
+    """
+    words = set()
+    for data in load_articles(laws_dir).values():
+        texts = [data["article_title"], *data.get("unindexed", [])]
+        for clause in data.get("clauses", []):
+            texts.append(clause["clause_text"])
+            texts.extend(clause.get("unindexed", []))
+            for subclause in clause.get("subclauses", []):
+                texts.append(subclause["subclause_text"])
+                texts.extend(subclause.get("unindexed", []))
+        for text in texts:
+            words.update(WORD_PATTERN.findall(text.lower()))
+    return {_lemma(word) for word in words}
+
+
+class RewriteGate:
+    """
+    轻量的本地判别器：判断查询在确定性规范化（缩写展开）之后是否仍需要 LLM 改写。
+
+    满足以下全部条件时跳过 LLM，直接返回规范化后的查询：
+    - 字母中西里尔字母占比不低于 min_cyrillic_share（纯俄语）；
+    - 缩写展开器没有替换任何内容（没有缩写或口语词）；
+    - 词数在 [min_words, max_words] 之间；
+    - 查询词元中出现在法律语料词表里的比例不低于 threshold。
+    """
+
+    def __init__(
+        self,
+        vocabulary: set,
+        threshold: float = 0.9,
+        min_cyrillic_share: float = 0.95,
+        min_words: int = 3,
+        max_words: int = 40,
+        history_size: int = 1000,
+    ):
+        self.vocabulary = vocabulary
+        self.threshold = threshold
+        self.min_cyrillic_share = min_cyrillic_share
+        self.min_words = min_words
+        self.max_words = max_words
+        self.skipped = 0
+        self.called = 0
+        # 最近的判定记录，用于离线调整阈值
+        self.history = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def features(self, query: str, n_expanded: int) -> Dict[str, Any]:
+        letters = [ch for ch in query if ch.isalpha()]
+        cyrillic = [ch for ch in letters if "а" <= ch.lower() <= "я" or ch.lower() == "ё"]
+        query_lemmas = lemmas(query)
+        known = sum(1 for lemma in query_lemmas if lemma in self.vocabulary)
+        return {
+            "cyrillic_share": len(cyrillic) / len(letters) if letters else 0.0,
+            "lemma_overlap": known / len(query_lemmas) if query_lemmas else 0.0,
+            "n_expanded": n_expanded,
+            "n_words": len(query.split()),
+        }
+
+    def needs_rewrite(self, query: str, n_expanded: int) -> bool:
+        features = self.features(query, n_expanded)
+        needs_llm = (
+            features["cyrillic_share"] < self.min_cyrillic_share
+            or features["n_expanded"] > 0
+            or not (self.min_words <= features["n_words"] <= self.max_words)
+            or features["lemma_overlap"] < self.threshold
+        )
+        with self._lock:
+            if needs_llm:
+                self.called += 1
+            else:
+                self.skipped += 1
+            self.history.append({"query": query, **features, "needs_rewrite": needs_llm})
+        return needs_llm
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.skipped + self.called
+        return {
+            "skipped": self.skipped,
+            "called": self.called,
+            "skip_rate": self.skipped / total if total else 0.0,
+        }
@@ -1,35 +1,245 @@
+import sys
 import json
 import asyncio
-from playwright.async_api import async_playwright
+import argparse
+import contextlib
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urljoin
+import requests
+import lxml.html
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
-async def extract_links(url):
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+# 浏览器中不需要加载的资源类型
+BLOCKED_RESOURCE_TYPES = {"image", "font", "stylesheet", "media"}
+
+# 一次 evaluate 取出所有链接，避免逐个元素往返
+EXTRACT_ANCHORS_JS = "els => els.map(a => ({text: a.innerText, href: a.getAttribute('href')}))"
+
+# 单页应用的挂载点：静态 HTML 中这些容器为空时，内容需由 JavaScript 渲染
+SPA_ROOT_XPATH = "//div[@id='root' or @id='app' or @id='__next' or @id='__nuxt']"
+
+# 正文中的链接：不在页眉、导航、页脚与侧栏中。单页应用的外壳常常只在这些区域输出静态链接
+CONTENT_ANCHORS_XPATH = (
+    "//a[@href][not(ancestor::header or ancestor::nav or ancestor::footer or ancestor::aside"
+    " or ancestor::*[@role='banner' or @role='navigation' or @role='contentinfo'])]"
+)
+
+
+def normalize_links(anchors: List[Dict[str, Optional[str]]], base_url: str) -> List[Dict[str, str]]:
+    """
+    过滤页内锚点与脚本链接，并将相对地址解析为绝对地址。
+    """
     links = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
-        await page.goto(url, timeout=60000)
-        await page.wait_for_load_state("networkidle")
-
-        anchors = await page.query_selector_all("a")
-        for a in anchors:
-            text = (await a.inner_text()).strip()
-            href = await a.get_attribute("href")
-            if href:
-                if href.startswith("#"):
-                    continue
-                elif href.startswith("/"):
-                    href = page.url.rstrip("/") + href
-                links.append({"text": text, "href": href})
-
-        await browser.close()
+    for anchor in anchors:
+        href = (anchor.get("href") or "").strip()
+        if not href or href.startswith("#") or href.lower().startswith("javascript:"):
+            continue
+        text = " ".join((anchor.get("text") or "").split())
+        links.append({"text": text, "href": urljoin(base_url, href)})
     return links
 
+
+def needs_javascript(tree, links: List[Dict[str, str]], min_links: int = 5, min_content_links: int = 1) -> bool:
+    """
+    判断静态 HTML 是否不完整、需要浏览器渲染：
+    - 链接数量过少；
+    - 正文（页眉、导航、页脚、侧栏之外）中的链接过少，页面只有外壳；
+    - 存在空的单页应用挂载点；
+    - <noscript> 中提示需要启用 JavaScript。
+    """
+    if len(links) < min_links:
+        return True
+    content_anchors = [{"text": a.text_content(), "href": a.get("href")} for a in tree.xpath(CONTENT_ANCHORS_XPATH)]
+    if len(normalize_links(content_anchors, tree.base_url or "")) < min_content_links:
+        return True
+    for root in tree.xpath(SPA_ROOT_XPATH):
+        if not root.text_content().strip():
+            return True
+    noscript = " ".join(node.text_content() for node in tree.xpath("//noscript")).lower()
+    return "javascript" in noscript and len(links) < 2 * min_links
+
+
+def extract_links_static(url: str, session: requests.Session, timeout: float = 30, verify: bool = True):
+    """
+    以普通 HTTP 请求获取页面并用 lxml 解析链接，返回 (links, 是否需要浏览器)。
+    """
+    resp = session.get(url, headers=HEADERS, timeout=timeout, verify=verify)
+    resp.raise_for_status()
+    if "html" not in resp.headers.get("Content-Type", "html"):
+        return [], True
+    tree = lxml.html.fromstring(resp.content, base_url=resp.url)
+    anchors = [{"text": a.text_content(), "href": a.get("href")} for a in tree.xpath("//a[@href]")]
+    links = normalize_links(anchors, resp.url)
+    return links, needs_javascript(tree, links)
+
+
+class BrowserPool:
+    """
+    长期运行的单个 Chromium 实例与一组可复用的浏览器上下文。
+    浏览器在第一次需要时才启动，页面不加载图片、字体、样式表与媒体资源。
+
+    用法：
+        async with BrowserPool(size=4) as pool:
+            links = await extract_links(url, pool=pool)
+    """
+
+    def __init__(self, size: int = 4, ignore_https_errors: bool = False):
+        self.size = size
+        self.ignore_https_errors = ignore_https_errors
+        self._playwright = None
+        self._browser = None
+        self._contexts: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+
+    async def _start(self):
+        async with self._start_lock:
+            if self._browser is not None:
+                return
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            self._contexts = asyncio.Queue()
+            for _ in range(self.size):
+                context = await self._browser.new_context(user_agent=HEADERS["User-Agent"], ignore_https_errors=self.ignore_https_errors)
+                await context.route("**/*", self._block_resources)
+                self._contexts.put_nowait(context)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._browser is not None:
+            await self._browser.close()
+            await self._playwright.stop()
+
+    @staticmethod
+    async def _block_resources(route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        await self._start()
+        context = await self._contexts.get()
+        page = await context.new_page()
+        try:
+            yield page
+        finally:
+            await page.close()
+            await context.clear_cookies()
+            self._contexts.put_nowait(context)
+
+
+async def extract_links_browser(url: str, pool: BrowserPool, timeout: float = 60, idle_timeout: float = 5) -> List[Dict[str, str]]:
+    async with pool.page() as page:
+        await page.goto(url, timeout=timeout * 1000, wait_until="domcontentloaded")
+        # 已屏蔽静态资源，通常很快进入空闲；等待超时也直接读取当前 DOM
+        with contextlib.suppress(PlaywrightTimeoutError):
+            await page.wait_for_load_state("networkidle", timeout=idle_timeout * 1000)
+        anchors = await page.eval_on_selector_all("a[href]", EXTRACT_ANCHORS_JS)
+        return normalize_links(anchors, page.url)
+
+
+async def extract_links(
+    url: str,
+    pool: Optional[BrowserPool] = None,
+    session: Optional[requests.Session] = None,
+    force_browser: bool = False,
+    verify: bool = True,
+) -> List[Dict[str, str]]:
+    """
+    提取页面中的链接 [{"text", "href"}]。先尝试静态 HTML，只有页面确实需要 JavaScript 时才使用浏览器。
+    未传入 pool 时临时启动一个浏览器（批量抓取请使用 extract_links_many 共享浏览器）。
+    """
+    if not force_browser:
+        try:
+            links, dynamic = await asyncio.to_thread(extract_links_static, url, session or requests.Session(), verify=verify)
+            if not dynamic:
+                return links
+        except requests.RequestException:
+            pass
+
+    if pool is not None:
+        return await extract_links_browser(url, pool)
+    async with BrowserPool(size=1, ignore_https_errors=not verify) as own_pool:
+        return await extract_links_browser(url, own_pool)
+
+
+async def extract_links_many(
+    urls: List[str],
+    concurrency: int = 4,
+    force_browser: bool = False,
+    verify: bool = True,
+) -> Tuple[Dict[str, List[Dict[str, str]]], Dict[str, str]]:
+    """
+    批量提取链接：共享一个 HTTP 会话与一个浏览器，浏览器上下文数量即并发上限。
+    返回 ({url: 链接列表}, {url: 错误信息})，单个页面失败不影响其他页面的结果。
+    """
+    session = requests.Session()
+    async with BrowserPool(size=concurrency, ignore_https_errors=not verify) as pool:
+        results = await asyncio.gather(*(
+            extract_links(url, pool=pool, session=session, force_browser=force_browser, verify=verify)
+            for url in urls
+        ), return_exceptions=True)
+    links, errors = {}, {}
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            errors[url] = f"{type(result).__name__}: {result}"
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            links[url] = result
+    return links, errors
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="提取页面中的链接")
+    parser.add_argument(
+        "--urls",
+        type=str,
+        nargs="+",
+        default=["https://mc.mos.ru/info/trp-rp"],
+        help="要提取链接的页面地址，可指定多个 (默认: https://mc.mos.ru/info/trp-rp)"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="data/raw/links.json",
+        help="输出文件；单个页面时为链接列表，多个页面时为 {url: 链接列表} (默认: data/raw/links.json)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="并发页面数，同时也是浏览器上下文数量 (默认: 4)"
+    )
+    parser.add_argument(
+        "--force_browser",
+        action="store_true",
+        help="跳过静态 HTML 解析，总是使用浏览器渲染 (默认: False)"
+    )
+    parser.add_argument(
+        "--insecure",
+        action="store_true",
+        help="不校验 HTTPS 证书 (默认: False)"
+    )
+    return parser.parse_args()
+
+
 async def main():
-    url = "https://mc.mos.ru/info/trp-rp"
-    data = await extract_links(url)
-    with open("data/raw/links.json", "w", encoding="utf-8") as f:
+    args = get_args()
+    results, errors = await extract_links_many(args.urls, args.concurrency, args.force_browser, verify=not args.insecure)
+    for url, error in errors.items():
+        print(f"⚠️ 提取 {url} 的链接失败: {error}", file=sys.stderr)
+    if not results:
+        sys.exit(1)
+    data = results[args.urls[0]] if len(args.urls) == 1 else results
+    with open(args.output, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"已保存 {len(data)} 个链接到 data/raw/links.json")
+    print(f"已保存 {sum(len(links) for links in results.values())} 个链接到 {args.output}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,4 +1,5 @@
 import re
+import sys
 import json
 import os
 import requests
@@ -6,6 +7,9 @@ import datetime
 from bs4 import BeautifulSoup
 from fetch_law_index import fetch_law_index
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.corpus_artifact import write_corpus_artifact
+
 
 def parse_article_document(lines, law_index, law_date, law_title, chapter_index, chapter_title, article_index, article_title):
     result = {
@@ -133,6 +137,9 @@ def fetch_law(index_file, output_dir="articles"):
 def fetch_index_and_law(source_dir, law_name, output_dir="data/processed/laws"):
     law_index = fetch_law_index(source_dir, f"{output_dir}/{law_name}")
     fetch_law(law_index, f"{output_dir}/{law_name}/articles")
+    # 重新生成列式语料库，供建库脚本与服务端一次性内存映射读取
+    manifest = write_corpus_artifact(output_dir)
+    print(f"已生成语料库 {output_dir}/_corpus ，共 {manifest['counts']['articles']} 条条文、{manifest['counts']['chunks']} 个片段")
 
 if __name__ == "__main__":
     SOURCE_DIR = "/document/cons_doc_LAW_11376/"
@@ -4,17 +4,38 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
 import json
+import hmac
+import time
+import asyncio
 import argparse
+import importlib
 from fastmcp import FastMCP
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 from langchain_chroma.vectorstores import Chroma
 from langchain_core.runnables import Runnable
+from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 from langchain.retrievers import EnsembleRetriever
-from chains.lawyer_chain import get_rewrite_chain, get_doc_list_chain
-from utils.retriever import get_self_query_retriever, get_bm25_retriever, get_ensemble_retriever, get_reranking_retriever
-from langchain_huggingface.embeddings.huggingface import HuggingFaceEmbeddings
-from prompts import LAW_RETRIVING_REWRITE_PROMPT, DOC_LIST_MATCHING_PROMPT
+from chains.lawyer_chain import get_rewrite_chain, get_doc_list_chain, get_local_doc_list_selector, astream_rewrite, astream_doc_list_selection
+from chains.rewrite_gate import RewriteGate, build_corpus_vocabulary
+from utils.retriever import get_self_query_retriever, get_bm25_retriever, get_ensemble_retriever, get_reranking_retriever, load_reranker, lemmatize_text
+from utils.small_to_big import load_article_store, get_small_to_big_retriever, merge_hits_by_article, render_article
+from utils.compact_results import dumps_compact, compact_results
+from utils.corpus_store import CorpusStore, CorpusBM25Retriever
+from utils.batch_search import batch_search, doc_key
+from utils.local_query_constructor import LocalQueryConstructor, get_local_first_retriever
+from utils.partitioned_store import PartitionedChroma
+from utils.snapshots import SnapshotRegistry, SnapshotVectorStore, active_snapshot, CURRENT_FILE
+from utils.hot_reload import HotReloader, fresh_chroma_client, stop_chroma_system
+from utils.citation_graph import CitationGraph, DIRECTIONS, expand_with_citations
+from utils.quantized_index import QuantizedVectorStore
+from utils.query_encoder import BACKENDS, get_embedding
+from utils.speculative_cache import SpeculativeCache
+from utils.scatter_gather import ScatterGatherRetriever, similarity_scores, encode_results
+from utils.latency_budget import Deadline, StageCosts, budgeted_search
+from utils.diagnostics import Profiler, MemoryTracer, thread_stacks, torch_memory_stats, process_memory, install_stack_dump_signal
+from utils.llm_client import get_llm_stats
+import prompts
 
 # --- 参数解析 ---
 def get_args():
@@ -37,49 +58,500 @@ def get_args():
         default="required_documents_lists",
         help="ChromaDB 办理文件目录集合名称 (默认: required_documents_lists)"
     )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="使用按法律/章节分区的集合（由 build_chromadb.py --partition_by 生成），过滤条件能确定法律时只检索对应分区 (默认: False)"
+    )
+    parser.add_argument(
+        "--snapshot_root",
+        type=str,
+        default=None,
+        help="版本化快照目录（由 scripts/build_snapshot.py 生成）。设置后从快照的共享存储检索，CURRENT 切换后无需重启即生效，并支持按日期查询历史版本 (默认: 不启用)"
+    )
+    parser.add_argument(
+        "--quantized_index",
+        type=str,
+        default=None,
+        help="量化向量索引目录（由 scripts/build_quantized_index.py 生成）。设置后先在量化向量上粗排，再用内存映射的全精度向量重打分 (默认: 不启用)"
+    )
+    parser.add_argument(
+        "--quantized_mode",
+        type=str,
+        choices=["int8", "binary"],
+        default="int8",
+        help="量化索引的粗排方式：int8 点积或二值汉明距离 (默认: int8)"
+    )
+    parser.add_argument(
+        "--rescore_factor",
+        type=int,
+        default=4,
+        help="粗排保留 k * rescore_factor 个候选用全精度向量重打分 (默认: 4)"
+    )
+    parser.add_argument(
+        "--encoder_backend",
+        type=str,
+        choices=BACKENDS,
+        default="reference",
+        help="查询编码器：reference 为原 HuggingFaceEmbeddings（GPU）；torch/torchscript/onnx 为 CPU 优化后端，输出须先通过 scripts/check_encoder_parity.py 校验 (默认: reference)"
+    )
+    parser.add_argument(
+        "--encoder_quantize",
+        action="store_true",
+        help="对 CPU 编码器做 int8 动态量化 (默认: False)"
+    )
+    parser.add_argument(
+        "--encoder_threads",
+        type=int,
+        default=0,
+        help="CPU 编码器的算子内线程数，0 表示使用全部核心 (默认: 0)"
+    )
     parser.add_argument(
         "--use_reranker",
         action="store_true",
         help='Enable this to use reranker'
     )
+    parser.add_argument(
+        "--small_to_big",
+        action="store_true",
+        help="按款/项粒度检索，再按条文合并命中片段返回 (默认: False)"
+    )
+    parser.add_argument(
+        "--laws_dir",
+        type=str,
+        default="data/processed/laws",
+        help="法律条文目录（articles/*.json 或 _corpus 列式语料库），small-to-big 模式用于重建父级条文 (默认: data/processed/laws)"
+    )
+    parser.add_argument(
+        "--citation_graph",
+        type=str,
+        default=None,
+        help="条文引用图文件（由 scripts/build_citation_graph.py 生成），启用后 search_law_articles 可追加被引用/引用的条文 (默认: 不启用)"
+    )
+    parser.add_argument(
+        "--rewrite_gate_threshold",
+        type=float,
+        default=None,
+        help="启用本地改写判别器：查询词元与法律词表的重合率不低于该值（且无缩写、纯俄语）时跳过 LLM 改写 (默认: 不启用)"
+    )
+    parser.add_argument(
+        "--stream_chains",
+        action="store_true",
+        help="以流式方式执行改写链与文件清单匹配链，得到可用结果后立即返回 (默认: False)"
+    )
+    parser.add_argument(
+        "--query_backend",
+        type=str,
+        choices=["remote", "local_first"],
+        default="remote",
+        help="检索过滤条件的构造方式：remote 总是调用 LLM；local_first 优先用本地规则，置信度不足时才调用 LLM (默认: remote)"
+    )
+    parser.add_argument(
+        "--doc_list_backend",
+        type=str,
+        choices=["remote", "local_first"],
+        default="remote",
+        help="文件清单匹配方式：remote 总是调用 LLM；local_first 优先用本地重排序模型，无法明确区分时才调用 LLM (默认: remote)"
+    )
+    parser.add_argument(
+        "--local_query_threshold",
+        type=float,
+        default=0.8,
+        help="本地查询构造的置信度阈值，低于该值时调用 LLM (默认: 0.8)"
+    )
+    parser.add_argument(
+        "--local_doc_list_margin",
+        type=float,
+        default=1.0,
+        help="本地文件清单匹配中最高分与次高分的最小差值，低于该值时调用 LLM (默认: 1.0)"
+    )
+    parser.add_argument(
+        "--remote_timeout",
+        type=float,
+        default=10.0,
+        help="local_first 模式下远程 LLM 调用的超时秒数，超时或失败时退回本地结果 (默认: 10)"
+    )
+    parser.add_argument(
+        "--batch_lexical_k",
+        type=int,
+        default=10,
+        help="search_law_articles_batch 在启用重排序时为每个查询补充的 BM25 候选数，0 表示只用向量检索的候选 (默认: 10)"
+    )
+    parser.add_argument(
+        "--speculative_prefetch",
+        action="store_true",
+        help="改写工具返回后立即在后台检索改写结果，随后以同一查询调用 search_law_articles 时直接返回缓存结果 (默认: False)"
+    )
+    parser.add_argument(
+        "--speculative_ttl",
+        type=float,
+        default=60.0,
+        help="预取结果的缓存秒数，过期未使用计为浪费 (默认: 60)"
+    )
+    parser.add_argument(
+        "--speculative_workers",
+        type=int,
+        default=2,
+        help="同时执行的预取检索数上限 (默认: 2)"
+    )
+    parser.add_argument(
+        "--speculative_max_pending",
+        type=int,
+        default=4,
+        help="运行与排队中的预取数上限，超过时放弃新的预取 (默认: 4)"
+    )
+    parser.add_argument(
+        "--speculative_n_results",
+        type=int,
+        default=20,
+        help="预取使用的 n_results，只有相同 n_results 的调用才能命中 (默认: 20)"
+    )
+    parser.add_argument(
+        "--retrieval_node",
+        action="store_true",
+        help="检索节点模式：额外提供 POST /search 与 /chunks 接口，用本进程的检索流水线服务一个分片（如 build_chromadb.py --partition_by law 生成的某个法律分区），供 --shard_nodes 的网关调用 (默认: False)"
+    )
+    parser.add_argument(
+        "--shard_nodes",
+        type=str,
+        default=None,
+        help="逗号分隔的检索节点地址（如 http://127.0.0.1:8101,http://127.0.0.1:8102）。设置后 search_law_articles 并行检索全部节点并按得分全局合并，本进程不加载向量库 (默认: 不启用)"
+    )
+    parser.add_argument(
+        "--shard_timeout",
+        type=float,
+        default=2.0,
+        help="每个检索节点的截止秒数，超时的节点被跳过，只合并按时返回的结果 (默认: 2)"
+    )
+    parser.add_argument(
+        "--latency_budget_ms",
+        type=int,
+        default=0,
+        help="search_law_articles 的默认延迟预算（毫秒），调用未指定 latency_budget_ms 时使用；预算将尽时依次跳过或缩短 LLM 过滤条件构造、重排序与 MMR 候选数，0 表示总是执行完整流水线 (默认: 0)"
+    )
+    parser.add_argument(
+        "--hot_reload",
+        action="store_true",
+        help="监视向量库、条文、文件清单与提示词，变化后在后台重建并原子替换，无需重启；也可发送 SIGHUP 触发 (默认: False)"
+    )
+    parser.add_argument(
+        "--reload_interval",
+        type=float,
+        default=2.0,
+        help="热重载的轮询间隔秒数 (默认: 2)"
+    )
+    parser.add_argument(
+        "--admin_diagnostics",
+        action="store_true",
+        help="启用 /admin/* 诊断接口（CPU 采样、tracemalloc 快照、线程栈、torch 显存统计）与 SIGUSR1 线程栈输出，需同时设置 --admin_token (默认: False)"
+    )
+    parser.add_argument(
+        "--admin_token",
+        type=str,
+        default=os.getenv("LAW_MCP_ADMIN_TOKEN"),
+        help="诊断接口的访问令牌，请求需带 Authorization: Bearer <token> (默认: 环境变量 LAW_MCP_ADMIN_TOKEN)"
+    )
     parser.add_argument(
         "--port",
         type=int,
         default=8000,
         help="MCP 服务端口 (默认: 8000)"
     )
-    return parser.parse_known_args()[0]
+    args = parser.parse_known_args()[0]
+    # 量化索引只包装单个 Chroma 集合，快照与分区向量库不经过它
+    if args.quantized_index and (args.snapshot_root or args.partitioned):
+        parser.error("--quantized_index cannot be combined with --snapshot_root or --partitioned")
+    return args
 
 args = get_args()
 
-embedding = HuggingFaceEmbeddings(
-    model_name="ai-forever/ru-en-RoSBERTa",
-    model_kwargs={'device': 'cuda'},
-    encode_kwargs={'normalize_embeddings': True}
-)
+# 网关模式下查询由检索节点编码，本进程不加载编码器
+embedding = get_embedding(args.encoder_backend, quantize=args.encoder_quantize, num_threads=args.encoder_threads) if not args.shard_nodes else None
+
+DOC_LISTS_FILE = "data/processed/list_and_blanks/parsed_doc_lists.json"
+
+snapshot_registry = SnapshotRegistry(args.snapshot_root) if args.snapshot_root else None
 
-law_retriever = get_self_query_retriever(
-    Chroma(
+shard_retriever = ScatterGatherRetriever(
+    [node.strip() for node in args.shard_nodes.split(",") if node.strip()],
+    timeout=args.shard_timeout
+) if args.shard_nodes else None
+
+
+class ServerState:
+    """
+    服务的可重载状态。请求处理函数以 reloader.pinned 装饰，整个请求使用开始时的状态对象；
+    重载时构建新的对象后整体替换，进行中的请求不受影响。模型（embedding、reranker）不属于状态，始终保持加载。
+    """
+    law_vectorstore = None
+    law_retriever = None
+    self_query_retriever = None
+    local_query_constructor = None
+    bm25_retriever = None
+    article_store = None
+    citation_graph = None
+    small_to_big_retriever = None
+    rewrite_gate = None
+    rewrite_chain = None
+    doc_lists = None
+    doc_list_chain = None
+    local_doc_list_selector = None
+    # 向量库使用的 Chroma System，状态被替换且不再使用后停止
+    chroma_systems = ()
+
+
+def load_law_vectorstore():
+    """
+    返回 (向量库, Chroma System)。每次重载使用新的 Chroma 客户端，才能读到其他进程（如 build_chromadb.py）写入的数据。
+    """
+    if snapshot_registry is not None:
+        client, system = fresh_chroma_client(snapshot_registry.persist_directory)
+        return SnapshotVectorStore(
+            Chroma(
+                collection_name=snapshot_registry.current()["collection"],
+                client=client,
+                embedding_function=embedding
+            ),
+            snapshot_registry
+        ), system
+    client, system = fresh_chroma_client(args.chroma_dir)
+    if args.partitioned:
+        return PartitionedChroma(
+            collection_name=args.law_collection_name,
+            persist_directory=args.chroma_dir,
+            embedding_function=embedding,
+            client=client
+        ), system
+    vectorstore = Chroma(
         collection_name=args.law_collection_name,
-        persist_directory=args.chroma_dir,
+        client=client,
         embedding_function=embedding
     )
+    if vectorstore._collection.count() == 0:
+        # 集合正在重建（--overwrite 删除后尚未写入）时不替换
+        stop_chroma_system(system)
+        raise ValueError(f"Collection '{args.law_collection_name}' in {args.chroma_dir} is empty")
+    if args.quantized_index:
+        return QuantizedVectorStore.from_vectorstore(
+            args.quantized_index,
+            vectorstore,
+            embedding,
+            mode=args.quantized_mode,
+            rescore_factor=args.rescore_factor
+        ), system
+    return vectorstore, system
+
+
+def build_state(previous: ServerState, changed: set) -> ServerState:
+    """
+    根据发生变化的数据源重建状态，未受影响的部分沿用 previous。
+    数据源：law_index（向量库）、laws（条文 JSON）、doc_lists（文件清单）、prompts（提示词）。
+    """
+    state = ServerState()
+    if previous is not None:
+        state.__dict__.update(previous.__dict__)
+    else:
+        changed = {"law_index", "laws", "doc_lists", "prompts"}
+
+    if "prompts" in changed and previous is not None:
+        importlib.reload(prompts)
+
+    if "laws" in changed and (args.small_to_big or args.query_backend == "local_first" or args.citation_graph):
+        state.article_store = snapshot_registry.article_store() if snapshot_registry else load_article_store(args.laws_dir)
+
+    if "laws" in changed and args.citation_graph:
+        state.citation_graph = CitationGraph.load(args.citation_graph)
+
+    if changed & {"law_index", "laws"} and shard_retriever is not None:
+        # 网关模式：检索由各节点完成，本进程只负责合并（以及 small-to-big 的条文重建）
+        state.law_vectorstore = state.law_retriever = shard_retriever
+        if args.small_to_big:
+            state.small_to_big_retriever = get_small_to_big_retriever(
+                lambda query, n_results: shard_retriever.search(query, n_results),
+                state.article_store
+            )
+    elif changed & {"law_index", "laws"}:
+        if "law_index" in changed:
+            state.law_vectorstore, system = load_law_vectorstore()
+            state.chroma_systems = (system,) if system is not None else ()
+        law_retriever = state.self_query_retriever = get_self_query_retriever(state.law_vectorstore)
+        state.local_query_constructor = LocalQueryConstructor(state.article_store) if args.query_backend == "local_first" else None
+        # 批量检索的 BM25 候选只在重排序时使用；快照模式下语料随 as_of 变化，不建 BM25 索引
+        state.bm25_retriever = None
+        if args.use_reranker and args.batch_lexical_k > 0 and snapshot_registry is None:
+            state.bm25_retriever = CorpusBM25Retriever.from_store(
+                CorpusStore.from_vectorstore(state.law_vectorstore),
+                preprocess=lambda text: lemmatize_text(text).split(),
+                text="rerank"
+            )
+        if args.query_backend == "local_first":
+            law_retriever = get_local_first_retriever(
+                state.law_vectorstore,
+                law_retriever,
+                state.article_store,
+                threshold=args.local_query_threshold,
+                remote_timeout=args.remote_timeout
+            )
+        if args.use_reranker:
+            law_retriever = get_reranking_retriever(law_retriever)
+        state.law_retriever = law_retriever
+
+        if args.small_to_big:
+            state.small_to_big_retriever = get_small_to_big_retriever(
+                lambda query, n_results: retrieve_law_docs(law_retriever, query, n_results),
+                snapshot_registry.article_store if snapshot_registry else state.article_store
+            )
+
+    if "laws" in changed and args.rewrite_gate_threshold is not None:
+        state.rewrite_gate = RewriteGate(build_corpus_vocabulary(args.laws_dir), threshold=args.rewrite_gate_threshold)
+
+    if changed & {"laws", "prompts"}:
+        state.rewrite_chain = get_rewrite_chain(prompts.LAW_RETRIVING_REWRITE_PROMPT, state.rewrite_gate)
+
+    if changed & {"doc_lists", "prompts"}:
+        with open(DOC_LISTS_FILE, "r") as f:
+            state.doc_lists = json.load(f)
+        state.doc_list_chain = get_doc_list_chain(prompts.DOC_LIST_MATCHING_PROMPT, state.doc_lists)
+        if args.doc_list_backend == "local_first":
+            state.local_doc_list_selector = get_local_doc_list_selector(load_reranker(), state.doc_lists, margin=args.local_doc_list_margin)
+
+    return state
+
+
+def run_law_search(state: ServerState, query: str, n_results: int, token_budget: int):
+    """
+    检索流水线（编码、向量检索、BM25、重排序），快照由 active_snapshot 指定。
+    """
+    if state.small_to_big_retriever is not None:
+        return state.small_to_big_retriever.invoke({
+            "query": query,
+            "n_results": n_results,
+            "token_budget": token_budget
+        })
+    return retrieve_law_docs(state.law_retriever, query, n_results)
+
+
+def run_budgeted_law_search(state: ServerState, query: str, n_results: int, token_budget: int, deadline: Deadline):
+    """
+    带截止时间的检索，返回 (结果, 执行情况)。阶段的取舍见 latency_budget.budgeted_search；
+    网关模式下剩余预算随请求转发给各节点，由节点按预算取舍各阶段；有节点未按时返回或自身降级时结果视为降级。
+    """
+    if shard_retriever is not None:
+        timeout = min(args.shard_timeout, deadline.remaining())
+        docs, shards = shard_retriever.search_budgeted(query, n_results, timeout)
+        report = {
+            "stages": {"scatter_gather": {"timeout_ms": timeout * 1000, **shards}},
+            "degraded": shards["answered"] < shards["nodes"] or shards["degraded_nodes"] > 0,
+        }
+    else:
+        docs, report = budgeted_search(
+            query,
+            n_results,
+            state.law_vectorstore,
+            state.self_query_retriever,
+            deadline,
+            stage_costs,
+            local_constructor=state.local_query_constructor,
+            threshold=args.local_query_threshold,
+            score_pairs=load_reranker() if args.use_reranker else None,
+        )
+    if state.small_to_big_retriever is not None:
+        article_store = snapshot_registry.article_store() if snapshot_registry else state.article_store
+        docs = merge_hits_by_article(docs, article_store, token_budget=token_budget)
+        report["stages"]["small_to_big"] = True
+    return docs, report
+
+
+def law_search_key(state: ServerState, query: str, n_results: int, token_budget: int, manifest=None) -> tuple:
+    # 状态对象在重载时整体替换，以其 id 区分重载前后的结果
+    return id(state), " ".join(query.split()), n_results, token_budget, manifest["snapshot_id"] if manifest else None
+
+
+def speculate_law_search(state: ServerState, query: str):
+    """
+    预取改写后查询的检索结果，参数与 search_law_articles 的默认调用一致（当前快照、无 token 上限）。
+    """
+    manifest = snapshot_registry.current() if snapshot_registry else None
+    n_results = args.speculative_n_results
+
+    # 预取在请求结束后仍可能运行，单独持有状态
+    reloader.hold(state)
+
+    def search():
+        try:
+            active_snapshot.set(manifest)
+            return run_law_search(state, query, n_results, 0)
+        finally:
+            reloader.release(state)
+
+    if not speculative_cache.prefetch(law_search_key(state, query, n_results, 0, manifest), search):
+        reloader.release(state)
+
+
+def retrieve_law_docs(law_retriever, query: str, n_results: int):
+    if isinstance(law_retriever, ScatterGatherRetriever):
+        return law_retriever.search(query, n_results)
+    elif isinstance(law_retriever, EnsembleRetriever):
+        config = {
+            "configurable": {
+                "bm25_k_id": n_results * 2,
+                "selfquery_search_kwargs": {"k": n_results * 2}
+            }
+        }
+        docs = law_retriever.invoke(query, config=config)
+        return docs[:n_results]
+    elif args.use_reranker:
+        # 重排序链 (RunnableParallel | RunnableLambda)，输入为 {"query", "k"}
+        docs = law_retriever.invoke({"query": query, "k": n_results})
+        return docs
+    elif isinstance(law_retriever, (BaseRetriever, Runnable)):
+        # SelfQueryRetriever（configurable_fields 包装后为 Runnable），通过 config 传入 k
+        docs = law_retriever.invoke(query, config={"configurable": {"search_kwargs_id": {"k": n_results}}})
+        return docs[:n_results]
+    else:
+        raise ValueError(f"Unsupported retriever type: {type(law_retriever)}")
+
+
+def retire_state(state: ServerState, live: list):
+    """
+    被替换的状态不再有请求使用时，停止只属于它的 Chroma System（仍在使用的状态共享的 System 保留）。
+    """
+    in_use = {id(system) for other in live for system in other.chroma_systems}
+    for system in state.chroma_systems:
+        if id(system) not in in_use:
+            stop_chroma_system(system)
+
+
+reloader = HotReloader(
+    build_state,
+    {
+        "law_index": [os.path.join(args.snapshot_root, CURRENT_FILE)] if args.snapshot_root else [args.chroma_dir] + ([args.quantized_index] if args.quantized_index else []),
+        "laws": [args.laws_dir] + ([args.citation_graph] if args.citation_graph else []),
+        "doc_lists": [DOC_LISTS_FILE],
+        "prompts": [prompts.__file__],
+    },
+    interval=args.reload_interval,
+    retire=retire_state
 )
+if args.hot_reload:
+    reloader.start()
 
-if args.use_reranker:
-    law_retriever = get_reranking_retriever(law_retriever)
+# 各检索阶段耗时的 EWMA，带延迟预算的请求据此决定执行哪些阶段
+stage_costs = StageCosts()
 
-rewrite_chain = get_rewrite_chain(LAW_RETRIVING_REWRITE_PROMPT)
+speculative_cache = SpeculativeCache(
+    ttl=args.speculative_ttl,
+    max_workers=args.speculative_workers,
+    max_pending=args.speculative_max_pending
+) if args.speculative_prefetch else None
 
-with open("data/processed/list_and_blanks/parsed_doc_lists.json", "r") as f:
-    doc_lists = json.load(f)
-doc_list_chain = get_doc_list_chain(DOC_LIST_MATCHING_PROMPT, doc_lists)
 
 # 创建 MCP 服务
 mcp = FastMCP(name="LawMCPServer")
 
 @mcp.tool()
-def rewrite_query_for_law_search(user_query: str) -> str:
+@reloader.pinned
+async def rewrite_query_for_law_search(user_query: str) -> str:
     """
     这是一个强大的工具，能将用户的口语化或非标准的俄语法律查询，重写为正式、精确的法律检索查询。
 
@@ -93,12 +565,20 @@ def rewrite_query_for_law_search(user_query: str) -> str:
         str: 返回经过重写后的正式俄语法律查询。
         例如："порядок получения вида на жительство"
     """
-    rewritten_content = rewrite_chain.invoke({"user_query": user_query}).content
+    state = reloader.state
+    if args.stream_chains:
+        rewritten_content = await astream_rewrite(state.rewrite_chain, {"user_query": user_query})
+    else:
+        rewritten_content = (await state.rewrite_chain.ainvoke({"user_query": user_query})).content
+    if speculative_cache is not None:
+        # 智能体几乎总是接着用改写结果调用 search_law_articles，利用其思考的间隙提前检索
+        speculate_law_search(state, rewritten_content)
     return rewritten_content
 
 
 @mcp.tool()
-def search_law_articles(query: str, n_results: int = 20) -> List[Dict[str, Any]]:
+@reloader.pinned
+def search_law_articles(query: str, n_results: int = 20, token_budget: int = 0, compact: bool = False, as_of: str = "", expand_citations: str = "", latency_budget_ms: int = 0) -> Union[List[Dict[str, Any]], Dict[str, Any], str]:
     """
     一个强大的法律知识检索工具，结合了向量相似度检索和元数据过滤器。
 
@@ -109,9 +589,23 @@ def search_law_articles(query: str, n_results: int = 20) -> List[Dict[str, Any]]
         n_results (integer, optional): 指定要返回的最相关法律条文数量。默认值为 20。  
 对于主题范围广泛、涉及多个情形或政策介绍类的问题（如“如何办理移民”），应适当增加返回条目的数量，以覆盖更多相关情形，通常建议在 30–50 之间。  
 对于范围较窄、指向明确的具体问题（如“投资移民的最低资金要求”），可保持或减少返回条目的数量，以提高结果的精准度，一般为 10–20 条。
+        token_budget (integer, optional): 返回内容的 token 上限，默认 0 表示不限制。服务端开启按条文合并模式时，
+命中的片段会按所属条文合并为一个条文块（命中部分以 "▶ " 标记），并按相关度从高到低保留，直到达到该上限。
+        compact (boolean, optional): 是否以紧凑 JSON 字符串返回，默认 False。紧凑格式中每部法律、每条条文的标题只出现一次，
+命中的款/项文本按行去重后挂在所属条文下；配合 token_budget 使用时，排名靠后的结果优先被舍弃。
+        as_of (string, optional): 日期 "YYYY-MM-DD"，检索该日期生效的法律版本（如修订前的条文），默认为空表示现行版本。仅在服务端启用版本化快照时有效。
+        expand_citations (string, optional): 沿条文引用关系补充结果，默认为空表示不补充。"cites" 追加排名靠前的结果所引用的条文/款
+（如 "в соответствии со статьей 6 настоящего Федерального закона" 所指的条文），"cited_by" 追加引用了它们的条文，"both" 两者皆有。
+补充的条目 metadata.type 为 "citation"，metadata.cited_from 为来源条文。适合需要查看被引用条件、期限或例外规定的问题，无需再次检索。
+        latency_budget_ms (integer, optional): 本次检索的延迟预算（毫秒），默认 0 表示使用服务端的默认预算（未配置时执行完整流水线）。
+预算将尽时依次放弃 LLM 过滤条件构造（退回普通向量检索）、缩小候选数、只对部分候选重排序或跳过重排序，保证按时返回；
+此时结果可能不如完整流水线精确，可在时间允许时以更大的预算重新检索。
 
     Returns:
-        List[Dict[str, Any]]: 返回一个包含多个字典的列表。每个字典代表一个独立的法律条文，并包含以下关键信息：
+        List[Dict[str, Any]] | Dict[str, Any] | str: 返回一个包含多个字典的列表（compact=True 时为紧凑 JSON 字符串，结构为 {"laws": [{"law", "articles": [{"chapter", "article", "text": [...]}]}], "truncated"}）。
+        有延迟预算时，列表包装为 {"results": [...], "latency": {...}}，紧凑 JSON 中增加 "latency" 字段，
+        latency 为 {"budget_ms", "elapsed_ms", "degraded", "stages"}，stages 记录实际执行的阶段（如 "self_query": "skipped"、"rerank": "partial 30/80"）。
+        每个字典代表一个独立的法律条文，并包含以下关键信息：
             - page_content (string): 法律条文的完整文本内容，已经包含其父级条款（如法律名称、章节、条款标题）作为上下文，以便直接使用。
             - metadata (dict): 一个包含丰富结构化信息的字典，例如法律文件的签发日期，编号，法律条文所属的章节，父条款编号等，可用于进一步分析或显示。
 
@@ -120,29 +614,151 @@ def search_law_articles(query: str, n_results: int = 20) -> List[Dict[str, Any]]
     2. 混合查询: "В статье 8 Федерального закона 115, кто имеет право на получение вида на жительство?"
     3. 纯结构化过滤: "Содержание статьи 8 Федерального закона 'О правовом положении иностранных граждан в Российской Федерации' "
     """
-    if isinstance(law_retriever, EnsembleRetriever):
-        config = {
-            "configurable": {
-                "bm25_k_id": n_results * 2,
-                "selfquery_search_kwargs": {"k": n_results * 2}
-            }
+    if expand_citations and expand_citations not in DIRECTIONS:
+        raise ValueError(f"expand_citations must be one of {', '.join(DIRECTIONS)} or empty, got '{expand_citations}'")
+    # 整个请求固定使用开始时的状态与快照，期间重载或切换 CURRENT 不影响本次结果
+    deadline = Deadline(latency_budget_ms or args.latency_budget_ms)
+    report = None
+    state = reloader.state
+    manifest = snapshot_registry.resolve(as_of) if snapshot_registry else None
+    token = active_snapshot.set(manifest)
+    try:
+        docs = None
+        if speculative_cache is not None:
+            docs = speculative_cache.get(law_search_key(state, query, n_results, token_budget, manifest))
+            if docs is not None and deadline.budget is not None:
+                report = {"stages": {"speculative": "hit"}, "degraded": False}
+        if docs is None and deadline.budget is not None:
+            docs, report = run_budgeted_law_search(state, query, n_results, token_budget, deadline)
+        elif docs is None:
+            docs = run_law_search(state, query, n_results, token_budget)
+        if expand_citations and state.citation_graph is not None:
+            article_store = snapshot_registry.article_store() if snapshot_registry else state.article_store
+            docs = expand_with_citations(docs, state.citation_graph, article_store, direction=expand_citations)
+    finally:
+        active_snapshot.reset(token)
+
+    if report is None:
+        return dumps_compact(docs, token_budget) if compact else docs
+    latency = {"budget_ms": deadline.budget * 1000, "elapsed_ms": round(deadline.elapsed() * 1000, 1), **report}
+    if compact:
+        return json.dumps({**compact_results(docs, token_budget), "latency": latency}, ensure_ascii=False)
+    return {"results": docs, "latency": latency}
+
+
+@mcp.tool()
+@reloader.pinned
+def search_law_articles_batch(queries: List[str], n_results: Union[int, List[int]] = 20, compact: bool = False, as_of: str = "") -> Dict[str, Any]:
+    """
+    批量检索法律条文：一次调用完成多个互不依赖的查询（例如分别针对 РВП、ВНЖ、гражданство 等法律路径），
+    编码、向量检索与重排序按批共同执行，开销约等于一次 search_law_articles。多个路径需要分别检索时应优先使用本工具。
+
+    Args:
+        queries (List[str]): 查询列表，每个查询的要求与 search_law_articles 的 query 相同。
+        n_results (int | List[int], optional): 每个查询返回的条目数。整数表示所有查询相同，列表则与 queries 一一对应。默认 20。
+        compact (boolean, optional): 是否将合并后的结果以紧凑结构返回（同 search_law_articles 的 compact），默认 False。
+        as_of (string, optional): 日期 "YYYY-MM-DD"，检索该日期生效的法律版本，默认为空表示现行版本。
+
+    Returns:
+        Dict[str, Any]: {
+            "results": [{"query": 查询, "ids": [按相关度排序的引用]}],
+            "union": 所有查询结果去重后的条目列表（格式同 search_law_articles，每个条目只出现一次），
         }
-        docs = law_retriever.invoke(query, config=config)
-        return docs[:n_results]
-    elif isinstance(law_retriever, BaseRetriever) and not isinstance(law_retriever, Runnable):
-        # 普通 BaseRetriever，传入 config
-        docs = law_retriever.invoke(query, config={"configurable": {"search_kwargs_id": {"k": n_results}}})
-        return docs[:n_results]
-    elif isinstance(law_retriever, Runnable):
-        # LCEL/RunnableParallel 或 Lambda 链
-        docs = law_retriever.invoke({"query": query, "top_n": n_results})
-        return docs
-    else:
-        raise ValueError(f"Unsupported retriever type: {type(law_retriever)}")
+        引用为片段 ID，或条文块的 "law_index:article_index"，可用于在 union 中查找对应条目或调用 get_law_chunks。
+    """
+    ks = n_results if isinstance(n_results, list) else [n_results] * len(queries)
+    if len(ks) != len(queries):
+        raise ValueError("n_results must be an integer or a list with one value per query")
+
+    state = reloader.state
+    manifest = snapshot_registry.resolve(as_of) if snapshot_registry else None
+    token = active_snapshot.set(manifest)
+    try:
+        if shard_retriever is not None:
+            per_query = shard_retriever.search_batch(queries, ks)
+        else:
+            per_query = batch_search(
+                queries,
+                ks,
+                state.law_vectorstore,
+                embedding,
+                state.self_query_retriever,
+                local_constructor=state.local_query_constructor,
+                threshold=args.local_query_threshold,
+                remote_timeout=args.remote_timeout if state.local_query_constructor is not None else None,
+                score_pairs=load_reranker() if args.use_reranker else None,
+                bm25_retriever=state.bm25_retriever,
+                lexical_k=args.batch_lexical_k,
+            )
+        if state.small_to_big_retriever is not None:
+            article_store = snapshot_registry.article_store(manifest) if snapshot_registry else state.article_store
+            per_query = [merge_hits_by_article(docs, article_store) for docs in per_query]
+    finally:
+        active_snapshot.reset(token)
+
+    union = {}
+    for docs in per_query:
+        for doc in docs:
+            union.setdefault(doc_key(doc), doc)
+    return {
+        "results": [{"query": query, "ids": [doc_key(doc) for doc in docs]} for query, docs in zip(queries, per_query)],
+        "union": compact_results(list(union.values())) if compact else list(union.values()),
+    }
 
 
 @mcp.tool()
-def doc_list_matcher(user_query: str, doc_type: str) -> Dict:
+@reloader.pinned
+def get_law_chunks(ids: List[str], as_of: str = "") -> List[Dict[str, Any]]:
+    """
+    按引用取回法律片段的全文。对话中早先的检索结果会被压缩为 "引用 | 条文标题 | 摘要" 的列表，
+    需要原文时用其中的引用调用本工具，不经过向量检索与重排序，开销很小。
+
+    Args:
+        ids (List[str]): 引用列表。片段 ID（如 "3f2a…"）返回该片段；"law_index:article_index"（如 "115:8"）返回整条条文。
+        as_of (string, optional): 与 search_law_articles 相同，检索该日期生效的版本，默认为空表示现行版本。
+
+    Returns:
+        List[Dict[str, Any]]: 按传入顺序返回的片段，格式与 search_law_articles 相同；找不到的引用被忽略。
+    """
+    state = reloader.state
+    manifest = snapshot_registry.resolve(as_of) if snapshot_registry else None
+    token = active_snapshot.set(manifest)
+    try:
+        chunk_ids = [ref for ref in ids if ":" not in ref]
+        found = {}
+        if chunk_ids:
+            raw = state.law_vectorstore.get(ids=chunk_ids, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(raw["ids"], raw["documents"], raw["metadatas"]):
+                found[chunk_id] = Document(page_content=text, metadata=metadata, id=chunk_id)
+
+        article_store = snapshot_registry.article_store(manifest) if snapshot_registry else state.article_store
+        for ref in ids:
+            if ":" not in ref:
+                continue
+            law_index, _, article_index = ref.partition(":")
+            # 未启用 small-to-big、local_first 或引用图时服务端没有加载条文，整条条文的引用无法取回
+            if article_store is None or not law_index.isdigit():
+                continue
+            article = article_store.get((int(law_index), article_index))
+            if article is not None:
+                found[ref] = Document(
+                    page_content=render_article(article, set(), whole_article=True),
+                    metadata={
+                        "law_index": int(law_index),
+                        "law_date": article.get("law_date"),
+                        "chapter_index": article.get("chapter_index"),
+                        "article_index": article_index,
+                        "type": "article_block",
+                    }
+                )
+    finally:
+        active_snapshot.reset(token)
+    return [found[ref] for ref in dict.fromkeys(ids) if ref in found]
+
+
+@mcp.tool()
+@reloader.pinned
+async def doc_list_matcher(user_query: str, doc_type: str) -> Dict:
     """
     用于根据自然语言查询指定申请办理所需的文件清单，所需的费用以及处理申请的时长，
     匹配最合适的办理文件清单，包括可能需要缴纳的费用，缴费明细，以及处理申请的时长。
@@ -168,14 +784,40 @@ def doc_list_matcher(user_query: str, doc_type: str) -> Dict:
         如果返回的文件列表中不存在"Квитанция об оплате"，意味着该类别的申请豁免国家规费，即使法律规定了一般情况需要缴纳，
         返回办理该申请所需的完整文件清单及缴费要求。
     """
-    response = doc_list_chain.invoke({
+    inputs = {
         "user_query": user_query,
         "doc_type": doc_type
-    })
+    }
+    state = reloader.state
+    n_candidates = len(state.doc_lists.get(doc_type, []))
+
+    def is_valid(response) -> bool:
+        selected_id = response.get("selected_id") if isinstance(response, dict) else None
+        return isinstance(selected_id, int) and 0 <= selected_id < n_candidates
+
+    async def select_remote():
+        if args.stream_chains:
+            # selected_id 确定后立即查表返回，不等待完整的解释
+            response = await astream_doc_list_selection(state.doc_list_chain, inputs)
+            if is_valid(response):
+                return response
+            # 流式结果中的 selected_id 缺失或越界：回退到完整的非流式调用
+        return await state.doc_list_chain.ainvoke(inputs)
+
+    if state.local_doc_list_selector is None:
+        response = await select_remote()
+    else:
+        response = await asyncio.to_thread(state.local_doc_list_selector, inputs)
+        if not response["confident"]:
+            try:
+                response = await asyncio.wait_for(select_remote(), timeout=args.remote_timeout)
+            except Exception:
+                # 远程 LLM 不可用或超时：沿用本地模型的选择
+                pass
 
-    doc_list = doc_lists[doc_type][response["selected_id"]]
+    doc_list = state.doc_lists[doc_type][response["selected_id"]]
     return {
-        "reason": response["reason"],
+        "reason": response.get("reason", ""),
         "application_background": doc_list["text"],
         "required_documents_list": doc_list["required_documents_list"],
         "state_duty_law": doc_list["state_duty_law"],
@@ -184,5 +826,148 @@ def doc_list_matcher(user_query: str, doc_type: str) -> Dict:
     }
 
 
+# --- 检索节点接口（--retrieval_node）：用本进程的检索流水线服务一个分片，返回带得分的结果供网关全局合并 ---
+if args.retrieval_node:
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+
+    def shard_search(state: ServerState, query: str, n_results: int, latency_budget_ms: float = 0):
+        """
+        返回 (得分类型, [(doc, 得分)], 是否降级)。启用重排序时直接使用 cross-encoder 的得分，否则计算查询与片段向量的内积。
+        网关转发了延迟预算时按预算执行流水线（见 budgeted_search）：只重排序了部分候选时，其余候选的得分排在重排序得分之后；
+        完全跳过重排序时改用向量得分。small-to-big 合并由网关完成，节点只返回片段。
+        """
+        if latency_budget_ms > 0:
+            scored, report = budgeted_search(
+                query,
+                n_results,
+                state.law_vectorstore,
+                state.self_query_retriever,
+                Deadline(latency_budget_ms),
+                stage_costs,
+                local_constructor=state.local_query_constructor,
+                threshold=args.local_query_threshold,
+                score_pairs=load_reranker() if args.use_reranker else None,
+                with_scores=True,
+            )
+            head = [score for _, score in scored if score is not None]
+            if head:
+                floor = min(head)
+                return "rerank", [
+                    (doc, score if score is not None else floor - 1 - i * 1e-3) for i, (doc, score) in enumerate(scored)
+                ], report["degraded"]
+            docs = [doc for doc, _ in scored]
+            return "cosine", list(zip(docs, similarity_scores(state.law_vectorstore, embedding, query, docs))), report["degraded"]
+        if args.use_reranker:
+            return "rerank", state.law_retriever.invoke({"query": query, "k": n_results, "with_scores": True}), False
+        docs = retrieve_law_docs(state.law_retriever, query, n_results)
+        return "cosine", list(zip(docs, similarity_scores(state.law_vectorstore, embedding, query, docs))), False
+
+    @mcp.custom_route("/search", methods=["POST"])
+    @reloader.pinned
+    async def node_search(request: Request):
+        body = await request.json()
+        state = reloader.state
+        manifest = snapshot_registry.current() if snapshot_registry else None
+
+        def search():
+            active_snapshot.set(manifest)
+            return shard_search(state, body["query"], int(body.get("n_results", 20)), float(body.get("latency_budget_ms") or 0))
+
+        start = time.perf_counter()
+        score_type, scored, degraded = await asyncio.to_thread(search)
+        return JSONResponse({
+            "shard": args.law_collection_name,
+            "score_type": score_type,
+            "degraded": degraded,
+            "results": encode_results(scored),
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        })
+
+    @mcp.custom_route("/chunks", methods=["POST"])
+    @reloader.pinned
+    async def node_chunks(request: Request):
+        body = await request.json()
+        state = reloader.state
+        raw = await asyncio.to_thread(state.law_vectorstore.get, ids=body.get("ids", []), include=["documents", "metadatas"])
+        return JSONResponse({
+            "shard": args.law_collection_name,
+            "results": [
+                {"id": chunk_id, "page_content": text, "metadata": metadata}
+                for chunk_id, text, metadata in zip(raw["ids"], raw["documents"], raw["metadatas"])
+            ],
+        })
+
+
+# --- 管理诊断接口（默认关闭；未启用时不注册路由，也不启动任何采样或跟踪） ---
+if args.admin_diagnostics:
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, PlainTextResponse
+
+    if not args.admin_token:
+        raise SystemExit("--admin_diagnostics requires --admin_token or LAW_MCP_ADMIN_TOKEN")
+
+    profiler = Profiler()
+    memory_tracer = MemoryTracer()
+    install_stack_dump_signal()
+
+    def authorized(request: Request) -> bool:
+        header = request.headers.get("Authorization", "")
+        return hmac.compare_digest(header.encode(), f"Bearer {args.admin_token}".encode())
+
+    def admin_route(path: str):
+        def decorator(handler):
+            async def wrapper(request: Request):
+                if not authorized(request):
+                    return JSONResponse({"error": "unauthorized"}, status_code=401)
+                try:
+                    return await handler(request)
+                except (ValueError, RuntimeError) as e:
+                    return JSONResponse({"error": str(e)}, status_code=400)
+            return mcp.custom_route(path, methods=["GET", "POST"])(wrapper)
+        return decorator
+
+    @admin_route("/admin/profile")
+    async def admin_profile(request: Request):
+        # 折叠栈输出：curl ... > out.folded && flamegraph.pl out.folded > out.svg
+        seconds = min(float(request.query_params.get("seconds", 10)), 120)
+        interval = float(request.query_params.get("interval_ms", 5)) / 1000
+        result = await asyncio.to_thread(profiler.profile, seconds, interval, request.query_params.get("thread"))
+        if result is None:
+            return JSONResponse({"error": "a profile is already running"}, status_code=409)
+        return PlainTextResponse(result)
+
+    @admin_route("/admin/threads")
+    async def admin_threads(request: Request):
+        return PlainTextResponse(thread_stacks())
+
+    @admin_route("/admin/memory/start")
+    async def admin_memory_start(request: Request):
+        return JSONResponse(memory_tracer.start(int(request.query_params.get("nframes", 10))))
+
+    @admin_route("/admin/memory/snapshot")
+    async def admin_memory_snapshot(request: Request):
+        top = int(request.query_params.get("top", 30))
+        return JSONResponse(await asyncio.to_thread(memory_tracer.snapshot, top, request.query_params.get("group_by", "lineno")))
+
+    @admin_route("/admin/memory/stop")
+    async def admin_memory_stop(request: Request):
+        return JSONResponse(memory_tracer.stop())
+
+    @admin_route("/admin/stats")
+    async def admin_stats(request: Request):
+        state = reloader.state
+        return JSONResponse({
+            "process": process_memory(),
+            "torch": torch_memory_stats(),
+            "llm": get_llm_stats(),
+            "rewrite_gate": state.rewrite_gate.stats() if state.rewrite_gate is not None else None,
+            "speculative": speculative_cache.stats() if speculative_cache is not None else None,
+            "shards": shard_retriever.stats() if shard_retriever is not None else None,
+            "stage_costs": stage_costs.stats(),
+            "reload": {"reloads": reloader.reloads, "last_error": reloader.last_error},
+        })
+
+
 if __name__ == "__main__":
     mcp.run(transport="sse", port=args.port)
@@ -27,9 +27,9 @@ DOC_LIST_MATCHING_PROMPT = """
 - Всегда выбирай только один вариант (TOP-1).
 - Сравнивай внимательно ключевые условия: впервые / замена / утрата / ребенок / брак / учеба / военная служба и т.п.
 - Игнорируй малозначимые различия, сосредоточься на правовых критериях.
-- Ответ должен быть строго в формате JSON:
+- Ответ должен быть строго в формате JSON, поле "selected_id" всегда идёт первым:
 {{
-  "reason": "краткое объяснение выбора",
-  "selected_id": int
+  "selected_id": int,
+  "reason": "краткое объяснение выбора"
 }}
 """
\ No newline at end of file
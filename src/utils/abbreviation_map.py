@@ -1,10 +1,30 @@
+import os
+import json
+
+# 缩写词典数据文件（带版本号），键为缩写（小写），值为全称。
+ABBREVIATION_FILE = "data/processed/abbreviations/abbreviations.json"
+
 # 定义要匹配的缩写及其替换后的全称。
-# 键为缩写（小写），值为全称。
+# 键为缩写（小写），值为全称。数据文件不存在时使用这份内置词典。
 ABBREVIATION_MAP = {
     'рвп': 'Разрешение на временное проживание',
-    'рвпо': 'Разрешение на временное проживание в целях получениня образования',
+    'рвпо': 'Разрешение на временное проживание в целях получения образования',
     'внж': 'Вид на жительство',
     'вж': 'Вид на жительство',
     'рнр': 'Разрешение на работу',
     '落地签': 'миграционный учёт'
-}
\ No newline at end of file
+}
+
+
+def load_abbreviation_map(path: str = ABBREVIATION_FILE):
+    """
+    读取缩写词典数据文件，返回 (版本号, 词典)。数据文件中的条目覆盖内置词典中的同名条目。
+    """
+    entries = dict(ABBREVIATION_MAP)
+    version = "builtin"
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries.update({key.lower(): value for key, value in data["entries"].items()})
+        version = str(data.get("version", ""))
+    return version, entries
@@ -0,0 +1,129 @@
+import re
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+def _is_cyrillic(ch: str) -> bool:
+    # 与原正则 [а-яА-Я] 保持一致（不包含 ё/Ё）
+    return "а" <= ch <= "я" or "А" <= ch <= "Я"
+
+
+def _is_latin(ch: str) -> bool:
+    return "a" <= ch <= "z" or "A" <= ch <= "Z"
+
+
+# 法律编号的数字部分，如 "115-ФЗ" 中的 "115-"；紧随其后的内容属于编号本身
+_NUMBER_DASH = re.compile(r"\d+\s*-\s*$")
+
+
+class AbbreviationMatcher:
+    """
+    基于 Aho–Corasick 自动机的缩写匹配器，构建一次后可重复使用。
+
+    匹配语义与原先的正则实现一致：不区分大小写；缩写前后不能紧邻西里尔字母。
+    对首/尾为拉丁字母的词条，额外要求前后不紧邻拉丁字母，避免 "trp" 命中 "strpos" 之类的词。
+    紧跟在 "数字-" 之后的匹配属于法律编号（如 "115-ФЗ"），不做替换。
+    同一位置有多个词条满足条件时取最长者，匹配之间互不重叠（最左最长）。
+    查询耗时与文本长度线性相关，与词典大小无关。
+    """
+
+    def __init__(self, entries: Dict[str, str], version: str = ""):
+        self.version = version
+        self.entries = {key.lower(): value for key, value in entries.items() if key}
+        self._build()
+
+    def _build(self):
+        # goto[state] : {char: next_state}; out[state] : 以该状态结尾的词条长度列表
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]
+
+        for key in self.entries:
+            state = 0
+            for ch in key:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append(len(key))
+
+        # BFS 构建失败指针，并合并输出
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    @staticmethod
+    def _lower(text: str) -> str:
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        # 个别字符小写后长度改变（如 'İ'），逐字符处理以保持下标对齐
+        return "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+    def _boundary_ok(self, text: str, start: int, end: int) -> bool:
+        if start > 0:
+            before = text[start - 1]
+            if _is_cyrillic(before) or (_is_latin(text[start]) and _is_latin(before)):
+                return False
+            if _NUMBER_DASH.search(text, max(0, start - 16), start):
+                return False
+        if end < len(text):
+            after = text[end]
+            if _is_cyrillic(after) or (_is_latin(text[end - 1]) and _is_latin(after)):
+                return False
+        return True
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        返回 [(start, end, key)]，key 为小写词条。
+        """
+        lowered = self._lower(text)
+        # best[start] = 该起点满足边界条件的最长匹配终点
+        best: Dict[int, int] = {}
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, ch in enumerate(lowered):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length in out[state]:
+                start, end = i + 1 - length, i + 1
+                if end > best.get(start, -1) and self._boundary_ok(text, start, end):
+                    best[start] = end
+
+        matches = []
+        position = 0
+        for start in sorted(best):
+            if start < position:
+                continue
+            end = best[start]
+            matches.append((start, end, lowered[start:end]))
+            position = end
+        return matches
+
+    def expand(self, text: str) -> Tuple[str, int]:
+        """
+        将匹配到的缩写替换为 "全称 (原缩写)"，返回 (处理后文本, 替换次数)。
+        """
+        matches = self.find(text)
+        if not matches:
+            return text, 0
+        parts = []
+        position = 0
+        for start, end, key in matches:
+            parts.append(text[position:start])
+            parts.append(f'"{self.entries[key]} ({text[start:end]})"')
+            position = end
+        parts.append(text[position:])
+        return "".join(parts), len(matches)
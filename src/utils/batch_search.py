@@ -0,0 +1,188 @@
+import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Callable
+import numpy as np
+from langchain_core.documents import Document
+from langchain_chroma import Chroma
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+from utils.corpus_store import strip_context
+
+# 与单查询检索一致：MMR 默认先取 20 个候选
+FETCH_K = 20
+
+_remote_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="batch-self-query")
+
+
+def doc_key(doc: Document) -> str:
+    """
+    片段的引用：优先使用片段 ID，没有 ID 的条文块使用 "law_index:article_index"（与 get_law_chunks 一致）。
+    """
+    return doc.id or f"{doc.metadata.get('law_index')}:{doc.metadata.get('article_index')}"
+
+
+def construct_queries(
+    queries: List[str],
+    self_query_retriever,
+    local_constructor=None,
+    threshold: float = 0.8,
+    remote_timeout: Optional[float] = None,
+) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """
+    为每个查询构造 (检索文本, 过滤条件)。有本地构造器时先用本地规则，置信度不足的查询一起交给 LLM 并发构造；
+    LLM 失败或超时时退回本地结果（或不加过滤）。
+    """
+    constructed: List[Tuple[str, Optional[Dict[str, Any]]]] = [(query, None) for query in queries]
+    remote = list(range(len(queries)))
+    if local_constructor is not None:
+        remote = []
+        for i, query in enumerate(queries):
+            where, confidence = local_constructor.parse(query)
+            constructed[i] = (query, where)
+            if confidence < threshold:
+                remote.append(i)
+    if not remote:
+        return constructed
+
+    # configurable_fields 包装后的 SelfQueryRetriever 位于 .default
+    retriever = getattr(self_query_retriever, "default", self_query_retriever)
+    inputs = [{"query": queries[i]} for i in remote]
+    future = _remote_executor.submit(
+        contextvars.copy_context().run,
+        retriever.query_constructor.batch,
+        inputs,
+        return_exceptions=True
+    )
+    try:
+        structured = future.result(timeout=remote_timeout)
+    except Exception:
+        return constructed
+    for i, structured_query in zip(remote, structured):
+        if isinstance(structured_query, Exception):
+            continue
+        new_query, search_kwargs = retriever._prepare_query(queries[i], structured_query)
+        constructed[i] = (new_query, search_kwargs.get("filter"))
+    return constructed
+
+
+def dense_search_batch(
+    vectorstore,
+    vectors: np.ndarray,
+    filters: List[Optional[Dict[str, Any]]],
+    ks: List[int],
+    fetch_k: int = FETCH_K,
+    lambda_mult: float = 0.5,
+) -> List[List[Document]]:
+    """
+    批量 MMR 检索。Chroma 集合按过滤条件分组，每组一次 query 调用检索全部查询向量；
+    其他向量库（分区、快照、量化）逐个查询，但同样复用已计算好的查询向量。
+    """
+    results: List[List[Document]] = [[] for _ in ks]
+    if not isinstance(vectorstore, Chroma):
+        for i, (vector, where, k) in enumerate(zip(vectors, filters, ks)):
+            results[i] = vectorstore.max_marginal_relevance_search_by_vector(
+                vector.tolist(), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=where
+            )
+        return results
+
+    groups: Dict[str, List[int]] = {}
+    for i, where in enumerate(filters):
+        groups.setdefault(json.dumps(where, sort_keys=True, default=str), []).append(i)
+    for rows in groups.values():
+        raw = vectorstore._collection.query(
+            query_embeddings=vectors[rows].tolist(),
+            n_results=fetch_k,
+            where=filters[rows[0]] or None,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        for j, i in enumerate(rows):
+            if not raw["ids"][j]:
+                continue
+            selected = maximal_marginal_relevance(
+                vectors[i], np.asarray(raw["embeddings"][j]), k=ks[i], lambda_mult=lambda_mult
+            )
+            results[i] = [
+                Document(page_content=raw["documents"][j][s], metadata=raw["metadatas"][j][s] or {}, id=raw["ids"][j][s])
+                for s in selected
+            ]
+    return results
+
+
+def lexical_search_batch(bm25_retriever, queries: List[str], filters: List[Optional[Dict[str, Any]]], k: int) -> List[List[Document]]:
+    """
+    基于 CorpusBM25Retriever 的批量 BM25：一次得到全部查询的得分矩阵，再按各自的过滤条件取前 k 个。
+    """
+    store, index = bm25_retriever.store, bm25_retriever.index
+    scores = index.scores_batch([bm25_retriever.preprocess(query) for query in queries])
+    results = []
+    for row, where in zip(scores, filters):
+        if where:
+            row = np.where(store.filter_mask(where), row, -np.inf)
+        n = min(k, int(np.count_nonzero(row > 0)))
+        top = np.argpartition(-row, n - 1)[:n] if n > 0 else np.zeros(0, dtype=np.int64)
+        results.append([store.document(int(i)) for i in top[np.argsort(-row[top], kind="stable")]])
+    return results
+
+
+def rerank_batch(
+    score_pairs: Callable,
+    queries: List[str],
+    candidates: List[List[Document]],
+    ks: List[int],
+) -> List[List[Document]]:
+    """
+    将所有查询的候选对拼在一起，按共享的批次一次打分，再按查询拆分排序。
+    """
+    pairs = []
+    owners = []
+    for i, (query, docs) in enumerate(zip(queries, candidates)):
+        for doc in docs:
+            pairs.append((query, strip_context(doc.page_content)))
+            owners.append((i, doc))
+    scores = score_pairs(pairs) if pairs else []
+
+    ranked: List[List[Tuple[float, Document]]] = [[] for _ in queries]
+    for (i, doc), score in zip(owners, scores):
+        ranked[i].append((score, doc))
+    return [
+        [doc for _, doc in sorted(items, key=lambda x: x[0], reverse=True)[:k]]
+        for items, k in zip(ranked, ks)
+    ]
+
+
+def batch_search(
+    queries: List[str],
+    ks: List[int],
+    vectorstore,
+    embedding,
+    self_query_retriever,
+    local_constructor=None,
+    threshold: float = 0.8,
+    remote_timeout: Optional[float] = None,
+    score_pairs: Optional[Callable] = None,
+    bm25_retriever=None,
+    lexical_k: int = 10,
+) -> List[List[Document]]:
+    """
+    多查询检索，与逐个调用 search_law_articles 的流水线相同（过滤条件构造 → MMR → 可选重排序），
+    但编码、向量检索、BM25 与重排序均按批处理：
+    - 全部检索文本一次前向编码；
+    - 相同过滤条件的查询共用一次向量库查询；
+    - 有 bm25_retriever 时，每个查询再补充 lexical_k 个 BM25 候选（得分矩阵一次算出）交给重排序；
+    - 所有查询的候选对一起分批送入 cross-encoder。
+    """
+    constructed = construct_queries(queries, self_query_retriever, local_constructor, threshold, remote_timeout)
+    texts = [text for text, _ in constructed]
+    filters = [where for _, where in constructed]
+    vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+
+    if score_pairs is None:
+        return dense_search_batch(vectorstore, vectors, filters, ks)
+
+    # 与 get_reranking_retriever 相同：先取 4 倍候选再重排序
+    candidates = dense_search_batch(vectorstore, vectors, filters, [k * 4 for k in ks])
+    if bm25_retriever is not None and lexical_k > 0:
+        for docs, extra in zip(candidates, lexical_search_batch(bm25_retriever, texts, filters, lexical_k)):
+            present = {doc_key(doc) for doc in docs}
+            docs.extend(doc for doc in extra if doc_key(doc) not in present)
+    return rerank_batch(score_pairs, queries, candidates, ks)
@@ -0,0 +1,274 @@
+import re
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from utils.local_query_constructor import law_name_pattern
+from utils.small_to_big import render_article
+
+# 节点：(law_index, article_index, clause_index)，条文级节点的 clause_index 为 ""
+Node = Tuple[int, str, str]
+
+NUMBER = r"\d+(?:\.\d+)*(?:-\d+)?"
+# "пунктами 1и2 статьи 18"、"пункта 2 статьи 8"、"частью 1 статьи 13"、"статьей 15.1"、"статьи 8 и 25"
+# 原文中大量缺少空格（"статьи 22настоящего"、"пунктами 1и2"），分隔符两侧的空白均为可选
+MENTION_PATTERN = re.compile(
+    rf"(?:(?<!под)(?:пункт|част)\w*\s*(?P<clauses>{NUMBER}(?:\s*(?:,|и)\s*{NUMBER})*)\s*)?"
+    rf"стать\w*\s*(?P<articles>{NUMBER}(?:\s*(?:,|и)\s*{NUMBER})*)",
+    re.IGNORECASE
+)
+# 只引用本条其他款："предусмотренных пунктами 1 и 2 настоящей статьи"
+SAME_ARTICLE_PATTERN = re.compile(
+    rf"(?<!под)пункт\w*\s*(?P<clauses>{NUMBER}(?:\s*(?:,|и)\s*{NUMBER})*)\s*настоящей\s*статьи",
+    re.IGNORECASE
+)
+# 引用所指向的法律，取引用之后、句子结束之前最先出现的一个
+QUALIFIER_PATTERN = re.compile(
+    r"(?P<same>настоящ\w*\s*(?:Федеральн\w*\s*)?закон\w*)"
+    r"|(?P<federal>Федеральн\w*\s*закон\w*(?:\s*от\s*[^\"N№;]{0,40})?\s*(?:(?:N|№)\s*(?P<number>\d+)\s*-\s*ФЗ)?\s*(?:\"(?P<name>[^\"]+)\")?)"
+    r"|(?P<other>кодекс\w*|Конституци\w*|Указ\w*|постановлени\w*|закон\w*\s+Российской|Соглашени\w*|договор\w*)",
+    re.IGNORECASE
+)
+SENTENCE_END = re.compile(r";|\.\s+[А-ЯЁ]|\n")
+NUMBER_SPLIT = re.compile(r"\s*(?:,|и)\s*")
+
+# 引用扩展的方向：被引用的条文、引用了它的条文、两者皆有
+DIRECTIONS = ("cites", "cited_by", "both")
+
+
+def node_key(node: Node) -> str:
+    return f"{node[0]}|{node[1]}|{node[2]}"
+
+
+def parse_node_key(key: str) -> Node:
+    law_index, article_index, clause_index = key.split("|", 2)
+    return int(law_index), article_index, clause_index
+
+
+def article_texts(data: Dict[str, Any]):
+    """
+    逐个返回条文 JSON 中的 (clause_index, 文本)，条文级段落的 clause_index 为 ""。
+    """
+    for text in data.get("unindexed", []):
+        yield "", text
+    for clause in data.get("clauses", []):
+        clause_index = clause.get("clause_index", "")
+        yield clause_index, clause["clause_text"]
+        for text in clause.get("unindexed", []):
+            yield clause_index, text
+        for subclause in clause.get("subclauses", []):
+            yield clause_index, subclause["subclause_text"]
+            for text in subclause.get("unindexed", []):
+                yield clause_index, text
+
+
+class CitationExtractor:
+    """
+    从条文文本中抽取引用。只保留能在语料中定位到的目标：
+    "настоящего Федерального закона" 指向本法，"Федерального закона ... N 115-ФЗ" 或带名称的引用按编号/名称匹配语料中的法律，
+    引用其他法律、法典、总统令等的条文一律舍弃。
+    """
+
+    def __init__(self, article_store: Dict[Tuple[int, str], Dict[str, Any]]):
+        self.articles = set(article_store)
+        self.laws = {law_index for law_index, _ in article_store}
+        self.clauses = {
+            (law_index, article_index, clause.get("clause_index", ""))
+            for (law_index, article_index), data in article_store.items()
+            for clause in data.get("clauses", [])
+        }
+        self.law_names = {}
+        for (law_index, _), data in article_store.items():
+            if law_index not in self.law_names:
+                pattern = law_name_pattern(data["law_title"])
+                if pattern is not None:
+                    self.law_names[law_index] = pattern
+
+    def _target_law(self, text: str, position: int, current_law: int) -> Optional[int]:
+        end = SENTENCE_END.search(text, position)
+        window = text[position:end.start() if end else len(text)]
+        qualifier = QUALIFIER_PATTERN.search(window)
+        if qualifier is None or qualifier.group("other"):
+            return None
+        if qualifier.group("same"):
+            return current_law
+        if qualifier.group("number"):
+            law_index = int(qualifier.group("number"))
+            return law_index if law_index in self.laws else None
+        name = qualifier.group("name") or ""
+        for law_index, pattern in self.law_names.items():
+            if pattern.search(name):
+                return law_index
+        return None
+
+    def _resolve(self, law_index: int, article_index: str, clause_index: str) -> Optional[Node]:
+        if clause_index and (law_index, article_index, clause_index) in self.clauses:
+            return law_index, article_index, clause_index
+        if (law_index, article_index) in self.articles:
+            return law_index, article_index, ""
+        return None
+
+    def extract(self, text: str, law_index: int, article_index: str) -> List[Node]:
+        targets = []
+        for match in MENTION_PATTERN.finditer(text):
+            target_law = self._target_law(text, match.end(), law_index)
+            if target_law is None:
+                continue
+            articles = NUMBER_SPLIT.split(match.group("articles"))
+            clauses = NUMBER_SPLIT.split(match.group("clauses")) if match.group("clauses") else [""]
+            # "пунктами 2 и 3 статьи 18" 指向同一条的多个款；"статьи 8 и 25" 指向多个条文
+            for target_article in articles:
+                for clause_index in (clauses if len(articles) == 1 else [""]):
+                    node = self._resolve(target_law, target_article.rstrip("."), clause_index.rstrip("."))
+                    if node is not None:
+                        targets.append(node)
+        for match in SAME_ARTICLE_PATTERN.finditer(text):
+            for clause_index in NUMBER_SPLIT.split(match.group("clauses")):
+                node = self._resolve(law_index, article_index, clause_index.rstrip("."))
+                if node is not None:
+                    targets.append(node)
+        return targets
+
+
+def build_citation_graph(article_store: Dict[Tuple[int, str], Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    构建引用图，返回可直接 np.savez 保存的 CSR 数组：
+    nodes（节点键，"law|article|clause"）、out_indptr/out_indices（引用）、in_indptr/in_indices（被引用）。
+    """
+    extractor = CitationExtractor(article_store)
+    edges = set()
+    for (law_index, article_index), data in article_store.items():
+        for clause_index, text in article_texts(data):
+            source = (law_index, article_index, clause_index)
+            for target in extractor.extract(text, law_index, article_index):
+                if target != source:
+                    edges.add((source, target))
+
+    nodes = sorted({node for edge in edges for node in edge}, key=node_key)
+    node_ids = {node: i for i, node in enumerate(nodes)}
+    sources = np.array([node_ids[s] for s, _ in edges], dtype=np.int32)
+    targets = np.array([node_ids[t] for _, t in edges], dtype=np.int32)
+
+    def csr(rows, cols):
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+        np.add.at(indptr, rows + 1, 1)
+        return np.cumsum(indptr, dtype=np.int32), cols[order]
+
+    out_indptr, out_indices = csr(sources, targets)
+    in_indptr, in_indices = csr(targets, sources)
+    return {
+        "nodes": np.array([node_key(node) for node in nodes]),
+        "out_indptr": out_indptr,
+        "out_indices": out_indices,
+        "in_indptr": in_indptr,
+        "in_indices": in_indices,
+    }
+
+
+class CitationGraph:
+    """
+    加载 build_citation_graph 生成的 CSR 引用图，按条文或款查询引用/被引用的邻居。
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.nodes = [parse_node_key(str(key)) for key in arrays["nodes"]]
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        self.by_article: Dict[Tuple[int, str], List[int]] = {}
+        for i, (law_index, article_index, _) in enumerate(self.nodes):
+            self.by_article.setdefault((law_index, article_index), []).append(i)
+        self.adjacency = {
+            "cites": (arrays["out_indptr"], arrays["out_indices"]),
+            "cited_by": (arrays["in_indptr"], arrays["in_indices"]),
+        }
+
+    @classmethod
+    def load(cls, path: str) -> "CitationGraph":
+        with np.load(path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def neighbors(self, law_index: int, article_index: str, clause_index: Optional[str] = None, direction: str = "cites") -> List[Node]:
+        """
+        clause_index 为 None 时合并整条条文（含其各款）的邻居。direction: "cites" / "cited_by" / "both"。
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown citation direction '{direction}', expected one of {', '.join(DIRECTIONS)}")
+        if clause_index is None:
+            sources = self.by_article.get((law_index, str(article_index)), [])
+        else:
+            node_id = self.node_ids.get((law_index, str(article_index), clause_index))
+            sources = [node_id] if node_id is not None else []
+        directions = ["cites", "cited_by"] if direction == "both" else [direction]
+
+        result = []
+        seen = set(sources)
+        for name in directions:
+            indptr, indices = self.adjacency[name]
+            for source in sources:
+                for target in indices[indptr[source]:indptr[source + 1]].tolist():
+                    if target not in seen:
+                        seen.add(target)
+                        result.append(self.nodes[target])
+        return result
+
+
+def render_node(article: Dict[str, Any], clause_index: str) -> str:
+    """
+    按 parse_law_json_to_docs 的格式渲染节点文本：三行标题 + 款（含其项）。
+    条文级节点（引用整条条文，如 "в соответствии со статьей 6"）渲染整条条文。
+    """
+    if clause_index == "":
+        return render_article(article, set(), whole_article=True)
+    lines = [article["law_title"], article["chapter_title"], article["article_title"]]
+    lines.extend(text for index, text in article_texts(article) if index == clause_index)
+    return "\n".join(lines)
+
+
+def expand_with_citations(
+    docs: List[Document],
+    graph: CitationGraph,
+    article_store: Dict[Tuple[int, str], Dict[str, Any]],
+    top_n: int = 5,
+    max_neighbors: int = 3,
+    direction: str = "cites",
+) -> List[Document]:
+    """
+    对排名前 top_n 的结果各追加至多 max_neighbors 个引用图邻居，追加的片段类型为 "citation"，
+    并在元数据中记录来源（cited_from）与关系（relation）。不调用任何模型。
+    """
+    present = {
+        (doc.metadata.get("law_index"), str(doc.metadata.get("article_index")), doc.metadata.get("clause_index", ""))
+        for doc in docs
+    }
+    relations = ["cites", "cited_by"] if direction == "both" else [direction]
+    expanded = []
+    for doc in docs[:top_n]:
+        meta = doc.metadata
+        clause_index = None if meta.get("type") == "article_block" else meta.get("clause_index", "")
+        neighbors = [
+            (node, relation)
+            for relation in relations
+            for node in graph.neighbors(meta.get("law_index"), meta.get("article_index"), clause_index, relation)
+        ]
+        added = 0
+        for node, relation in neighbors:
+            article = article_store.get(node[:2])
+            if added >= max_neighbors:
+                break
+            if article is None or node in present:
+                continue
+            present.add(node)
+            added += 1
+            expanded.append(Document(
+                page_content=render_node(article, node[2]),
+                metadata={
+                    "law_index": node[0],
+                    "law_date": article.get("law_date"),
+                    "chapter_index": article.get("chapter_index"),
+                    "article_index": node[1],
+                    **({"clause_index": node[2]} if node[2] else {}),
+                    "type": "citation",
+                    "relation": relation,
+                    "cited_from": node_key((meta.get("law_index"), str(meta.get("article_index")), meta.get("clause_index", ""))),
+                }
+            ))
+    return docs + expanded
@@ -0,0 +1,101 @@
+import orjson
+from typing import List, Dict, Any
+from langchain_core.documents import Document
+from utils.tokens import estimate_tokens
+
+# page_content 的前三行依次为法律标题、章节标题、条文标题（见 parse_law_json_to_docs）
+HEADER_LINES = 3
+
+
+def _split_content(doc: Document):
+    lines = doc.page_content.split("\n")
+    if len(lines) > HEADER_LINES:
+        return lines[:HEADER_LINES], lines[HEADER_LINES:]
+    # 个别片段只保存了正文，没有标题上下文
+    return None, lines
+
+
+def compact_results(docs: List[Document], token_budget: int = 0) -> Dict[str, Any]:
+    """
+    将检索结果压缩为层级结构：每部法律、每条条文的标题只出现一次，命中的款/项按行去重后挂在条文下。
+
+    Args:
+        docs: 按相关度排序的检索结果（叶子片段或 small-to-big 条文块均可）。
+        token_budget: 输出正文的 token 上限，0 表示不限制；超出后排名靠后的结果被整体舍弃。
+
+    Returns:
+        Dict: {"laws": [...], "truncated": 被舍弃的结果数}
+    """
+    laws = {}
+    articles = {}
+    used_tokens = 0
+    kept = 0
+
+    for doc in docs:
+        meta = doc.metadata
+        law_key = meta.get("law_index")
+        article_key = (law_key, meta.get("article_index"))
+        headers, body = _split_content(doc)
+
+        cost = 0
+        if law_key not in laws and headers:
+            cost += estimate_tokens(headers[0])
+        article = articles.get(article_key)
+        if article is None:
+            if headers:
+                cost += estimate_tokens(headers[1]) + estimate_tokens(headers[2])
+            new_lines = body
+        else:
+            new_lines = [line for line in body if line not in article["_seen"]]
+        cost += sum(estimate_tokens(line) for line in new_lines)
+
+        if token_budget and kept and used_tokens + cost > token_budget:
+            break
+        used_tokens += cost
+        kept += 1
+
+        law = laws.get(law_key)
+        if law is None:
+            law = {
+                "law": headers[0] if headers else "",
+                "law_index": law_key,
+                "law_date": meta.get("law_date"),
+                "articles": []
+            }
+            laws[law_key] = law
+        elif headers and not law["law"]:
+            law["law"] = headers[0]
+        if article is None:
+            article = {
+                "chapter": headers[1] if headers else "",
+                "article": headers[2] if headers else "",
+                "article_index": meta.get("article_index"),
+                "ids": [],
+                "text": [],
+                "_seen": set()
+            }
+            articles[article_key] = article
+            law["articles"].append(article)
+        elif headers and not article["article"]:
+            article["chapter"], article["article"] = headers[1], headers[2]
+
+        if doc.id:
+            article["ids"].append(doc.id)
+        for line in new_lines:
+            if line not in article["_seen"]:
+                article["_seen"].add(line)
+                article["text"].append(line)
+
+    for article in articles.values():
+        del article["_seen"]
+        if not article["ids"]:
+            del article["ids"]
+
+    return {"laws": list(laws.values()), "truncated": len(docs) - kept}
+
+
+def dumps_compact(docs: List[Document], token_budget: int = 0) -> str:
+    """
+    以 orjson 序列化 compact_results 的结果，直接作为工具的文本输出。
+    """
+    return orjson.dumps(compact_results(docs, token_budget)).decode("utf-8")
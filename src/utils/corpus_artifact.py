@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import datetime
+from collections.abc import Mapping
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+import orjson
+from langchain_core.documents import Document
+from utils.parse_law_json import parse_law_json_to_docs, chunk_id
+
+# --- 列式语料库（由 fetch_law.py 或 scripts/build_corpus_artifact.py 生成，位于 laws_dir/_corpus） ---
+# manifest.json    {"format_version", "created_at", "counts", "files": {文件名: sha256}, "sources": {相对路径: {sha1, size, mtime_ns}}}
+# chunks.arrow     Arrow IPC（不压缩，可内存映射），每个片段一行：ID、page_content、类型化的元数据列、所属条文的行号
+# articles.arrow   每个条文一行：定位字段与原始 JSON 文本（small-to-big、引用图、快照使用）
+CORPUS_DIR = "_corpus"
+FORMAT_VERSION = 1
+
+# 片段元数据列，取值为空表示该片段没有这个字段（与 parse_law_json_to_docs 的元数据一一对应）
+METADATA_COLUMNS = ("law_index", "law_date", "chapter_index", "article_index", "type", "clause_index", "subclause_index", "paragraph_order")
+
+
+def _chunk_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.string()),
+        ("page_content", pa.string()),
+        ("law_index", pa.int32()),
+        ("law_date", pa.string()),
+        ("chapter_index", pa.string()),
+        ("article_index", pa.string()),
+        ("type", pa.dictionary(pa.int8(), pa.string())),
+        ("clause_index", pa.string()),
+        ("subclause_index", pa.string()),
+        ("paragraph_order", pa.int32()),
+        ("article_row", pa.int32()),
+    ])
+
+
+def _article_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("law_index", pa.int32()),
+        ("law_dir", pa.string()),
+        ("chapter_index", pa.string()),
+        ("article_index", pa.string()),
+        ("law_title", pa.string()),
+        ("chapter_title", pa.string()),
+        ("article_title", pa.string()),
+        ("source", pa.string()),
+        ("sha1", pa.string()),
+        ("json", pa.string()),
+    ])
+
+
+def article_files(laws_dir: str) -> List[str]:
+    """
+    laws_dir/*/articles/*.json 的相对路径（排序后），不含生成的语料库目录。
+    """
+    files = []
+    for law in sorted(os.listdir(laws_dir)):
+        article_dir = os.path.join(laws_dir, law, "articles")
+        if law == CORPUS_DIR or not os.path.isdir(article_dir):
+            continue
+        files.extend(f"{law}/articles/{file}" for file in sorted(os.listdir(article_dir)) if file.endswith(".json"))
+    return files
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_corpus_artifact(laws_dir: str, output_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    读取全部条文 JSON，写出列式语料库并返回 manifest。
+    片段按内容哈希去重（与 build_chromadb.py 相同）；先写临时目录再整体替换，读取方不会看到写了一半的文件。
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    output_dir = output_dir or os.path.join(laws_dir, CORPUS_DIR)
+    articles = {name: [] for name in _article_schema().names}
+    chunks = {name: [] for name in _chunk_schema().names}
+    sources = {}
+    seen = set()
+    for rel_path in article_files(laws_dir):
+        path = os.path.join(laws_dir, rel_path)
+        with open(path, "r", encoding="utf-8") as f:
+            raw = f.read()
+        data = json.loads(raw)
+        stat = os.stat(path)
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        sources[rel_path] = {"sha1": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        row = len(articles["json"])
+        for key, value in (
+            ("law_index", int(data["law_index"])),
+            ("law_dir", rel_path.split("/", 1)[0]),
+            ("chapter_index", str(data["chapter_index"])),
+            ("article_index", str(data["article_index"])),
+            ("law_title", data["law_title"]),
+            ("chapter_title", data["chapter_title"]),
+            ("article_title", data["article_title"]),
+            ("source", rel_path),
+            ("sha1", digest),
+            ("json", raw),
+        ):
+            articles[key].append(value)
+
+        for doc in parse_law_json_to_docs(data):
+            doc_id = chunk_id(doc)
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            chunks["id"].append(doc_id)
+            chunks["page_content"].append(doc.page_content)
+            for key in METADATA_COLUMNS:
+                chunks[key].append(doc.metadata.get(key))
+            chunks["article_row"].append(row)
+
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    files = {}
+    for name, columns, schema in (("chunks.arrow", chunks, _chunk_schema()), ("articles.arrow", articles, _article_schema())):
+        table = pa.Table.from_pydict(columns, schema=schema)
+        path = os.path.join(tmp_dir, name)
+        with pa.OSFile(path, "wb") as sink, ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+        files[name] = _file_sha256(path)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "counts": {"articles": len(articles["json"]), "chunks": len(chunks["id"])},
+        "files": files,
+        "sources": sources,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return manifest
+
+
+class ArticleStore(Mapping):
+    """
+    (law_index, article_index) -> 条文字典，格式与 small_to_big.load_article_store 相同。
+    条文 JSON 留在内存映射的 Arrow 列中，第一次访问某个条文时才解析并缓存。
+    """
+
+    def __init__(self, table):
+        self._json = table.column("json").combine_chunks()
+        self._rows = {
+            (law_index, article_index): row
+            for row, (law_index, article_index) in enumerate(zip(
+                table.column("law_index").to_pylist(), table.column("article_index").to_pylist()
+            ))
+        }
+        self._cache: Dict[int, Dict[str, Any]] = {}
+
+    def __getitem__(self, key: Tuple[int, str]) -> Dict[str, Any]:
+        row = self._rows[key]
+        data = self._cache.get(row)
+        if data is None:
+            data = self._cache[row] = orjson.loads(self._json[row].as_py())
+        return data
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class CorpusArtifact:
+    """
+    以内存映射方式打开列式语料库：表中的列直接引用映射的文件页（零拷贝），
+    只有读取到的片段或条文才转换为 Python 对象，打开的耗时与语料规模基本无关。
+    """
+
+    def __init__(self, corpus_dir: str, verify: bool = False):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        self.corpus_dir = corpus_dir
+        with open(os.path.join(corpus_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported corpus artifact version in {corpus_dir}; rebuild it with scripts/build_corpus_artifact.py")
+        if verify:
+            for name, digest in self.manifest["files"].items():
+                if _file_sha256(os.path.join(corpus_dir, name)) != digest:
+                    raise ValueError(f"Content hash mismatch for {name} in {corpus_dir}")
+        self.chunks = ipc.open_file(pa.memory_map(os.path.join(corpus_dir, "chunks.arrow"), "r")).read_all()
+        self.articles = ipc.open_file(pa.memory_map(os.path.join(corpus_dir, "articles.arrow"), "r")).read_all()
+
+    def __len__(self) -> int:
+        return self.chunks.num_rows
+
+    def is_current(self, laws_dir: str) -> bool:
+        """
+        与 laws_dir 中的条文 JSON 比较文件列表、大小与修改时间（只 stat，不读取内容）。
+        laws_dir 中没有条文 JSON 时（只部署了语料库）视为最新。
+        """
+        files = article_files(laws_dir)
+        if not files:
+            return True
+        sources = self.manifest["sources"]
+        if len(files) != len(sources):
+            return False
+        for rel_path in files:
+            source = sources.get(rel_path)
+            if source is None:
+                return False
+            stat = os.stat(os.path.join(laws_dir, rel_path))
+            if (stat.st_size, stat.st_mtime_ns) != (source["size"], source["mtime_ns"]):
+                return False
+        return True
+
+    def metadatas(self) -> List[Dict[str, Any]]:
+        columns = [(key, self.chunks.column(key).to_pylist()) for key in METADATA_COLUMNS]
+        return [
+            {key: values[i] for key, values in columns if values[i] is not None}
+            for i in range(self.chunks.num_rows)
+        ]
+
+    def documents(self) -> List[Document]:
+        """
+        全部片段（已去重，带内容哈希 ID），与 parse_law_json_to_docs 的结果一致。
+        """
+        ids = self.chunks.column("id").to_pylist()
+        texts = self.chunks.column("page_content").to_pylist()
+        return [
+            Document(page_content=text, metadata=metadata, id=doc_id)
+            for doc_id, text, metadata in zip(ids, texts, self.metadatas())
+        ]
+
+    def article_store(self) -> ArticleStore:
+        return ArticleStore(self.articles)
+
+    def article_sources(self) -> Iterator[Tuple[str, str]]:
+        """
+        逐个返回 (sha1, 原始 JSON 文本)，sha1 与对原文件计算的结果相同。
+        """
+        yield from zip(self.articles.column("sha1").to_pylist(), self.articles.column("json").to_pylist())
+
+    def article_hashes(self) -> Dict[str, str]:
+        columns = [self.articles.column(key).to_pylist() for key in ("law_index", "article_index", "sha1")]
+        return {f"{law_index}:{article_index}": digest for law_index, article_index, digest in zip(*columns)}
+
+
+def open_corpus(laws_dir: str, verify: bool = False) -> Optional[CorpusArtifact]:
+    """
+    laws_dir/_corpus 存在、可读且与条文 JSON 一致时返回 CorpusArtifact，否则返回 None（调用方回退到逐个读取 JSON）。
+    """
+    corpus_dir = os.path.join(laws_dir, CORPUS_DIR)
+    if not os.path.exists(os.path.join(corpus_dir, "manifest.json")):
+        return None
+    try:
+        artifact = CorpusArtifact(corpus_dir, verify=verify)
+    except ImportError:
+        print(f"⚠️ pyarrow is not installed, reading article JSON files instead of {corpus_dir}", file=sys.stderr)
+        return None
+    if not artifact.is_current(laws_dir):
+        print(f"⚠️ {corpus_dir} is older than the article JSON files, reading them instead; rebuild it with scripts/build_corpus_artifact.py", file=sys.stderr)
+        return None
+    return artifact
+
+
+def _read_article_files(laws_dir: str) -> Iterator[Tuple[str, str]]:
+    for rel_path in article_files(laws_dir):
+        with open(os.path.join(laws_dir, rel_path), "r", encoding="utf-8") as f:
+            raw = f.read()
+        yield hashlib.sha1(raw.encode("utf-8")).hexdigest(), raw
+
+
+def iter_article_sources(laws_dir: str) -> Iterator[Tuple[str, str]]:
+    """
+    逐个返回 (sha1, 原始 JSON 文本)：优先读取语料库，否则逐个读取条文 JSON。
+    """
+    artifact = open_corpus(laws_dir)
+    return artifact.article_sources() if artifact is not None else _read_article_files(laws_dir)
+
+
+def load_articles(laws_dir: str) -> Mapping:
+    """
+    以 (law_index, article_index) 为键的条文字典：优先使用语料库（按需解析），否则逐个读取条文 JSON。
+    """
+    artifact = open_corpus(laws_dir)
+    if artifact is not None:
+        return artifact.article_store()
+    store = {}
+    for _, raw in _read_article_files(laws_dir):
+        data = json.loads(raw)
+        store[(int(data["law_index"]), str(data["article_index"]))] = data
+    return store
+
+
+def load_article_hashes(laws_dir: str) -> Dict[str, str]:
+    """
+    "law_index:article_index" -> 条文 JSON 的 sha1，用于判断某条条文的内容是否变化。
+    """
+    artifact = open_corpus(laws_dir)
+    if artifact is not None:
+        return artifact.article_hashes()
+    hashes = {}
+    for digest, raw in _read_article_files(laws_dir):
+        data = json.loads(raw)
+        hashes[f"{int(data['law_index'])}:{data['article_index']}"] = digest
+    return hashes
+
+
+def load_documents(laws_dir: str) -> List[Document]:
+    """
+    全部片段（按内容哈希去重并带 ID）：优先使用语料库，否则逐个读取条文 JSON 并切分。
+    """
+    artifact = open_corpus(laws_dir)
+    if artifact is not None:
+        return artifact.documents()
+    documents = {}
+    for _, raw in _read_article_files(laws_dir):
+        for doc in parse_law_json_to_docs(json.loads(raw)):
+            doc_id = chunk_id(doc)
+            if doc_id not in documents:
+                doc.id = doc_id
+                documents[doc_id] = doc
+    return list(documents.values())
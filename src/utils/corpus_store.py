@@ -0,0 +1,304 @@
+import math
+from array import array
+from collections import Counter
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+
+def strip_context(page_content: str) -> str:
+    """
+    去掉 page_content 开头的法律名称与章节标题两行，保留条文标题与正文，用于重排序与 BM25。
+    只有正文一行的片段原样返回。
+    """
+    parts = page_content.split("\n", 2)
+    return parts[2] if len(parts) == 3 else page_content
+
+
+def _compare(op: str, value: Any, operand: Any) -> bool:
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        # 类型不同的值（如 str 与 int）不满足比较条件
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+class ChunkView:
+    """
+    语料库中单个片段的轻量视图，只保存语料库引用与下标，按需读取文本与元数据。
+    """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: "CorpusStore", index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.store.ids[self.index] if self.store.ids else None
+
+    @property
+    def page_content(self) -> str:
+        return self.store.page_content(self.index)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.store.metadata(self.index)
+
+    def to_document(self) -> Document:
+        return self.store.document(self.index)
+
+
+class CorpusStore:
+    """
+    所有检索器共用的紧凑语料库：
+    - 片段正文拼接为一个字符串，按偏移量切取；
+    - page_content 开头的 "法律名称\\n章节标题\\n条文标题" 三行在同一条文的片段间重复，只保存一份并按编号引用；
+    - 元数据按字段列式存储，取值经过驻留（interning），每个片段只占一个整数编号；
+    - 只有在返回最终结果时才构造 Document。
+    """
+
+    def __init__(self, texts: Iterable[str], metadatas: Iterable[Dict[str, Any]], ids: Optional[Iterable[str]] = None):
+        self.ids: List[str] = list(ids) if ids is not None else []
+        self.headers: List[str] = []
+        self.columns: Dict[str, array] = {}
+        self.values: Dict[str, List[Any]] = {}
+        header_codes: Dict[str, int] = {}
+        value_codes: Dict[str, Dict[Any, int]] = {}
+
+        bodies = []
+        self.header_ids = array("i")
+        self.offsets = array("Q", [0])
+        for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+            # 三行标题的最后一行是条文标题；不带标题的片段（只有正文）记为 -1
+            parts = text.split("\n", 3)
+            if len(parts) == 4 and parts[2].startswith("Статья"):
+                header = "\n".join(parts[:3])
+                body = parts[3]
+                self.header_ids.append(header_codes.setdefault(header, len(header_codes)))
+            else:
+                body = text
+                self.header_ids.append(-1)
+            bodies.append(body)
+            self.offsets.append(self.offsets[-1] + len(body))
+
+            for key, value in (metadata or {}).items():
+                column = self.columns.get(key)
+                if column is None:
+                    column = self.columns[key] = array("i", [-1] * i)
+                    value_codes[key] = {}
+                    self.values[key] = []
+                codes = value_codes[key]
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(self.values[key])
+                    self.values[key].append(value)
+                column.append(code)
+            # 本片段没有的字段补 -1，保持各列等长
+            for column in self.columns.values():
+                if len(column) == i:
+                    column.append(-1)
+
+        self.headers = list(header_codes)
+        self.buffer = "".join(bodies)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "CorpusStore":
+        raw = vectorstore.get(include=["documents", "metadatas"])
+        return cls(raw["documents"], raw["metadatas"], raw.get("ids"))
+
+    @classmethod
+    def from_documents(cls, documents: List[Document]) -> "CorpusStore":
+        ids = [doc.id for doc in documents] if all(getattr(doc, "id", None) for doc in documents) else None
+        return cls((doc.page_content for doc in documents), (doc.metadata for doc in documents), ids)
+
+    def __len__(self) -> int:
+        return len(self.header_ids)
+
+    def __getitem__(self, index: int) -> ChunkView:
+        return ChunkView(self, index)
+
+    def body(self, index: int) -> str:
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+    def page_content(self, index: int) -> str:
+        header_id = self.header_ids[index]
+        if header_id < 0:
+            return self.body(index)
+        return f"{self.headers[header_id]}\n{self.body(index)}"
+
+    def rerank_text(self, index: int) -> str:
+        """
+        与 strip_context(page_content) 相同，但不构造完整的 page_content。
+        """
+        header_id = self.header_ids[index]
+        if header_id < 0:
+            return self.body(index)
+        return f"{self.headers[header_id].split(chr(10), 2)[2]}\n{self.body(index)}"
+
+    def metadata(self, index: int) -> Dict[str, Any]:
+        result = {}
+        for key, column in self.columns.items():
+            code = column[index]
+            if code >= 0:
+                result[key] = self.values[key][code]
+        return result
+
+    def column(self, key: str) -> np.ndarray:
+        """
+        字段的编号列（int32 视图，不复制），缺失为 -1。
+        """
+        column = self.columns.get(key)
+        if column is None:
+            return np.full(len(self), -1, dtype=np.int32)
+        return np.frombuffer(column, dtype=np.int32)
+
+    def filter_mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """
+        在列式元数据上计算 Chroma 风格的 where 条件，返回布尔掩码。
+        支持 $and/$or 以及 $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte。
+        """
+        if not where:
+            return np.ones(len(self), dtype=bool)
+        if "$and" in where:
+            return np.logical_and.reduce([self.filter_mask(c) for c in where["$and"]])
+        if "$or" in where:
+            return np.logical_or.reduce([self.filter_mask(c) for c in where["$or"]])
+
+        mask = np.ones(len(self), dtype=bool)
+        for key, condition in where.items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            values = self.values.get(key, [])
+            column = self.column(key)
+            for op, operand in condition.items():
+                if op in ("$eq", "$ne", "$in", "$nin"):
+                    targets = operand if op in ("$in", "$nin") else [operand]
+                    codes = [code for code, value in enumerate(values) if value in targets]
+                    matched = np.isin(column, codes)
+                    mask &= ~matched & (column >= 0) if op in ("$ne", "$nin") else matched
+                else:
+                    codes = [code for code, value in enumerate(values) if _compare(op, value, operand)]
+                    mask &= np.isin(column, codes)
+        return mask
+
+    def document(self, index: int) -> Document:
+        return Document(
+            page_content=self.page_content(index),
+            metadata=self.metadata(index),
+            id=self.ids[index] if self.ids else None
+        )
+
+
+class BM25Index:
+    """
+    基于倒排表的 BM25（Okapi），打分与 rank_bm25.BM25Okapi 一致，但不保存分词后的语料：
+    每个词只保存出现该词的片段编号与词频两个数组。
+    """
+
+    def __init__(self, tokenized: Iterable[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        postings: Dict[str, Tuple[array, array]] = {}
+        lengths = array("I")
+        for i, tokens in enumerate(tokenized):
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array("I"), array("H"))
+                entry[0].append(i)
+                entry[1].append(min(tf, 65535))
+
+        self.n_docs = len(lengths)
+        self.doc_len = np.frombuffer(lengths, dtype=np.uint32).astype(np.float32) if self.n_docs else np.zeros(0, np.float32)
+        self.avgdl = float(self.doc_len.mean()) if self.n_docs else 0.0
+
+        # 与 BM25Okapi 相同：负的 idf 用 epsilon * 平均 idf 代替
+        idf = {
+            term: math.log(self.n_docs - len(docs) + 0.5) - math.log(len(docs) + 0.5)
+            for term, (docs, _) in postings.items()
+        }
+        floor = epsilon * (sum(idf.values()) / len(idf)) if idf else 0.0
+        self.postings = {
+            term: (np.frombuffer(docs, dtype=np.uint32), np.frombuffer(tfs, dtype=np.uint16), idf[term] if idf[term] >= 0 else floor)
+            for term, (docs, tfs) in postings.items()
+        }
+        self.norm = (self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)).astype(np.float32) if self.n_docs else self.doc_len
+
+    def scores(self, query_tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in query_tokens:
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            docs, tfs, idf = entry
+            tf = tfs.astype(np.float32)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self.norm[docs])
+        return scores
+
+    def scores_batch(self, queries: List[List[str]]) -> np.ndarray:
+        """
+        多个查询一起打分，返回 (查询数, 片段数) 的得分矩阵：
+        每个词的 BM25 贡献只计算一次，再按各查询中该词的出现次数（查询-词矩阵）累加到对应行。
+        """
+        term_ids: Dict[str, int] = {}
+        for tokens in queries:
+            for term in tokens:
+                if term in self.postings:
+                    term_ids.setdefault(term, len(term_ids))
+        weights = np.zeros((len(queries), len(term_ids)), dtype=np.float32)
+        for row, tokens in enumerate(queries):
+            for term in tokens:
+                column = term_ids.get(term)
+                if column is not None:
+                    weights[row, column] += 1
+
+        scores = np.zeros((len(queries), self.n_docs), dtype=np.float32)
+        for term, column in term_ids.items():
+            docs, tfs, idf = self.postings[term]
+            tf = tfs.astype(np.float32)
+            contribution = idf * tf * (self.k1 + 1) / (tf + self.norm[docs])
+            rows = np.flatnonzero(weights[:, column])
+            scores[np.ix_(rows, docs)] += np.outer(weights[rows, column], contribution)
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int) -> List[int]:
+        scores = self.scores(query_tokens)
+        k = min(k, self.n_docs)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+
+class CorpusBM25Retriever(BaseRetriever):
+    """
+    基于 CorpusStore 的 BM25 检索器，只为前 k 个结果构造 Document。
+    """
+    store: Any
+    index: Any
+    preprocess: Callable[[str], List[str]] = str.split
+    k: int = 20
+
+    @classmethod
+    def from_store(cls, store: CorpusStore, preprocess: Callable[[str], List[str]] = str.split, text: str = "page_content", k: int = 20):
+        """
+        text="rerank" 时对去掉法律名称与章节标题的文本建索引。
+        """
+        get_text = store.rerank_text if text == "rerank" else store.page_content
+        index = BM25Index(preprocess(get_text(i)) for i in range(len(store)))
+        return cls(store=store, index=index, preprocess=preprocess, k=k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [self.store.document(i) for i in self.index.top_k(self.preprocess(query), self.k)]
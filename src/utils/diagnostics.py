@@ -0,0 +1,177 @@
+import sys
+import time
+import threading
+import traceback
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Optional
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, thread_prefix: Optional[str] = None) -> Counter:
+    """
+    统计式 CPU 采样：每隔 interval 秒读取一次所有线程的调用栈（sys._current_frames），
+    返回 {折叠后的调用栈: 采样次数}。不注入任何钩子，被采样的代码没有额外开销。
+    """
+    samples = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident, str(ident))
+            if ident == me or (thread_prefix and not name.startswith(thread_prefix)):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            samples[";".join([name] + stack[::-1])] += 1
+        time.sleep(interval)
+    return samples
+
+
+def collapsed(samples: Counter) -> str:
+    """
+    折叠栈格式（每行 "帧;帧;帧 次数"），可直接交给 flamegraph.pl、speedscope 或 inferno 生成火焰图。
+    """
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
+
+
+class Profiler:
+    """
+    同一时间只允许一个采样任务，避免并发采样叠加开销。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005, thread_prefix: Optional[str] = None) -> Optional[str]:
+        """
+        在当前线程中阻塞采样 seconds 秒，返回折叠栈；已有采样在运行时返回 None。
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return collapsed(sample_stacks(seconds, interval, thread_prefix))
+        finally:
+            self._lock.release()
+
+
+def thread_stacks() -> str:
+    """
+    所有线程的当前调用栈（文本）。
+    """
+    names = {thread.ident: thread for thread in threading.enumerate()}
+    lines = []
+    for ident, frame in sys._current_frames().items():
+        thread = names.get(ident)
+        name = thread.name if thread else str(ident)
+        daemon = " daemon" if thread is not None and thread.daemon else ""
+        lines.append(f'Thread "{name}" ({ident}){daemon}:')
+        lines.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+        lines.append("")
+    return "\n".join(lines)
+
+
+class MemoryTracer:
+    """
+    按需启用 tracemalloc：未启动时没有任何开销；启动后每次 snapshot 与上一次快照比较，
+    返回增长最多的分配位置。stop() 关闭跟踪并释放快照。
+    """
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    def start(self, nframes: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(nframes)
+            self._baseline = tracemalloc.take_snapshot()
+            return self._status()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+            return self._status()
+
+    def _status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": tracemalloc.is_tracing(), "traced_bytes": current, "peak_bytes": peak}
+
+    def snapshot(self, top: int = 30, key_type: str = "lineno") -> Dict[str, Any]:
+        """
+        返回当前占用最多的位置（top）以及相对上一次快照增长最多的位置（diff），并把本次快照作为新的基准。
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running; start it first")
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ])
+            result = {
+                **self._status(),
+                "top": [str(stat) for stat in snapshot.statistics(key_type)[:top]],
+                "diff": [str(stat) for stat in snapshot.compare_to(self._baseline, key_type)[:top]] if self._baseline else [],
+            }
+            self._baseline = snapshot
+            return result
+
+
+def torch_memory_stats() -> Dict[str, Any]:
+    """
+    torch 分配器统计。torch 尚未被加载时不主动导入。
+    """
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return {"loaded": False}
+    result: Dict[str, Any] = {"loaded": True, "num_threads": torch.get_num_threads(), "cuda": torch.cuda.is_available()}
+    if torch.cuda.is_available():
+        result["devices"] = [
+            {
+                "device": i,
+                "allocated_bytes": torch.cuda.memory_allocated(i),
+                "max_allocated_bytes": torch.cuda.max_memory_allocated(i),
+                "reserved_bytes": torch.cuda.memory_reserved(i),
+                "max_reserved_bytes": torch.cuda.max_memory_reserved(i),
+                "num_alloc_retries": torch.cuda.memory_stats(i).get("num_alloc_retries", 0),
+                "num_ooms": torch.cuda.memory_stats(i).get("num_ooms", 0),
+            }
+            for i in range(torch.cuda.device_count())
+        ]
+    return result
+
+
+def process_memory() -> Dict[str, Any]:
+    """
+    进程常驻内存（Linux 下读取 /proc/self/status），其他平台返回空。
+    """
+    result = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "VmSize", "Threads"):
+                    result[key] = value.strip()
+    except OSError:
+        pass
+    return result
+
+
+def install_stack_dump_signal(signum: Optional[int] = None) -> bool:
+    """
+    收到信号（默认 SIGUSR1）时把所有线程的调用栈输出到 stderr，只能在主线程中安装。
+    """
+    import signal
+    signum = signum if signum is not None else getattr(signal, "SIGUSR1", None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signum, lambda s, frame: print(thread_stacks(), file=sys.stderr, flush=True))
+    return True
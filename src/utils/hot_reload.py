@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import functools
+import threading
+import traceback
+import contextvars
+from typing import Callable, Dict, List, Any, Optional, Set, Tuple
+
+# SQLite 在读取时也可能改动的辅助文件，不作为数据变化的依据
+IGNORED_SUFFIXES = ("-wal", "-shm", "-journal", ".lock", ".tmp")
+
+
+def fingerprint(paths: List[str]) -> tuple:
+    """
+    路径（文件或目录，目录递归）下所有文件的 (路径, 修改时间, 大小)，不存在的路径记为空。
+    """
+    entries = []
+    for path in paths:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((path, stat.st_mtime_ns, stat.st_size))
+        elif os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file in files:
+                    if file.endswith(IGNORED_SUFFIXES):
+                        continue
+                    file_path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(file_path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((file_path, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(entries))
+
+
+def fresh_chroma_client(persist_directory: str) -> Tuple[Any, Any]:
+    """
+    创建一个不复用进程内缓存的 Chroma 客户端，返回 (客户端, 其 System)。
+
+    chromadb 按持久化路径缓存 System，同一路径的新客户端看不到其他进程写入的索引；
+    移除缓存后新建客户端即可读到最新数据，已有客户端（进行中的请求）不受影响。
+    被移出缓存的 System 不会自动停止，调用方在不再使用时调用 stop_chroma_system 释放其连接与索引。
+    """
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient._identifier_to_system.pop(persist_directory, None)
+    client = chromadb.PersistentClient(path=persist_directory)
+    return client, SharedSystemClient._identifier_to_system.get(persist_directory)
+
+
+def stop_chroma_system(system):
+    """
+    停止 System（关闭 SQLite 连接、释放 HNSW 段）。仍在缓存中的 System 先移出，避免新客户端取到已停止的实例。
+    """
+    from chromadb.api.client import SharedSystemClient
+    for identifier, cached in list(SharedSystemClient._identifier_to_system.items()):
+        if cached is system:
+            SharedSystemClient._identifier_to_system.pop(identifier, None)
+    try:
+        system.stop()
+    except Exception as e:
+        print(f"[Reload] 停止旧的 Chroma System 失败: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+class HotReloader:
+    """
+    监视数据文件，在后台重建发生变化的部分，并原子地替换服务状态。
+
+    - build(previous, changed) 返回新的状态对象，可复用 previous 中未变化的部分（如已加载的模型）；
+    - 请求开始时读取一次 reloader.state 并在整个请求中使用，替换不会影响进行中的请求；
+    - 用 pinned 装饰的请求处理函数在整个调用期间持有开始时的状态（其中读取 reloader.state 都得到该状态），
+      后台任务用 hold / release 持有状态；被替换的状态在所有持有者结束后交给 retire(旧状态, 仍在使用的状态) 释放资源；
+    - 文件停止变化 settle 秒后才重建，避免读到正在写入的索引；
+    - 重建失败时保留旧状态并记录日志；
+    - 收到 SIGHUP 时重建全部部分。
+    """
+
+    def __init__(
+        self,
+        build: Callable[[Any, Set[str]], Any],
+        sources: Dict[str, List[str]],
+        interval: float = 2.0,
+        settle: float = 5.0,
+        retire: Optional[Callable[[Any, List[Any]], None]] = None,
+    ):
+        self.build = build
+        self.sources = sources
+        self.interval = interval
+        self.settle = settle
+        self.retire = retire
+        self._state = build(None, set(sources))
+        self._pinned: contextvars.ContextVar = contextvars.ContextVar(f"pinned_state_{id(self)}", default=None)
+        # id(状态) -> 持有者数量；已被替换但仍有持有者的状态
+        self._holders: Dict[int, int] = {}
+        self._retiring: Dict[int, Any] = {}
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._fingerprints = {name: fingerprint(paths) for name, paths in sources.items()}
+        self._pending: Dict[str, float] = {}
+        self._requested: Set[str] = set()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def state(self):
+        pinned = self._pinned.get()
+        return pinned if pinned is not None else self._state
+
+    def hold(self, state=None):
+        """
+        持有 state（默认当前状态）直到对应的 release，期间它即使被替换也不会被释放。
+        """
+        with self._lock:
+            state = state if state is not None else self._state
+            self._holders[id(state)] = self._holders.get(id(state), 0) + 1
+            return state
+
+    def release(self, state):
+        with self._lock:
+            self._holders[id(state)] -= 1
+            if self._holders[id(state)]:
+                return
+            del self._holders[id(state)]
+            retired = self._retiring.pop(id(state), None)
+            live = self._live_states()
+        if retired is not None:
+            self._retire(retired, live)
+
+    def _live_states(self) -> List[Any]:
+        return [self._state, *self._retiring.values()]
+
+    def _retire(self, state, live: List[Any]):
+        if self.retire is None:
+            return
+        try:
+            self.retire(state, live)
+        except Exception:
+            traceback.print_exc()
+
+    def pinned(self, func):
+        """
+        装饰请求处理函数（同步或异步）：调用期间持有开始时的状态。
+        """
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                state = self.hold()
+                token = self._pinned.set(state)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._pinned.reset(token)
+                    self.release(state)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            state = self.hold()
+            token = self._pinned.set(state)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._pinned.reset(token)
+                self.release(state)
+        return wrapper
+
+    def request_reload(self, names: Optional[Set[str]] = None):
+        """
+        请求立即重建指定部分（默认全部），由后台线程执行。
+        """
+        with self._lock:
+            self._requested |= set(names or self.sources)
+        self._wakeup.set()
+
+    def _poll(self) -> Set[str]:
+        now = time.monotonic()
+        ready = set()
+        for name, paths in self.sources.items():
+            current = fingerprint(paths)
+            if current != self._fingerprints[name]:
+                # 仍在变化：重新计时
+                self._fingerprints[name] = current
+                self._pending[name] = now
+            elif name in self._pending and now - self._pending[name] >= self.settle:
+                del self._pending[name]
+                ready.add(name)
+        with self._lock:
+            ready |= self._requested
+            self._requested = set()
+        return ready
+
+    def _reload(self, changed: Set[str]):
+        start = time.perf_counter()
+        try:
+            state = self.build(self._state, changed)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            print(f"[Reload] 重建 {sorted(changed)} 失败，继续使用旧状态: {self.last_error}", file=sys.stderr)
+            return
+        with self._lock:
+            previous, self._state = self._state, state
+            if self._holders.get(id(previous)):
+                self._retiring[id(previous)] = previous
+                previous = None
+            live = self._live_states()
+        if previous is not None:
+            self._retire(previous, live)
+        self.reloads += 1
+        self.last_error = None
+        print(f"[Reload] 已重新加载 {sorted(changed)}，耗时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            changed = self._poll()
+            if changed:
+                self._reload(changed)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="hot-reload", daemon=True)
+            self._thread.start()
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+        return self
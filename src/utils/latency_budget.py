@@ -0,0 +1,175 @@
+import math
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from utils.corpus_store import strip_context
+
+# 与单查询检索一致：MMR 默认先取 20 个候选
+FETCH_K = 20
+
+# 各阶段耗时的初始估计（秒）；rerank_pair 为每个 (查询, 片段) 对的打分耗时
+DEFAULT_COSTS = {"self_query": 2.0, "vector": 0.1, "rerank_pair": 0.01}
+
+# 被跳过的阶段没有新的观测值，每跳过一次估计值衰减一点，负载下降后会重新尝试
+SKIP_DECAY = 0.9
+
+_self_query_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="budget-self-query")
+
+
+class Deadline:
+    """
+    单次请求的截止时间。budget_ms <= 0 表示不限时。
+    """
+
+    def __init__(self, budget_ms: float = 0):
+        self.budget = budget_ms / 1000 if budget_ms and budget_ms > 0 else None
+        self.start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def remaining(self) -> float:
+        return math.inf if self.budget is None else self.budget - self.elapsed()
+
+
+class StageCosts:
+    """
+    各检索阶段耗时的指数加权移动平均（EWMA），在请求间共享，用于判断剩余时间是否足够执行某个阶段。
+    """
+
+    def __init__(self, alpha: float = 0.2, defaults: Optional[Dict[str, float]] = None):
+        self.alpha = alpha
+        self._costs = dict(defaults or DEFAULT_COSTS)
+        self._counts = {stage: {"observed": 0, "skipped": 0} for stage in self._costs}
+        self._lock = threading.Lock()
+
+    def estimate(self, stage: str) -> float:
+        with self._lock:
+            return self._costs[stage]
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._costs[stage] += self.alpha * (seconds - self._costs[stage])
+            self._counts[stage]["observed"] += 1
+
+    def skipped(self, stage: str):
+        with self._lock:
+            self._costs[stage] *= SKIP_DECAY
+            self._counts[stage]["skipped"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {stage: {"estimate_ms": cost * 1000, **self._counts[stage]} for stage, cost in self._costs.items()}
+
+
+def _construct_remote(self_query_retriever, query: str, timeout: float) -> Tuple[str, Optional[Dict[str, Any]]]:
+    # configurable_fields 包装后的 SelfQueryRetriever 位于 .default
+    retriever = getattr(self_query_retriever, "default", self_query_retriever)
+    future = _self_query_executor.submit(
+        contextvars.copy_context().run,
+        retriever.query_constructor.invoke,
+        {"query": query}
+    )
+    structured_query = future.result(timeout=None if math.isinf(timeout) else timeout)
+    new_query, search_kwargs = retriever._prepare_query(query, structured_query)
+    return new_query, search_kwargs.get("filter")
+
+
+def budgeted_search(
+    query: str,
+    k: int,
+    vectorstore,
+    self_query_retriever,
+    deadline: Deadline,
+    costs: StageCosts,
+    local_constructor=None,
+    threshold: float = 0.8,
+    score_pairs: Optional[Callable] = None,
+    fetch_k: int = FETCH_K,
+    lambda_mult: float = 0.5,
+    with_scores: bool = False,
+) -> Tuple[List[Any], Dict[str, Any]]:
+    """
+    与 search_law_articles 相同的流水线（过滤条件构造 → MMR → 可选重排序），但每个阶段开始前按 EWMA 估计的耗时
+    与剩余时间决定是否执行，返回 (结果, 各阶段的执行情况)：
+    - self_query：剩余时间扣除后续阶段的预留后仍够调用 LLM 时才构造过滤条件，并以剩余时间为超时；
+      否则使用本地规则的结果（local_first）或不加过滤的向量检索；
+    - vector：剩余时间不足两次向量检索时，fetch_k 缩小到最终需要的候选数；
+    - rerank：剩余时间不足以为 k 个候选打分时跳过重排序；只够部分候选时，只对排在前面的候选重排序。
+    with_scores=True 时结果为 [(doc, 重排序得分)]，未经重排序的候选得分为 None。
+    """
+    stages: Dict[str, Any] = {}
+    rerank_k = k * 4
+
+    # --- 过滤条件 ---
+    text, where, confident = query, None, False
+    if local_constructor is not None:
+        where, confidence = local_constructor.parse(query)
+        confident = confidence >= threshold
+        stages["self_query"] = "local"
+    if not confident:
+        reserve = costs.estimate("vector") + (costs.estimate("rerank_pair") * rerank_k if score_pairs else 0)
+        allowed = deadline.remaining() - reserve
+        if self_query_retriever is not None and costs.estimate("self_query") <= allowed:
+            start = time.perf_counter()
+            try:
+                text, where = _construct_remote(self_query_retriever, query, allowed)
+                stages["self_query"] = "llm"
+                costs.observe("self_query", time.perf_counter() - start)
+            except FutureTimeoutError:
+                # 实际耗时至少为 allowed，按不低于当前估计的值记录
+                stages["self_query"] = "timeout"
+                costs.observe("self_query", max(time.perf_counter() - start, costs.estimate("self_query")))
+            except Exception:
+                stages["self_query"] = "error"
+        else:
+            stages["self_query"] = "skipped"
+            costs.skipped("self_query")
+        if stages["self_query"] != "llm" and local_constructor is None:
+            text, where = query, None
+
+    # --- 向量检索 ---
+    remaining = deadline.remaining()
+    vector_cost = costs.estimate("vector")
+    rerank = score_pairs is not None and remaining - vector_cost >= costs.estimate("rerank_pair") * k
+    n_candidates = rerank_k if rerank else k
+    full_fetch_k = max(fetch_k, n_candidates)
+    stage_fetch_k = full_fetch_k if remaining >= 2 * vector_cost else n_candidates
+    start = time.perf_counter()
+    docs = vectorstore.max_marginal_relevance_search(
+        text, k=n_candidates, fetch_k=stage_fetch_k, lambda_mult=lambda_mult, filter=where
+    )
+    costs.observe("vector", time.perf_counter() - start)
+    stages["vector"] = {"fetch_k": stage_fetch_k, "full_fetch_k": full_fetch_k, "filter": bool(where)}
+
+    # --- 重排序 ---
+    scores_by_doc: Dict[int, float] = {}
+    if score_pairs is not None:
+        per_pair = costs.estimate("rerank_pair")
+        remaining = deadline.remaining()
+        n_scored = len(docs) if math.isinf(remaining) else min(len(docs), int(remaining / per_pair))
+        if rerank and n_scored >= min(k, len(docs)):
+            head = docs[:n_scored]
+            if head:
+                start = time.perf_counter()
+                scores = score_pairs([(query, strip_context(doc.page_content)) for doc in head])
+                costs.observe("rerank_pair", (time.perf_counter() - start) / len(head))
+                ranked = sorted(zip(head, scores), key=lambda x: x[1], reverse=True)
+                scores_by_doc = {id(doc): float(score) for doc, score in ranked}
+                docs = [doc for doc, _ in ranked] + docs[n_scored:]
+            stages["rerank"] = "full" if n_scored == len(docs) else f"partial {n_scored}/{len(docs)}"
+        else:
+            stages["rerank"] = "skipped"
+            costs.skipped("rerank_pair")
+
+    degraded = (
+        stages.get("self_query") in ("skipped", "timeout", "error")
+        or stage_fetch_k < full_fetch_k
+        or stages.get("rerank", "full") != "full"
+    )
+    report = {"stages": stages, "degraded": degraded}
+    if with_scores:
+        return [(doc, scores_by_doc.get(id(doc))) for doc in docs[:k]], report
+    return docs[:k], report
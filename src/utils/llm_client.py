@@ -0,0 +1,364 @@
+import os
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import weakref
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+import httpx
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+# --- 全局配置（环境变量） ---
+# STD_MIGRATION_LLM_MAX_CONCURRENCY: 进程内所有模型的并发请求上限
+# STD_MIGRATION_LLM_MODEL_CONCURRENCY: 单个模型的并发请求上限
+# STD_MIGRATION_LLM_RPS: 单个模型每秒请求数上限，0 表示不限速
+# STD_MIGRATION_LLM_MAX_CONNECTIONS: 共享 HTTP 连接池的连接数上限
+MAX_CONCURRENCY = int(os.getenv("STD_MIGRATION_LLM_MAX_CONCURRENCY", "16"))
+MODEL_CONCURRENCY = int(os.getenv("STD_MIGRATION_LLM_MODEL_CONCURRENCY", "8"))
+REQUESTS_PER_SECOND = float(os.getenv("STD_MIGRATION_LLM_RPS", "0"))
+MAX_CONNECTIONS = int(os.getenv("STD_MIGRATION_LLM_MAX_CONNECTIONS", "32"))
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional["LoopLocalAsyncClient"] = None
+_llms: Dict[tuple, "PooledChatOpenAI"] = {}
+_rate_limiters: Dict[str, InMemoryRateLimiter] = {}
+
+# 单飞（single flight）：相同请求并发时只发出一次；异步请求的 Future 属于各自的事件循环
+_sync_inflight: Dict[str, Dict[str, Any]] = {}
+_async_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = weakref.WeakKeyDictionary()
+
+# 每个模型的调用统计
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+class ConcurrencyLimit:
+    """
+    同步与异步调用共用的并发上限（不绑定事件循环）。
+    等待者按先来先得排队；释放名额时直接转交给队首等待者，线程用 Event 唤醒，协程通过其事件循环唤醒。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def _try_acquire(self) -> bool:
+        if self.used < self.limit and not self._waiters:
+            self.used += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = {"event": threading.Event(), "handed": False}
+            self._waiters.append(waiter)
+        waiter["event"].wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = {"loop": loop, "future": loop.create_future(), "handed": False}
+            self._waiters.append(waiter)
+        try:
+            await waiter["future"]
+        except asyncio.CancelledError:
+            with self._lock:
+                handed = waiter["handed"]
+                if not handed:
+                    self._waiters.remove(waiter)
+            # 名额已转交但等待者被取消，转给下一个
+            if handed:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter["handed"] = True
+                if "event" in waiter:
+                    waiter["event"].set()
+                    return
+                try:
+                    waiter["loop"].call_soon_threadsafe(_wake, waiter["future"])
+                    return
+                except RuntimeError:
+                    # 等待者所在的事件循环已关闭
+                    continue
+            self.used -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+# 并发控制：同步与异步路径共用同一组上限
+_global_limit = ConcurrencyLimit(MAX_CONCURRENCY)
+_model_limits: Dict[str, ConcurrencyLimit] = {}
+
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """
+    为每个事件循环维护独立连接池的 httpx.AsyncClient：连接绑定创建它的事件循环，
+    同一个 LLM 实例在不同事件循环（如多次 asyncio.run、不同线程）中使用时各自建立连接。
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._clients_lock = threading.Lock()
+
+    def _loop_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = httpx.AsyncClient(**self._client_kwargs)
+            return client
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await self._loop_client().send(request, **kwargs)
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_CONNECTIONS,
+        keepalive_expiry=60.0
+    )
+
+
+def get_http_clients():
+    """
+    返回进程内共享的 (同步, 异步) httpx 客户端，所有 LLM 共用同一个 keep-alive 连接池（异步客户端每个事件循环一个）。
+    """
+    global _http_client, _async_http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_limits(), timeout=httpx.Timeout(120.0))
+            _async_http_client = LoopLocalAsyncClient(limits=_limits(), timeout=httpx.Timeout(120.0))
+    return _http_client, _async_http_client
+
+
+def _model_limit(model: str) -> ConcurrencyLimit:
+    with _lock:
+        return _model_limits.setdefault(model, ConcurrencyLimit(MODEL_CONCURRENCY))
+
+
+def _loop_inflight() -> Dict[str, asyncio.Future]:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        return _async_inflight.setdefault(loop, {})
+
+
+class _LeaderCancelled(Exception):
+    """
+    发出请求的协程被取消。等待同一请求的其他协程收到该异常后重新发起请求，而不是随之被取消。
+    """
+
+
+def _record(model: str, latency: float, result: Optional[ChatResult] = None, error: bool = False, deduplicated: bool = False):
+    with _lock:
+        stats = _stats.setdefault(model, {
+            "calls": 0, "errors": 0, "deduplicated": 0,
+            "latency_total": 0.0, "latency_max": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        })
+        if deduplicated:
+            stats["deduplicated"] += 1
+            return
+        stats["calls"] += 1
+        stats["errors"] += int(error)
+        stats["latency_total"] += latency
+        stats["latency_max"] = max(stats["latency_max"], latency)
+        usage = ((result.llm_output or {}).get("token_usage") or {}) if result is not None else {}
+        stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        stats["completion_tokens"] += usage.get("completion_tokens") or 0
+
+
+def get_llm_stats() -> Dict[str, Dict[str, float]]:
+    """
+    返回各模型的调用次数、错误数、合并的重复请求数、延迟与 token 用量。
+    """
+    with _lock:
+        result = {}
+        for model, stats in _stats.items():
+            result[model] = dict(stats)
+            result[model]["latency_avg"] = stats["latency_total"] / stats["calls"] if stats["calls"] else 0.0
+        return result
+
+
+class PooledChatOpenAI(ChatOpenAI):
+    """
+    共享连接池的 ChatOpenAI：
+    - 全局与按模型的并发上限（同步与异步调用共用）、按模型的限速；
+    - 相同的并发请求（模型、消息、参数均相同）合并为一次调用；发出请求的调用被取消时，由等待者之一重新发出；
+    - 记录每次调用的延迟与 token 用量。
+    流式调用只受并发上限约束，不做合并。
+    """
+
+    def _flight_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {
+                "base_url": self.openai_api_base,
+                "params": self._default_params,
+                "messages": [m.model_dump() for m in messages],
+                "stop": stop,
+                "kwargs": kwargs,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._flight_key(messages, stop, kwargs)
+        with _lock:
+            flight = _sync_inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"event": threading.Event(), "result": None, "error": None}
+                _sync_inflight[key] = flight
+
+        if not leader:
+            flight["event"].wait()
+            _record(self.model_name, 0.0, deduplicated=True)
+            if flight["error"] is not None:
+                raise flight["error"]
+            return copy.deepcopy(flight["result"])
+
+        start = time.perf_counter()
+        try:
+            with _global_limit, _model_limit(self.model_name):
+                result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            flight["result"] = result
+            _record(self.model_name, time.perf_counter() - start, result)
+            return result
+        except Exception as e:
+            flight["error"] = e
+            _record(self.model_name, time.perf_counter() - start, error=True)
+            raise
+        finally:
+            with _lock:
+                _sync_inflight.pop(key, None)
+            flight["event"].set()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._flight_key(messages, stop, kwargs)
+        inflight = _loop_inflight()
+        while key in inflight:
+            try:
+                result = await asyncio.shield(inflight[key])
+            except _LeaderCancelled:
+                # 原请求方被取消，第一个醒来的等待者接手发出请求
+                continue
+            _record(self.model_name, 0.0, deduplicated=True)
+            return copy.deepcopy(result)
+
+        future = asyncio.get_running_loop().create_future()
+        inflight[key] = future
+        start = time.perf_counter()
+        try:
+            async with _global_limit, _model_limit(self.model_name):
+                result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            future.set_result(result)
+            _record(self.model_name, time.perf_counter() - start, result)
+            return result
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            _record(self.model_name, time.perf_counter() - start, error=True)
+            raise
+        finally:
+            inflight.pop(key, None)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            with _global_limit, _model_limit(self.model_name):
+                yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        finally:
+            _record(self.model_name, time.perf_counter() - start)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with _global_limit, _model_limit(self.model_name):
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    yield chunk
+        finally:
+            _record(self.model_name, time.perf_counter() - start)
+
+
+def get_llm(model: str = None, api_key: str = None, base_url: str = None, temperature: float = 0) -> PooledChatOpenAI:
+    """
+    获取共享的 LLM 客户端。未指定的参数取自 STD_MIGRATION_MODEL / STD_MIGRATION_API_KEY / STD_MIGRATION_URL。
+    相同配置的调用方共享同一个实例、同一个连接池与限流器。
+    """
+    model = model or os.getenv("STD_MIGRATION_MODEL")
+    api_key = api_key or os.getenv("STD_MIGRATION_API_KEY")
+    base_url = base_url or os.getenv("STD_MIGRATION_URL")
+    key = (model, api_key, base_url, temperature)
+
+    http_client, async_http_client = get_http_clients()
+    with _lock:
+        llm = _llms.get(key)
+        if llm is not None:
+            return llm
+        rate_limiter = None
+        if REQUESTS_PER_SECOND > 0:
+            rate_limiter = _rate_limiters.setdefault(
+                model, InMemoryRateLimiter(requests_per_second=REQUESTS_PER_SECOND, max_bucket_size=max(1, int(REQUESTS_PER_SECOND)))
+            )
+        llm = PooledChatOpenAI(
+            model=model,
+            api_key=api_key,
+            base_url=base_url,
+            temperature=temperature,
+            http_client=http_client,
+            http_async_client=async_http_client,
+            rate_limiter=rate_limiter,
+        )
+        _llms[key] = llm
+        return llm
@@ -0,0 +1,156 @@
+import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.runnables import ConfigurableField
+
+LAW_NUMBER_PATTERN = re.compile(r"(?:\b(?:N|№)\s*)?(\d+)\s*-\s*ФЗ", re.IGNORECASE)
+LAW_NUMBER_AFTER_WORD_PATTERN = re.compile(r"закон\w*\s+(?:от\s+\d{2}\.\d{2}\.\d{4}\s+)?(?:N|№)?\s*(\d+)\b", re.IGNORECASE)
+ARTICLE_PATTERN = re.compile(r"(?:\bстать\w*|\bст\.)\s*(\d+(?:\.\d+)*(?:-\d+)?)", re.IGNORECASE)
+SUBCLAUSE_PATTERN = re.compile(r"(?:\bподпункт\w*|\bпп\.)\s*(\d+(?:\.\d+)*|[а-я])\)?", re.IGNORECASE)
+CLAUSE_PATTERN = re.compile(r"(?:(?<!под)\bпункт\w*|(?<!п)\bп\.)\s*(\d+(?:\.\d+)*(?:-\d+)?)", re.IGNORECASE)
+VAGUE_LAW_PATTERN = re.compile(r"\b(?:закон\w*|кодекс\w*|указ\w*|постановлени\w*|глав\w*)\b", re.IGNORECASE)
+
+
+def law_name_pattern(law_title: str) -> Optional[re.Pattern]:
+    # 从 'Федеральный закон "О гражданстве Российской Федерации" от ...' 中取出引号内名称，
+    # 用 "о" 之后的前两个词（取词干前 6 个字符）匹配查询中不同格的写法
+    m = re.search(r'"([^"]+)"', law_title)
+    if not m:
+        return None
+    words = m.group(1).lower().replace("ё", "е").split()
+    if len(words) < 3 or words[0] != "о":
+        return None
+    stems = [re.escape(word[:6]) + r"\w*" for word in words[1:3]]
+    return re.compile(r"\bо\s+" + r"\s+".join(stems), re.IGNORECASE)
+
+
+class LocalQueryConstructor:
+    """
+    基于规则的本地查询构造器，替代 SelfQueryRetriever 中由 LLM 生成元数据过滤条件的步骤。
+
+    识别查询中的法律编号（"115-ФЗ"、"Федерального закона 115"）、法律名称、条（Статья）、
+    款（Пункт）、项（Подпункт），生成 Chroma 的 where 过滤条件，并给出置信度：
+    - 没有任何结构化引用：纯语义查询，不加过滤，置信度高；
+    - 法律与条文编号都能在语料中唯一确定：置信度高；
+    - 只出现条文编号且多部法律都有该编号、出现未知的法律编号、或只有 "закон" 等模糊指代：置信度低，应交给 LLM。
+    """
+
+    def __init__(self, article_store: Dict[Tuple[int, str], Dict[str, Any]]):
+        self.known_articles = set(article_store)
+        self.known_laws = {law_index for law_index, _ in article_store}
+        self.law_names = {}
+        for (law_index, _), article in article_store.items():
+            if law_index not in self.law_names:
+                pattern = law_name_pattern(article["law_title"])
+                if pattern is not None:
+                    self.law_names[law_index] = pattern
+
+    def parse(self, query: str) -> Tuple[Optional[Dict[str, Any]], float]:
+        """
+        返回 (where 过滤条件或 None, 置信度 0~1)。
+        """
+        text = query.replace("ё", "е").replace("Ё", "Е")
+
+        law_numbers = {int(n) for n in LAW_NUMBER_PATTERN.findall(text)}
+        law_numbers |= {int(n) for n in LAW_NUMBER_AFTER_WORD_PATTERN.findall(text)}
+        law_names = {law_index for law_index, pattern in self.law_names.items() if pattern.search(text)}
+        articles = ARTICLE_PATTERN.findall(text)
+        clauses = CLAUSE_PATTERN.findall(text)
+        subclauses = SUBCLAUSE_PATTERN.findall(text)
+
+        laws = law_numbers | law_names
+        if not laws and not articles and not clauses and not subclauses:
+            if VAGUE_LAW_PATTERN.search(text):
+                # 提到了某部法律/章节，但无法确定是哪一部
+                return None, 0.5
+            return None, 0.9
+
+        if len(laws) > 1 or len(articles) > 1 or any(law not in self.known_laws for law in laws):
+            return None, 0.3
+
+        conditions = []
+        confidence = 0.95
+        law_index = next(iter(laws), None)
+        article_index = articles[0].rstrip(".") if articles else None
+
+        if law_index is None and article_index is not None:
+            # 没有指明法律时，只有当该条文编号在语料中唯一时才能确定
+            candidates = [law for law, article in self.known_articles if article == article_index]
+            if len(candidates) != 1:
+                return None, 0.4
+            law_index = candidates[0]
+            confidence = 0.8
+
+        if law_index is not None:
+            conditions.append({"law_index": {"$eq": law_index}})
+        if article_index is not None:
+            if (law_index, article_index) not in self.known_articles:
+                return None, 0.3
+            conditions.append({"article_index": {"$eq": article_index}})
+        if clauses and article_index is not None:
+            conditions.append({"clause_index": {"$eq": clauses[0]}})
+        if subclauses and clauses and article_index is not None:
+            conditions.append({"subclause_index": {"$eq": subclauses[0]}})
+
+        if not conditions:
+            return None, 0.4
+        where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+        return where, confidence
+
+
+class LocalFirstRetriever(BaseRetriever):
+    """
+    先用本地规则构造过滤条件并直接检索；仅当置信度低于阈值时才调用远程 SelfQueryRetriever，
+    远程调用超时或失败（如网络中断）时退回本地结果，保证检索始终可用。
+    """
+    vectorstore: Any
+    remote_retriever: Any
+    query_constructor: Any
+    threshold: float = 0.8
+    remote_timeout: float = 10.0
+    search_kwargs: Dict[str, Any] = {"k": 20}
+
+    def _local_search(self, query: str, where: Optional[Dict[str, Any]]) -> List[Document]:
+        k = self.search_kwargs.get("k", 20)
+        return self.vectorstore.max_marginal_relevance_search(query, k=k, filter=where)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        where, confidence = self.query_constructor.parse(query)
+        if confidence >= self.threshold:
+            return self._local_search(query, where)
+
+        # 复制当前上下文，使远程检索与本地检索使用同一请求上下文（如快照版本）
+        future = _remote_executor.submit(
+            contextvars.copy_context().run,
+            self.remote_retriever.invoke,
+            query,
+            {"configurable": {"search_kwargs_id": self.search_kwargs}}
+        )
+        try:
+            return future.result(timeout=self.remote_timeout)
+        except Exception:
+            # 远程 LLM 不可用或超时（FutureTimeoutError）：退回本地检索
+            return self._local_search(query, where)
+
+
+_remote_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="remote-self-query")
+
+
+def get_local_first_retriever(vectorstore, remote_retriever, article_store, threshold=0.8, remote_timeout=10.0):
+    return LocalFirstRetriever(
+        vectorstore=vectorstore,
+        remote_retriever=remote_retriever,
+        query_constructor=LocalQueryConstructor(article_store),
+        threshold=threshold,
+        remote_timeout=remote_timeout,
+    ).configurable_fields(
+        search_kwargs=ConfigurableField(
+            id="search_kwargs_id",
+            name="Search Kwargs",
+            description="控制返回文档的数量"
+        )
+    )
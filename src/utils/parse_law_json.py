@@ -1,6 +1,18 @@
+import json
+import hashlib
 from typing import List, Dict, Any
 from langchain_core.documents import Document
 
+# --- 片段 ID：由内容与元数据哈希得到，内容不变则 ID 不变，便于缓存校验与增量更新 ---
+def chunk_id(doc: Document) -> str:
+    payload = json.dumps(
+        {"page_content": doc.page_content, "metadata": doc.metadata},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
 # --- 辅助函数：解析JSON并创建增强型文档 ---
 def parse_law_json_to_docs(data: Dict[str, Any]) -> List[Document]:
     documents = []
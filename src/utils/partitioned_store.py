@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_chroma import Chroma
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+
+
+def law_partition_name(collection_name: str, law_index: int) -> str:
+    return f"{collection_name}__law_{law_index}"
+
+
+def chapter_partition_name(collection_name: str, law_index: int, chapter_index: str) -> str:
+    return f"{collection_name}__ch_{law_index}_{chapter_index}"
+
+
+def partition_key(metadata: Dict[str, Any], partition_by: str):
+    """
+    片段所属分区：按法律分区为 law_index，按章节分区为 (law_index, chapter_index)。
+    """
+    if partition_by == "law":
+        return metadata["law_index"]
+    return metadata["law_index"], metadata["chapter_index"]
+
+
+def _equalities(where: Optional[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    从 where 过滤条件中取出对各字段的等值约束 {field: [可取值]}。
+    只处理顶层字段与 $and 连接的条件；$or 等无法据此缩小范围，视为无约束。
+    """
+    if not where:
+        return {}
+    result = {}
+    conditions = where["$and"] if "$and" in where else [where]
+    for condition in conditions:
+        for field, value in condition.items():
+            if field.startswith("$"):
+                continue
+            if not isinstance(value, dict):
+                result[field] = [value]
+            elif "$eq" in value:
+                result[field] = [value["$eq"]]
+            elif "$in" in value:
+                result[field] = list(value["$in"])
+    return result
+
+
+class PartitionedChroma(VectorStore):
+    """
+    按法律（可选按章节）分区的 Chroma 向量库，分区由 scripts/build_chromadb.py --partition_by 生成。
+
+    - where 条件能确定法律（及章节）时，只在对应分区内检索（chapter 模式下同时存在法律分区与章节分区）；
+    - 否则并行检索所有分区，按距离合并结果；
+    - MMR 在合并后的候选集上进行，与单一集合上的行为一致。
+    查询向量只计算一次，由各分区共用。新增法律只增加分区，不影响其他法律的检索耗时。
+    """
+
+    def __init__(self, collection_name: str, persist_directory: str, embedding_function, max_workers: int = 8, client=None):
+        self.collection_name = collection_name
+        self._embedding_function = embedding_function
+        base = Chroma(
+            collection_name=collection_name,
+            persist_directory=None if client is not None else persist_directory,
+            embedding_function=embedding_function,
+            client=client
+        )
+        self._client = base._client
+
+        names = [c if isinstance(c, str) else c.name for c in self._client.list_collections()]
+        law_prefix, chapter_prefix = f"{collection_name}__law_", f"{collection_name}__ch_"
+        self.law_partitions: Dict[int, Chroma] = {}
+        self.chapter_partitions: Dict[Tuple[int, str], Chroma] = {}
+        for name in names:
+            if name.startswith(law_prefix):
+                key = int(name[len(law_prefix):])
+                target = self.law_partitions
+            elif name.startswith(chapter_prefix):
+                law_index, chapter_index = name[len(chapter_prefix):].split("_", 1)
+                key = (int(law_index), chapter_index)
+                target = self.chapter_partitions
+            else:
+                continue
+            target[key] = Chroma(client=self._client, collection_name=name, embedding_function=embedding_function)
+
+        if not self.law_partitions and not self.chapter_partitions:
+            raise ValueError(
+                f"No partitions of collection '{collection_name}' found in {persist_directory}. "
+                f"Rebuild it with scripts/build_chromadb.py --partition_by law|chapter."
+            )
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="partition-search")
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def route(self, where: Optional[Dict[str, Any]]) -> List[Chroma]:
+        """
+        根据 where 条件选出需要检索的分区。
+        """
+        equalities = _equalities(where)
+        laws = equalities.get("law_index")
+        chapters = equalities.get("chapter_index")
+
+        # 章节分区只在指定了章节时使用，否则按法律分区检索，避免对大量小分区扇出
+        if self.chapter_partitions and (chapters is not None or not self.law_partitions):
+            return [
+                store for (law_index, chapter_index), store in self.chapter_partitions.items()
+                if (laws is None or law_index in laws) and (chapters is None or chapter_index in chapters)
+            ]
+
+        return [
+            store for law_index, store in self.law_partitions.items()
+            if laws is None or law_index in laws
+        ]
+
+    def _query(self, embedding: List[float], k: int, where: Optional[Dict[str, Any]], include_embeddings: bool = False):
+        """
+        在选中的分区上并行检索，返回按距离升序合并的前 k 个 (Document, distance, embedding)。
+        """
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+
+        def search(store: Chroma):
+            count = store._collection.count()
+            if count == 0:
+                return []
+            result = store._collection.query(
+                query_embeddings=[embedding],
+                n_results=min(k, count),
+                where=where or None,
+                include=include
+            )
+            embeddings = result["embeddings"][0] if include_embeddings else [None] * len(result["ids"][0])
+            return [
+                (Document(page_content=text, metadata=metadata or {}, id=doc_id), distance, vector)
+                for doc_id, text, metadata, distance, vector in zip(
+                    result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0], embeddings
+                )
+            ]
+
+        partitions = self.route(where)
+        if len(partitions) == 1:
+            hits = search(partitions[0])
+        else:
+            hits = [hit for part in self._executor.map(search, partitions) for hit in part]
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:k]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Tuple[Document, float]]:
+        return [(doc, distance) for doc, distance, _ in self._query(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _, _ in self._query(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k, filter)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        hits = self._query(embedding, max(k, fetch_k), filter, include_embeddings=True)
+        if not hits:
+            return []
+        selected = maximal_marginal_relevance(
+            np.array(embedding, dtype=np.float32),
+            [vector for _, _, vector in hits],
+            k=k,
+            lambda_mult=lambda_mult
+        )
+        return [hits[i][0] for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding_function.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    def _select_relevance_score_fn(self):
+        # 与 Chroma 默认的 l2 距离一致
+        return self._euclidean_relevance_score_fn
+
+    def get(self, where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        """
+        合并各分区的 Collection.get 结果，供 BM25 等需要全部片段的检索器使用。
+        """
+        merged: Dict[str, Any] = {}
+        for store in self.route(where):
+            result = store.get(where=where, include=include or ["documents", "metadatas"], **kwargs)
+            for key, value in result.items():
+                if isinstance(value, list):
+                    merged.setdefault(key, []).extend(value)
+        return merged
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("PartitionedChroma is read-only; build partitions with scripts/build_chromadb.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("PartitionedChroma is read-only; build partitions with scripts/build_chromadb.py")
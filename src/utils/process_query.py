@@ -1,44 +1,47 @@
-import re
-from utils.abbreviation_map import ABBREVIATION_MAP
+import os
+from functools import lru_cache
+from typing import List
+from utils.abbreviation_map import ABBREVIATION_FILE, load_abbreviation_map
+from utils.abbreviation_matcher import AbbreviationMatcher
+
+
+@lru_cache(maxsize=8)
+def _get_matcher(path: str, mtime: float) -> AbbreviationMatcher:
+    version, entries = load_abbreviation_map(path)
+    return AbbreviationMatcher(entries, version=version)
+
+
+def get_abbreviation_matcher(path: str = ABBREVIATION_FILE) -> AbbreviationMatcher:
+    """
+    返回编译好的缩写匹配器。自动机只在首次调用或数据文件更新后构建一次。
+    """
+    mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+    return _get_matcher(path, mtime)
+
+
+def expand_abbreviations(text):
+    """
+    展开文本中的缩写，返回 (处理后文本, 替换次数)。
+    """
+    return get_abbreviation_matcher().expand(text)
+
 
 def process_text_with_case_preservation(text):
     """
     处理文本中的俄语缩写，进行不区分大小写的匹配，并保留原始文本的大小写。
     同时处理缩写前后没有空格的混合文本情况。
     """
+    # 替换格式为 "全称 (原缩写)"
+    processed_query, _ = expand_abbreviations(text)
+    return processed_query
 
-    # 1. 构建所有缩写的正则表达式，不区分大小写
-    regex_abbreviations = '|'.join(re.escape(abbr) for abbr in ABBREVIATION_MAP.keys())
-    
-    # 2. 定义非西里尔字母的字符集作为单词边界
-    non_cyrillic_before = r'(?<![а-яА-Я])'  # 前面不是西里尔
-    non_cyrillic_after  = r'(?![а-яА-Я])'   # 后面不是西里尔
-    
-    # 3. 组合最终的正则表达式    
-    regex_pattern = re.compile(
-        f'{non_cyrillic_before}({regex_abbreviations}){non_cyrillic_after}',
-        re.IGNORECASE
-    )
-
-    def replacement_callback(match):
-        """
-        回调函数，根据匹配到的原始文本（match.group(1)）进行替换。
-        """
-        # 获取匹配到的原始缩写，例如 'РВП'
-        original_abbr = match.group(1)
-        # 将其转换为小写，从映射中查找全称
-        full_name = ABBREVIATION_MAP.get(original_abbr.lower())
-        
-        # 我们可以根据需要决定如何格式化替换文本
-        # 比如：返回"全称 (缩写)"
-        return f'\"{full_name} ({original_abbr})\"'
-        # 或者只返回全称
-        # return full_name
-
-    # 使用 re.sub() 和回调函数进行替换
-    processed_query = regex_pattern.sub(replacement_callback, text)
 
-    return processed_query
+def process_texts_with_case_preservation(texts: List[str]) -> List[str]:
+    """
+    批量版本，供基准测试与批量 Agent 使用；整批共享同一个匹配器。
+    """
+    matcher = get_abbreviation_matcher()
+    return [matcher.expand(text)[0] for text in texts]
 
 
 def preprocess_data(input_data):
@@ -48,3 +51,10 @@ def preprocess_data(input_data):
     if 'user_query' in input_data:
         input_data['user_query'] = process_text_with_case_preservation(input_data['user_query'])
     return input_data
+
+
+def preprocess_batch(inputs: List[dict]) -> List[dict]:
+    """
+    preprocess_data 的批量版本。
+    """
+    return [preprocess_data(input_data) for input_data in inputs]
@@ -0,0 +1,221 @@
+import os
+import json
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+from utils.corpus_store import CorpusStore
+
+# --- 索引目录结构（由 scripts/build_quantized_index.py 生成） ---
+# manifest.json    {"count", "dim", "modes", "collection"}
+# ids.json         行号 -> 片段 ID
+# vectors.f32      全精度向量，按需内存映射，只在重打分时读取候选行
+# int8.codes       int8 标量量化向量（每维独立缩放），int8.scale.npy 为各维缩放系数
+# binary.codes     符号位二值化向量（np.packbits）
+MODES = ("int8", "binary")
+
+# 每个字节中 1 的个数，用于计算汉明距离
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# 第一阶段按块计算，避免一次性把整个量化矩阵转换为浮点
+BLOCK_ROWS = 65536
+
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按维度对称量化：scale[d] = max|x[:, d]| / 127，codes = round(x / scale)。
+    """
+    scale = np.abs(embeddings).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(embeddings / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def quantize_binary(embeddings: np.ndarray) -> np.ndarray:
+    return np.packbits(embeddings > 0, axis=1)
+
+
+def write_quantized_index(output_dir: str, ids: List[str], embeddings: np.ndarray, modes=MODES, collection: str = ""):
+    """
+    写入全精度向量与各量化版本。embeddings 应为已归一化的向量。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    embeddings.tofile(os.path.join(output_dir, "vectors.f32"))
+    if "int8" in modes:
+        codes, scale = quantize_int8(embeddings)
+        codes.tofile(os.path.join(output_dir, "int8.codes"))
+        np.save(os.path.join(output_dir, "int8.scale.npy"), scale)
+    if "binary" in modes:
+        quantize_binary(embeddings).tofile(os.path.join(output_dir, "binary.codes"))
+    with open(os.path.join(output_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": len(ids), "dim": embeddings.shape[1], "modes": list(modes), "collection": collection}, f, indent=2)
+
+
+class QuantizedIndex:
+    """
+    两阶段向量检索：
+    1. 在量化向量上粗排（int8 点积或二值汉明距离），取 k * rescore_factor 个候选；
+    2. 只读取候选行的全精度向量（内存映射）重新计算内积，取前 k 个。
+    量化向量常驻内存，全精度向量留在磁盘上由操作系统按需缓存。
+    """
+
+    def __init__(self, index_dir: str, mode: str = "int8", rescore_factor: int = 4):
+        if mode not in MODES and mode != "float":
+            raise ValueError(f"Unsupported quantization mode: {mode}")
+        with open(os.path.join(index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(index_dir, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids: List[str] = json.load(f)
+        self.mode = mode
+        self.rescore_factor = rescore_factor
+        count, dim = self.manifest["count"], self.manifest["dim"]
+        self.vectors = np.memmap(os.path.join(index_dir, "vectors.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+        if mode == "int8":
+            self.codes = np.fromfile(os.path.join(index_dir, "int8.codes"), dtype=np.int8).reshape(count, dim)
+            self.scale = np.load(os.path.join(index_dir, "int8.scale.npy"))
+        elif mode == "binary":
+            self.codes = np.fromfile(os.path.join(index_dir, "binary.codes"), dtype=np.uint8).reshape(count, -1)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def memory_bytes(self) -> int:
+        """
+        常驻内存的向量字节数（float 模式下为全部全精度向量）。
+        """
+        return self.vectors.nbytes if self.mode == "float" else self.codes.nbytes
+
+    def coarse_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        第一阶段得分，越大越相似。rows 为候选行（元数据过滤后的结果），None 表示全部。
+        """
+        if self.mode == "float":
+            vectors = self.vectors if rows is None else self.vectors[rows]
+            return np.asarray(vectors @ query)
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.mode == "int8":
+            weights = (query * self.scale).astype(np.float32)
+            return np.concatenate([
+                codes[i:i + BLOCK_ROWS].astype(np.float32) @ weights
+                for i in range(0, len(codes), BLOCK_ROWS)
+            ]) if len(codes) else np.zeros(0, dtype=np.float32)
+        query_bits = np.packbits(query > 0)
+        return -POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32).astype(np.float32)
+
+    def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None, rescore: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        返回 (行号, 内积) 两个数组，按内积降序。
+        """
+        query = np.asarray(query, dtype=np.float32)
+        rows = None if mask is None or mask.all() else np.flatnonzero(mask)
+        scores = self.coarse_scores(query, rows)
+        rescore = rescore and self.mode != "float"
+        n_candidates = min(len(scores), k * self.rescore_factor if rescore else k)
+        if n_candidates == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        candidates = top if rows is None else rows[top]
+        if rescore:
+            # 只读取候选行的全精度向量；按行号排序读取对内存映射更友好
+            candidates = np.sort(candidates)
+            scores = np.asarray(self.vectors[candidates] @ query)
+        else:
+            scores = scores[top]
+        order = np.argsort(-scores, kind="stable")[:k]
+        return candidates[order], scores[order]
+
+
+class QuantizedVectorStore(VectorStore):
+    """
+    基于 QuantizedIndex 的只读向量库，元数据过滤在 CorpusStore 的列式元数据上完成，
+    只为最终结果构造 Document。距离与 Chroma 默认的 l2 一致（归一化向量下为 2 - 2·内积）。
+    """
+
+    def __init__(self, index: QuantizedIndex, corpus_store: CorpusStore, embedding_function):
+        self.index = index
+        self.corpus_store = corpus_store
+        self._embedding_function = embedding_function
+
+    @classmethod
+    def from_vectorstore(cls, index_dir: str, vectorstore, embedding_function, mode: str = "int8", rescore_factor: int = 4):
+        """
+        从原 Chroma 集合读取文本与元数据，并按索引的行顺序排列。
+        """
+        index = QuantizedIndex(index_dir, mode=mode, rescore_factor=rescore_factor)
+        raw = vectorstore.get(include=["documents", "metadatas"])
+        position = {doc_id: i for i, doc_id in enumerate(raw["ids"])}
+        missing = [doc_id for doc_id in index.ids if doc_id not in position]
+        if missing:
+            raise ValueError(f"{len(missing)} ids in {index_dir} are not in the collection; rebuild the quantized index")
+        order = [position[doc_id] for doc_id in index.ids]
+        corpus_store = CorpusStore(
+            (raw["documents"][i] for i in order),
+            (raw["metadatas"][i] for i in order),
+            index.ids
+        )
+        return cls(index, corpus_store, embedding_function)
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _search(self, embedding: List[float], k: int, filter: Optional[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        mask = self.corpus_store.filter_mask(filter) if filter else None
+        return self.index.search(np.asarray(embedding, dtype=np.float32), k, mask)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Tuple[Document, float]]:
+        rows, scores = self._search(embedding, k, filter)
+        return [(self.corpus_store.document(int(row)), float(2 - 2 * score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        rows, _ = self._search(embedding, k, filter)
+        return [self.corpus_store.document(int(row)) for row in rows]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k, filter)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        rows, _ = self._search(embedding, max(k, fetch_k), filter)
+        if len(rows) == 0:
+            return []
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding, dtype=np.float32),
+            np.asarray(self.index.vectors[rows]),
+            k=k,
+            lambda_mult=lambda_mult
+        )
+        return [self.corpus_store.document(int(rows[i])) for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding_function.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        rows = np.flatnonzero(self.corpus_store.filter_mask(where))
+        if ids is not None:
+            wanted = set(ids)
+            rows = [i for i in rows if self.corpus_store.ids[i] in wanted]
+        return {
+            "ids": [self.corpus_store.ids[i] for i in rows],
+            "documents": [self.corpus_store.page_content(i) for i in rows],
+            "metadatas": [self.corpus_store.metadata(i) for i in rows],
+        }
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("QuantizedVectorStore is read-only; build it with scripts/build_quantized_index.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("QuantizedVectorStore is read-only; build it with scripts/build_quantized_index.py")
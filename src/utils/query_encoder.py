@@ -0,0 +1,238 @@
+import os
+from typing import List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+MODEL_NAME = "ai-forever/ru-en-RoSBERTa"
+BACKENDS = ("reference", "torch", "torchscript", "onnx")
+
+# 与参考模型（HuggingFaceEmbeddings + normalize_embeddings）的允许误差，以 1 - 余弦相似度计。
+# 全精度后端只有算子实现差异；int8 动态量化会引入可测的误差，但仍远小于相关与无关片段间的相似度差距。
+PARITY_TOLERANCE = {"fp32": 1e-4, "int8": 2e-2}
+
+# 短于该长度（词元数）的单条查询走快速路径：不做填充、不排序分批
+SHORT_SEQUENCE_LENGTH = 64
+
+WARMUP_TEXTS = [
+    "срок",
+    "какие документы нужны для получения разрешения на временное проживание",
+    "Статья 6. Разрешение на временное проживание иностранного гражданина " * 4,
+]
+
+
+def get_embedding(backend: str = "reference", quantize: bool = False, num_threads: int = 0, device: str = "cuda") -> Embeddings:
+    """
+    构造 RoSBERTa 编码器。backend="reference" 为原来的 HuggingFaceEmbeddings，其余为 CPU 上的 OptimizedEmbeddings。
+    """
+    if backend == "reference":
+        from langchain_huggingface.embeddings.huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=MODEL_NAME,
+            model_kwargs={'device': device},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+    return OptimizedEmbeddings(backend=backend, quantize=quantize, num_threads=num_threads)
+
+
+class OptimizedEmbeddings(Embeddings):
+    """
+    面向 CPU 推理的 RoSBERTa 编码器，输出与参考模型一致（CLS 池化 + L2 归一化），可直接查询已有的 Chroma 索引：
+    - backend: "torch"（eager）、"torchscript"（trace 后冻结）或 "onnx"（ONNX Runtime）；
+    - quantize: 对线性层做 int8 动态量化；
+    - num_threads: 算子内线程数，0 表示使用物理核心数；
+    - 单条短查询不做填充直接推理，批量文本按长度排序分批以减少填充；
+    - 导出的模型缓存在 cache_dir，启动时做一次预热，避免首个请求承担初始化开销。
+    """
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        backend: str = "onnx",
+        quantize: bool = False,
+        num_threads: int = 0,
+        max_length: int = 512,
+        batch_size: int = 32,
+        cache_dir: str = "data/models",
+        warm_up: bool = True,
+    ):
+        if backend not in BACKENDS[1:]:
+            raise ValueError(f"Unsupported encoder backend: {backend}")
+        import torch
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.backend = backend
+        self.quantize = quantize
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.num_threads = num_threads or torch.get_num_threads()
+        self.cache_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        # 线程数是进程级设置，只在初始化时设置一次；推理会话本身可被多个线程同时调用
+        torch.set_num_threads(self.num_threads)
+        if backend == "onnx":
+            self._run = self._load_onnx()
+        else:
+            self._run = self._load_torch()
+        if warm_up:
+            self.warm_up()
+
+    @property
+    def precision(self) -> str:
+        return "int8" if self.quantize else "fp32"
+
+    def _load_reference_model(self):
+        import torch
+        from transformers import AutoModel
+
+        model = AutoModel.from_pretrained(self.model_name, torchscript=self.backend == "torchscript").eval()
+        if self.quantize and self.backend != "onnx":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _example_inputs(self):
+        encoded = self.tokenizer(WARMUP_TEXTS[1:], padding=True, return_tensors="pt")
+        return encoded["input_ids"], encoded["attention_mask"]
+
+    def _load_torch(self):
+        import torch
+
+        if self.backend == "torch":
+            model = self._load_reference_model()
+        else:
+            path = os.path.join(self.cache_dir, f"model.{self.precision}.pt")
+            if os.path.exists(path):
+                model = torch.jit.load(path)
+            else:
+                with torch.inference_mode():
+                    model = torch.jit.trace(self._load_reference_model(), self._example_inputs(), strict=False)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                model.save(f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+            model = torch.jit.optimize_for_inference(torch.jit.freeze(model.eval()))
+
+        def run(input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+            with torch.inference_mode():
+                outputs = model(torch.from_numpy(input_ids), torch.from_numpy(attention_mask))
+            hidden = outputs[0] if isinstance(outputs, (tuple, list)) else outputs.last_hidden_state
+            return hidden[:, 0].float().numpy()
+
+        return run
+
+    def _export_onnx(self) -> str:
+        import torch
+
+        path = os.path.join(self.cache_dir, "model.fp32.onnx")
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            model = self._load_reference_model()
+            tmp_path = f"{path}.tmp"
+            with torch.inference_mode():
+                torch.onnx.export(
+                    model,
+                    self._example_inputs(),
+                    tmp_path,
+                    input_names=["input_ids", "attention_mask"],
+                    output_names=["last_hidden_state"],
+                    dynamic_axes={
+                        "input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "last_hidden_state": {0: "batch", 1: "sequence"},
+                    },
+                    opset_version=17,
+                )
+            os.replace(tmp_path, path)
+        if not self.quantize:
+            return path
+
+        quantized_path = os.path.join(self.cache_dir, "model.int8.onnx")
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(path, f"{quantized_path}.tmp", weight_type=QuantType.QInt8)
+            os.replace(f"{quantized_path}.tmp", quantized_path)
+        return quantized_path
+
+    def _load_onnx(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(self._export_onnx(), options, providers=["CPUExecutionProvider"])
+
+        def run(input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+            hidden = session.run(["last_hidden_state"], {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+            return hidden[:, 0]
+
+        return run
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        cls = self._run(encoded["input_ids"].astype(np.int64), encoded["attention_mask"].astype(np.int64))
+        return cls / np.linalg.norm(cls, axis=1, keepdims=True)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # 快速路径：单条短文本，无填充，直接推理
+        if len(texts) == 1:
+            input_ids = self.tokenizer(texts[0], truncation=True, max_length=self.max_length)["input_ids"]
+            if len(input_ids) <= SHORT_SEQUENCE_LENGTH:
+                input_ids = np.asarray([input_ids], dtype=np.int64)
+                cls = self._run(input_ids, np.ones_like(input_ids))
+                return cls / np.linalg.norm(cls, axis=1, keepdims=True)
+
+        # 按长度排序后分批，每批只填充到本批最长的文本
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = np.zeros((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            vectors = self._encode_batch([texts[i] for i in rows])
+            if result.shape[1] == 0:
+                result = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[rows] = vectors
+        return result
+
+    def warm_up(self, rounds: int = 2):
+        """
+        覆盖单条快速路径与批量路径，触发线程池创建、内存分配与图优化。
+        """
+        for _ in range(rounds):
+            for text in WARMUP_TEXTS:
+                self.encode([text])
+            self.encode(WARMUP_TEXTS)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """
+    每行的 1 - 余弦相似度（两组向量均已归一化）。
+    """
+    return 1.0 - np.sum(np.asarray(reference) * np.asarray(candidate), axis=1)
+
+
+def check_parity(embedding: OptimizedEmbeddings, reference: Embeddings, texts: List[str], tolerance: Optional[float] = None) -> dict:
+    """
+    用参考模型校验优化后的编码器，返回 {"max", "mean", "tolerance", "passed"}。
+    """
+    tolerance = PARITY_TOLERANCE[embedding.precision] if tolerance is None else tolerance
+    expected = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    # 单条查询（快速路径）与批量编码两条路径都要校验
+    errors = np.maximum(
+        parity(expected, np.asarray([embedding.embed_query(text) for text in texts], dtype=np.float32)),
+        parity(expected, np.asarray(embedding.embed_documents(texts), dtype=np.float32))
+    )
+    return {
+        "max": float(errors.max()),
+        "mean": float(errors.mean()),
+        "tolerance": tolerance,
+        "passed": bool(errors.max() <= tolerance),
+    }
@@ -1,12 +1,12 @@
-import os
+from functools import lru_cache
 import torch
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
-from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_llm
 from langchain_core.runnables import RunnableLambda, RunnableParallel
 from langchain.retrievers import SelfQueryRetriever, EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
+from utils.corpus_store import CorpusStore, CorpusBM25Retriever, strip_context
 from langchain.chains.query_constructor.base import AttributeInfo
+from langchain_community.query_constructors.chroma import ChromaTranslator
 from langchain_core.runnables import ConfigurableField
 from pymorphy3 import MorphAnalyzer
 
@@ -64,18 +64,15 @@ metadata_field_info = [
 
 
 def get_self_query_retriever(vectorstore):
-    query_llm = ChatOpenAI(
-        model=os.getenv("STD_MIGRATION_MODEL"),
-        api_key=os.getenv("STD_MIGRATION_API_KEY"),
-        base_url=os.getenv("STD_MIGRATION_URL"),
-        temperature=0
-    )
+    query_llm = get_llm()
 
     return SelfQueryRetriever.from_llm(
         llm=query_llm,
         vectorstore=vectorstore,
         document_contents=document_content_description,
         metadata_field_info=metadata_field_info,
+        # 显式指定 Chroma 的过滤条件翻译器，使 PartitionedChroma 等非 Chroma 子类也能使用
+        structured_query_translator=ChromaTranslator(),
         search_type="mmr",
         search_kwargs={"k": 20}
     ).configurable_fields(
@@ -86,13 +83,15 @@ def get_self_query_retriever(vectorstore):
         )
     )
 
-def get_bm25_retriever(vectorstore):
-    raw_docs = vectorstore.get(include=["documents", "metadatas"])
-    documents = []
-    for doc, meta in zip(raw_docs["documents"], raw_docs["metadatas"]):
-        documents.append(Document(page_content=lemmatize_text('\n'.join(doc.split('\n')[2:])), metadata=meta))
-
-    base_retriever = BM25Retriever.from_documents(documents=documents, k=20).configurable_fields(
+def get_bm25_retriever(vectorstore, corpus_store: CorpusStore = None):
+    # 对去掉法律名称与章节标题的词元化文本建索引，返回原文片段
+    corpus_store = corpus_store or CorpusStore.from_vectorstore(vectorstore)
+    base_retriever = CorpusBM25Retriever.from_store(
+        corpus_store,
+        preprocess=lambda text: lemmatize_text(text).split(),
+        text="rerank",
+        k=20
+    ).configurable_fields(
         k=ConfigurableField(
             id="bm25_k_id",
             name="BM25 top-k",
@@ -100,84 +99,90 @@ def get_bm25_retriever(vectorstore):
         )
     )
 
-    retriever_with_lemmatize = (
-        RunnableLambda(lambda x: lemmatize_text(x) if isinstance(x, str) else x)
-        | base_retriever
-    )
+    return base_retriever
 
-    return retriever_with_lemmatize
 
-
-def get_reranking_retriever(base_retriever, model_name="qilowoq/bge-reranker-v2-m3-en-ru"):
+@lru_cache(maxsize=2)
+def load_reranker(model_name="qilowoq/bge-reranker-v2-m3-en-ru"):
+    """
+    加载 cross-encoder 并返回打分函数 score_pairs(pairs) -> List[float]。
+    同一模型在进程内只加载一次，供重排序与本地文件清单匹配共用。
+    """
     # 加载 tokenizer 和模型
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device)
     model.eval()
 
+    def score_pairs(pairs, batch_size=64):
+        scores = []
+        for i in range(0, len(pairs), batch_size):
+            # tokenization
+            encoded = tokenizer(
+                pairs[i:i + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_tensors="pt"
+            ).to(model.device)
+
+            # 计算 logits
+            with torch.inference_mode():
+                logits = model(**encoded, return_dict=True).logits.view(-1)
+            scores.extend(logits.cpu().tolist())
+        return scores
+
+    return score_pairs
+
+
+def get_reranking_retriever(base_retriever, model_name="qilowoq/bge-reranker-v2-m3-en-ru"):
+    score_pairs = load_reranker(model_name)
+
     def rerank(inputs):
         query, docs, k = inputs["query"], inputs["docs"], inputs["k"]
         if not docs:
             return []
 
         # 构造 query-doc pairs，去除章节信息排序
-        pairs = [(query, '\n'.join(doc.page_content.split('\n')[2:])) for doc in docs]
-
-        # tokenization
-        encoded = tokenizer(
-            pairs,
-            padding=True,
-            truncation=True,
-            max_length=512,
-            return_tensors="pt"
-        ).to(model.device)
-
-        # 计算 logits
-        with torch.inference_mode():
-            logits = model(**encoded, return_dict=True).logits.view(-1)
+        pairs = [(query, strip_context(doc.page_content)) for doc in docs]
         
-        # 排序
-        ranked = sorted(zip(docs, logits.cpu().tolist()), key=lambda x: x[1], reverse=True)
+        # 排序；with_scores 时返回 (doc, 得分)，供检索节点与其他分片的结果合并
+        ranked = sorted(zip(docs, score_pairs(pairs)), key=lambda x: x[1], reverse=True)
+        if inputs["with_scores"]:
+            return ranked[:k]
         return [doc for doc, _ in ranked[:k]]
 
     return (
         RunnableParallel({
             "query": lambda x: x["query"],
             "k": lambda x: x.get("k", 20),
+            "with_scores": lambda x: x.get("with_scores", False),
             "docs": lambda x: base_retriever.invoke(
                 x["query"], 
-                config={"configurable": {"search_kwargs": {"k": x.get("k", 20) * 4}}}
+                config={"configurable": {"search_kwargs_id": {"k": x.get("k", 20) * 4}}}
             ),
         })
         | RunnableLambda(rerank)
     )
 
 
-def get_ensemble_retriever(vectorstore):
-    raw_docs = vectorstore.get(include=["documents", "metadatas"])
-    documents = [
-        Document(page_content=doc, metadata=meta)
-        for doc, meta in zip(raw_docs["documents"], raw_docs["metadatas"])
-    ]
-
-    bm25_retriever = BM25Retriever.from_documents(documents=documents).configurable_fields(
+def get_ensemble_retriever(vectorstore, corpus_store: CorpusStore = None):
+    corpus_store = corpus_store or CorpusStore.from_vectorstore(vectorstore)
+    bm25_retriever = CorpusBM25Retriever.from_store(corpus_store, k=4).configurable_fields(
         k=ConfigurableField(
             id="bm25_k_id", name="BM25 top-k", description="BM25 返回的文档数量"
         )
     )
 
-    query_llm = ChatOpenAI(
-        model=os.getenv("STD_MIGRATION_MODEL"),
-        api_key=os.getenv("STD_MIGRATION_API_KEY"),
-        base_url=os.getenv("STD_MIGRATION_URL"),
-        temperature=0
-    )
+    query_llm = get_llm()
 
     self_query_retriever = SelfQueryRetriever.from_llm(
         llm=query_llm,
         vectorstore=vectorstore,
         document_contents=document_content_description,
         metadata_field_info=metadata_field_info,
+        # 显式指定 Chroma 的过滤条件翻译器，使 PartitionedChroma 等非 Chroma 子类也能使用
+        structured_query_translator=ChromaTranslator(),
         search_type="mmr",
         search_kwargs={}
     ).configurable_fields(
@@ -0,0 +1,216 @@
+import sys
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Tuple
+import httpx
+import numpy as np
+from langchain_core.documents import Document
+from langchain_chroma import Chroma
+from utils.quantized_index import QuantizedVectorStore
+
+# 节点返回的得分类型：rerank 为 cross-encoder 得分，cosine 为查询与片段向量的内积（向量已归一化）
+# 两者都只取决于 (查询, 片段) 本身，与分片中的其他片段无关，因此不同分片的得分可以直接比较
+SCORE_TYPES = ("rerank", "cosine")
+
+# 带延迟预算的请求转发给节点时，为网络往返与合并预留的时间（毫秒）
+NETWORK_MARGIN_MS = 20
+
+
+def similarity_scores(vectorstore, embedding, query: str, docs: List[Document]) -> List[float]:
+    """
+    查询向量与片段向量的内积。优先使用向量库中已保存的向量（Chroma、量化索引），否则重新编码片段。
+    """
+    if not docs:
+        return []
+    query_vector = np.asarray(embedding.embed_query(query), dtype=np.float32)
+    ids = [doc.id for doc in docs]
+    vectors = None
+    if all(ids) and isinstance(vectorstore, Chroma):
+        raw = vectorstore._collection.get(ids=ids, include=["embeddings"])
+        stored = dict(zip(raw["ids"], raw["embeddings"]))
+        if len(stored) == len(set(ids)):
+            vectors = np.asarray([stored[doc_id] for doc_id in ids], dtype=np.float32)
+    elif all(ids) and isinstance(vectorstore, QuantizedVectorStore):
+        rows = {doc_id: row for row, doc_id in enumerate(vectorstore.index.ids)}
+        if all(doc_id in rows for doc_id in ids):
+            vectors = np.asarray(vectorstore.index.vectors[[rows[doc_id] for doc_id in ids]])
+    if vectors is None:
+        vectors = np.asarray(embedding.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+    return (vectors @ query_vector).tolist()
+
+
+def encode_results(scored: List[Tuple[Document, float]]) -> List[Dict[str, Any]]:
+    return [
+        {"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata, "score": float(score)}
+        for doc, score in scored
+    ]
+
+
+def _doc_key(item: Dict[str, Any]) -> str:
+    metadata = item.get("metadata") or {}
+    return item.get("id") or f"{metadata.get('law_index')}:{metadata.get('article_index')}:{item['page_content'][:64]}"
+
+
+class ScatterGatherRetriever:
+    """
+    把检索请求并行发往各检索节点（lawyer_tools.py --retrieval_node，每个节点服务一个分片），再按得分全局合并：
+    - 每个请求的截止时间从其实际发出时开始计算，超时、迟到或出错的节点被跳过，只合并按时返回的结果；
+    - 所有节点都失败时抛出异常；
+    - 同一片段出现在多个分片中时只保留得分最高的一份。
+    接口与 search_law_articles 使用的检索器一致（search / search_batch / get），增加节点无需修改工具。
+    """
+
+    def __init__(self, nodes: List[str], timeout: float = 2.0, max_connections: int = 64):
+        self.nodes = [node.rstrip("/") for node in nodes]
+        self.timeout = timeout
+        self.client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(timeout)
+        )
+        # 线程数与连接数一致：批量检索的 查询数 × 节点数 个请求在连接池允许的范围内同时发出
+        self.max_connections = max_connections
+        self.executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="scatter")
+        self._lock = threading.Lock()
+        self._warned_score_types = False
+        self.counters = {node: {"ok": 0, "timeout": 0, "error": 0, "total_ms": 0.0} for node in self.nodes}
+
+    def _record(self, node: str, status: str, elapsed_ms: float = 0.0):
+        with self._lock:
+            self.counters[node][status] += 1
+            self.counters[node]["total_ms"] += elapsed_ms
+
+    def _finish(self, node: str, request: Dict[str, bool], status: str, elapsed_ms: float = 0.0) -> bool:
+        # 请求结束与 scatter 放弃等待只有一方计数，已被放弃的请求不再记录
+        with self._lock:
+            if request["abandoned"]:
+                return False
+            request["finished"] = True
+        self._record(node, status, elapsed_ms)
+        return True
+
+    def _abandon(self, node: str, request: Dict[str, bool]) -> bool:
+        with self._lock:
+            if request["finished"]:
+                return False
+            request["abandoned"] = True
+        self._record(node, "timeout")
+        return True
+
+    def _post(self, node: str, path: str, payload: Dict[str, Any], timeout: float, request: Dict[str, bool]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            response = self.client.post(f"{node}{path}", json=payload, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        except httpx.TimeoutException:
+            self._finish(node, request, "timeout")
+            raise
+        except Exception:
+            self._finish(node, request, "error")
+            raise
+        elapsed = time.perf_counter() - start
+        # httpx 的超时按连接、读取等阶段分别计算，总耗时仍可能超过截止时间
+        if elapsed > timeout:
+            self._finish(node, request, "timeout")
+            raise TimeoutError(f"reply arrived after {elapsed:.2f}s")
+        self._finish(node, request, "ok", elapsed * 1000)
+        return data
+
+    def scatter(self, path: str, payloads: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        每个 payload 发往全部节点，返回每个 payload 按时成功的节点回复列表。
+        每个请求的截止时间为发出后 timeout 秒（默认 self.timeout，可由请求的延迟预算缩短），排队等待线程的时间不计入。
+        """
+        timeout = self.timeout if timeout is None else max(0.0, min(timeout, self.timeout))
+        futures = {}
+        for i, payload in enumerate(payloads):
+            for node in self.nodes:
+                request = {"abandoned": False, "finished": False}
+                futures[self.executor.submit(self._post, node, path, payload, timeout, request)] = (i, node, request)
+        # 请求数超过线程数时分批发出，总等待时间按批数放宽
+        waves = math.ceil(len(futures) / self.max_connections) if futures else 0
+        done, not_done = wait(futures, timeout=timeout * waves + 0.05)
+        replies: List[List[Dict[str, Any]]] = [[] for _ in payloads]
+        for future in not_done:
+            i, node, request = futures[future]
+            future.cancel()
+            if not self._abandon(node, request):
+                # 在放弃等待前的一瞬间刚刚结束
+                done.add(future)
+        for future in done:
+            i, node, _ = futures[future]
+            try:
+                replies[i].append(future.result())
+            except (httpx.TimeoutException, TimeoutError):
+                pass
+            except Exception as e:
+                print(f"⚠️ Retrieval node {node}{path} failed: {e}", file=sys.stderr)
+        return replies
+
+    def _merge(self, replies: List[Dict[str, Any]], k: int) -> List[Document]:
+        score_types = {reply.get("score_type") for reply in replies}
+        mixed = len(score_types) > 1
+        # 节点因延迟预算跳过重排序时会改用向量得分；只有未降级的节点得分类型不一致才是配置问题
+        if mixed and len({reply.get("score_type") for reply in replies if not reply.get("degraded")}) > 1 and not self._warned_score_types:
+            self._warned_score_types = True
+            print(f"⚠️ Retrieval nodes return different score types {sorted(map(str, score_types))}; start all nodes with the same --use_reranker setting", file=sys.stderr)
+        best: Dict[str, Dict[str, Any]] = {}
+        for reply in replies:
+            for rank, item in enumerate(reply["results"]):
+                # 得分不可比时按各节点内的名次交替合并
+                if mixed:
+                    item = {**item, "score": 1.0 / (rank + 1)}
+                key = _doc_key(item)
+                if key not in best or item["score"] > best[key]["score"]:
+                    best[key] = item
+        ranked = sorted(best.values(), key=lambda item: item["score"], reverse=True)[:k]
+        return [Document(page_content=item["page_content"], metadata=item["metadata"], id=item.get("id")) for item in ranked]
+
+    def search_batch(self, queries: List[str], ks: List[int], timeout: Optional[float] = None) -> List[List[Document]]:
+        replies = self.scatter("/search", [{"query": query, "n_results": k} for query, k in zip(queries, ks)], timeout)
+        if queries and not any(replies):
+            raise RuntimeError(f"No retrieval node answered within {self.timeout if timeout is None else timeout}s")
+        return [self._merge(query_replies, k) for query_replies, k in zip(replies, ks)]
+
+    def search(self, query: str, k: int, timeout: Optional[float] = None) -> List[Document]:
+        return self.search_batch([query], [k], timeout)[0]
+
+    def search_budgeted(self, query: str, k: int, timeout: float) -> Tuple[List[Document], Dict[str, Any]]:
+        """
+        带延迟预算的检索：剩余预算（扣除网络预留）随请求转发给节点，节点按预算取舍检索阶段后按时返回。
+        返回 (结果, {"nodes", "answered", "degraded_nodes"})，未按时返回或自身降级的节点数用于判断结果是否降级。
+        """
+        timeout = max(0.0, min(timeout, self.timeout))
+        budget_ms = max(1.0, timeout * 1000 - NETWORK_MARGIN_MS)
+        replies = self.scatter("/search", [{"query": query, "n_results": k, "latency_budget_ms": budget_ms}], timeout)[0]
+        if not replies:
+            raise RuntimeError(f"No retrieval node answered within {timeout}s")
+        return self._merge(replies, k), {
+            "nodes": len(self.nodes),
+            "answered": len(replies),
+            "degraded_nodes": sum(1 for reply in replies if reply.get("degraded")),
+        }
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        """
+        按片段 ID 从各节点取回片段，返回格式与 Chroma.get 相同。
+        """
+        found = {}
+        for reply in self.scatter("/chunks", [{"ids": list(ids or [])}])[0]:
+            for item in reply["results"]:
+                found.setdefault(item["id"], item)
+        items = list(found.values())
+        return {
+            "ids": [item["id"] for item in items],
+            "documents": [item["page_content"] for item in items],
+            "metadatas": [item["metadata"] for item in items],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                node: {**counters, "mean_ms": counters["total_ms"] / counters["ok"] if counters["ok"] else 0.0}
+                for node, counters in self.counters.items()
+            }
@@ -0,0 +1,168 @@
+from typing import List, Dict, Any, Tuple, Union, Callable
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from utils.tokens import estimate_tokens
+from utils.corpus_artifact import load_articles
+
+# 命中片段在重建后的条文中的标记前缀
+MATCH_MARK = "▶ "
+
+# RRF 平滑常数：排名越靠前的片段贡献越大，但不会让第一名压倒一切
+RRF_K = 60
+
+
+# --- 加载法律条文原始结构，用于重建父级条文 ---
+def load_article_store(laws_dir: str) -> Dict[Tuple[int, str], Dict[str, Any]]:
+    """
+    返回以 (law_index, article_index) 为键的条文字典。
+    优先使用 laws_dir/_corpus 列式语料库（条文按需解析），否则读取 laws_dir/*/articles/*.json。
+    """
+    return load_articles(laws_dir)
+
+
+def leaf_key(metadata: Dict[str, Any]) -> Tuple:
+    """
+    根据片段元数据生成其在条文树中的位置键，与 parse_law_json_to_docs 的切分方式一一对应。
+    """
+    if metadata.get("type") == "unindexed_paragraph":
+        if "subclause_index" in metadata:
+            return ("sp", metadata["clause_index"], metadata["subclause_index"], metadata["paragraph_order"])
+        if "clause_index" in metadata:
+            return ("cp", metadata["clause_index"], metadata["paragraph_order"])
+        return ("p", metadata["paragraph_order"])
+    if metadata.get("type") == "subclause":
+        return ("s", metadata["clause_index"], metadata["subclause_index"])
+    return ("c", metadata.get("clause_index", ""))
+
+
+def _mark(text: str, hit: bool) -> str:
+    return f"{MATCH_MARK}{text}" if hit else text
+
+
+def render_article(article: Dict[str, Any], hits: set, whole_article: bool = False) -> str:
+    """
+    将命中的片段还原到所属条文中。
+
+    默认只保留包含命中片段的款（Пункт），款标题作为上下文保留，命中的段落/项加标记；
+    whole_article=True 时输出整条条文，仅对命中部分加标记。
+    """
+    lines = [article["law_title"], article["chapter_title"], article["article_title"]]
+
+    for i, text in enumerate(article.get("unindexed", [])):
+        hit = ("p", i + 1) in hits
+        if hit or whole_article:
+            lines.append(_mark(text, hit))
+
+    for clause in article.get("clauses", []):
+        clause_index = clause.get("clause_index", "")
+        clause_hit = ("c", clause_index) in hits
+        clause_lines = []
+
+        for i, text in enumerate(clause.get("unindexed", [])):
+            hit = ("cp", clause_index, i + 1) in hits
+            if hit or whole_article:
+                clause_lines.append(_mark(text, hit))
+
+        for subclause in clause.get("subclauses", []):
+            subclause_index = subclause.get("subclause_index", "")
+            sub_hit = ("s", clause_index, subclause_index) in hits
+            sub_lines = []
+            for i, text in enumerate(subclause.get("unindexed", [])):
+                hit = ("sp", clause_index, subclause_index, i + 1) in hits
+                if hit or whole_article:
+                    sub_lines.append(_mark(text, hit))
+            if sub_hit or sub_lines or whole_article:
+                clause_lines.append(_mark(subclause["subclause_text"], sub_hit))
+                clause_lines.extend(sub_lines)
+
+        if clause_hit or clause_lines or whole_article:
+            lines.append(_mark(clause["clause_text"], clause_hit))
+            lines.extend(clause_lines)
+
+    return "\n".join(lines)
+
+
+def _fallback_render(docs: List[Document]) -> str:
+    # 条文库中找不到父条文时，按出现顺序合并片段并去除重复的行
+    seen = set()
+    lines = []
+    for doc in docs:
+        for line in doc.page_content.split("\n"):
+            if line not in seen:
+                seen.add(line)
+                lines.append(line)
+    return "\n".join(lines)
+
+
+def merge_hits_by_article(
+    docs: List[Document],
+    article_store: Dict[Tuple[int, str], Dict[str, Any]],
+    token_budget: int = 0,
+    whole_article_tokens: int = 300,
+) -> List[Document]:
+    """
+    small-to-big：按 (law_index, article_index) 对叶子片段分组，每组合并为一个重建后的条文块。
+
+    Args:
+        docs: 按相关度排序的叶子片段（款、项、无编号段落）。
+        article_store: load_article_store 的返回值。
+        token_budget: 返回内容的 token 上限，0 表示不限制；排名靠后的条文块优先被舍弃。
+        whole_article_tokens: 整条条文估计不超过该 token 数时直接返回整条条文。
+
+    Returns:
+        List[Document]: 按聚合得分排序的条文块，metadata 中包含命中数与得分。
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        key = (int(doc.metadata["law_index"]), str(doc.metadata["article_index"]))
+        group = groups.setdefault(key, {"docs": [], "hits": set(), "score": 0.0})
+        group["docs"].append(doc)
+        group["hits"].add(leaf_key(doc.metadata))
+        group["score"] += 1.0 / (RRF_K + rank + 1)
+
+    results = []
+    used_tokens = 0
+    for key, group in sorted(groups.items(), key=lambda x: x[1]["score"], reverse=True):
+        article = article_store.get(key)
+        if article is None:
+            content = _fallback_render(group["docs"])
+        else:
+            content = render_article(article, group["hits"])
+            full = render_article(article, group["hits"], whole_article=True)
+            if estimate_tokens(full) <= whole_article_tokens:
+                content = full
+
+        tokens = estimate_tokens(content)
+        if token_budget and results and used_tokens + tokens > token_budget:
+            break
+        used_tokens += tokens
+
+        first_meta = group["docs"][0].metadata
+        results.append(Document(
+            page_content=content,
+            metadata={
+                "law_index": key[0],
+                "law_date": first_meta.get("law_date"),
+                "chapter_index": first_meta.get("chapter_index"),
+                "article_index": key[1],
+                "type": "article_block",
+                "matched_chunks": len(group["docs"]),
+                "score": round(group["score"], 6),
+            }
+        ))
+
+    return results
+
+
+def get_small_to_big_retriever(leaf_retriever, article_store: Union[Dict[Tuple[int, str], Dict[str, Any]], Callable]):
+    """
+    包装任意返回叶子片段的检索函数 leaf_retriever(query, n_results) -> List[Document]。
+    输入为 {"query", "n_results", "token_budget"}，输出为合并后的条文块。
+    article_store 也可以是无参函数，每次检索时调用，用于按快照返回不同版本的条文。
+    """
+    def retrieve(inputs: Dict[str, Any]) -> List[Document]:
+        leaves = leaf_retriever(inputs["query"], inputs.get("n_results", 20))
+        store = article_store() if callable(article_store) else article_store
+        return merge_hits_by_article(leaves, store, token_budget=inputs.get("token_budget", 0))
+
+    return RunnableLambda(retrieve)
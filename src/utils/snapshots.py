@@ -0,0 +1,196 @@
+import os
+import json
+import datetime
+import threading
+import contextvars
+from typing import List, Dict, Any, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# --- 快照目录结构（由 scripts/build_snapshot.py 生成） ---
+# <root>/store/                     共享的 Chroma 数据库，片段以内容哈希为 ID，跨版本只存一份
+# <root>/objects/<sha1>.json        按内容寻址的条文 JSON，供 small-to-big 还原历史条文
+# <root>/snapshots/<id>/manifest.json  不可变的快照清单
+# <root>/CURRENT                    当前生效的快照 ID，通过 os.replace 原子切换
+STORE_DIR = "store"
+OBJECTS_DIR = "objects"
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_COLLECTION = "law_chunks"
+
+# 仍然有效的片段的 valid_to
+OPEN_END = 99991231
+
+# 当前请求使用的快照清单；未设置时使用 CURRENT 指向的快照
+active_snapshot: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "active_snapshot", default=None
+)
+
+
+def date_key(date: str) -> int:
+    """
+    'YYYY-MM-DD' -> YYYYMMDD，用于 Chroma 元数据中的区间比较。
+    """
+    return int(date.replace("-", ""))
+
+
+def validity_filter(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    快照生效日当天有效的片段：valid_from <= as_of < valid_to。
+    """
+    as_of = date_key(manifest["as_of"])
+    return {"$and": [{"valid_from": {"$lte": as_of}}, {"valid_to": {"$gt": as_of}}]}
+
+
+def write_atomic(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def list_manifests(root: str) -> List[Dict[str, Any]]:
+    """
+    按生效日期升序返回所有快照清单。
+    """
+    snapshots_dir = os.path.join(root, SNAPSHOTS_DIR)
+    manifests = []
+    if os.path.isdir(snapshots_dir):
+        for snapshot_id in os.listdir(snapshots_dir):
+            path = os.path.join(snapshots_dir, snapshot_id, "manifest.json")
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    manifests.append(json.load(f))
+    return sorted(manifests, key=lambda m: m["as_of"])
+
+
+class SnapshotRegistry:
+    """
+    读取快照清单与 CURRENT 指针。
+
+    每次 current() 都会检查 CURRENT 的修改时间，构建脚本切换指针后，
+    下一次请求即使用新快照，无需重启服务；正在处理的请求仍使用其开始时解析到的快照。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._current_mtime = None
+        self._current: Optional[Dict[str, Any]] = None
+        self._manifests: List[Dict[str, Any]] = []
+        self._article_stores: Dict[str, Dict[Tuple[int, str], Dict[str, Any]]] = {}
+
+    @property
+    def persist_directory(self) -> str:
+        return os.path.join(self.root, STORE_DIR)
+
+    def current(self) -> Dict[str, Any]:
+        path = os.path.join(self.root, CURRENT_FILE)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            if mtime != self._current_mtime:
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshot_id = f.read().strip()
+                self._manifests = list_manifests(self.root)
+                current = next((m for m in self._manifests if m["snapshot_id"] == snapshot_id), None)
+                if current is None:
+                    raise ValueError(f"{path} points to snapshot '{snapshot_id}', but {os.path.join(self.root, SNAPSHOTS_DIR, snapshot_id, 'manifest.json')} does not exist")
+                self._current = current
+                self._current_mtime = mtime
+            return self._current
+
+    def resolve(self, as_of: Optional[str] = None) -> Dict[str, Any]:
+        """
+        as_of 为空时返回当前快照；否则返回生效日期不晚于 as_of 的最新快照。
+        as_of 必须是 ISO 格式的日期（YYYY-MM-DD），比较前统一为该格式。
+        """
+        current = self.current()
+        if not as_of:
+            return current
+        try:
+            as_of = datetime.date.fromisoformat(as_of.strip()).isoformat()
+        except ValueError:
+            raise ValueError(f"Invalid as_of date '{as_of}', expected YYYY-MM-DD (e.g. 2024-03-05)") from None
+        with self._lock:
+            candidates = [m for m in self._manifests if m["as_of"] <= as_of and m["as_of"] <= current["as_of"]]
+        if not candidates:
+            raise ValueError(f"No law snapshot available as of {as_of}")
+        return candidates[-1]
+
+    def article_store(self, manifest: Optional[Dict[str, Any]] = None) -> Dict[Tuple[int, str], Dict[str, Any]]:
+        """
+        返回快照对应的条文字典，格式与 small_to_big.load_article_store 相同。
+        """
+        manifest = manifest or active_snapshot.get() or self.current()
+        with self._lock:
+            store = self._article_stores.get(manifest["snapshot_id"])
+        if store is not None:
+            return store
+
+        store = {}
+        for digest in manifest["articles"].values():
+            with open(os.path.join(self.root, OBJECTS_DIR, f"{digest}.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            store[(int(data["law_index"]), str(data["article_index"]))] = data
+        with self._lock:
+            self._article_stores[manifest["snapshot_id"]] = store
+        return store
+
+
+def _and(*conditions: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    flat = []
+    for condition in conditions:
+        if not condition:
+            continue
+        flat.extend(condition["$and"] if "$and" in condition else [condition])
+    return flat[0] if len(flat) == 1 else {"$and": flat}
+
+
+class SnapshotVectorStore(VectorStore):
+    """
+    在任意 Chroma 兼容向量库外附加快照有效期过滤：检索只返回在当前请求的快照中有效的片段。
+    快照由 active_snapshot 上下文变量指定，未指定时使用 CURRENT。
+    """
+
+    def __init__(self, vectorstore: VectorStore, registry: SnapshotRegistry):
+        self.vectorstore = vectorstore
+        self.registry = registry
+
+    @property
+    def embeddings(self):
+        return self.vectorstore.embeddings
+
+    def _filter(self, filter: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        manifest = active_snapshot.get() or self.registry.current()
+        return _and(filter, validity_filter(manifest))
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return self.vectorstore.similarity_search(query, k=k, filter=self._filter(filter), **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Tuple[Document, float]]:
+        return self.vectorstore.similarity_search_with_score(query, k=k, filter=self._filter(filter), **kwargs)
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return self.vectorstore.max_marginal_relevance_search(
+            query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=self._filter(filter), **kwargs
+        )
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Document]:
+        return self.vectorstore.max_marginal_relevance_search_by_vector(
+            embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=self._filter(filter), **kwargs
+        )
+
+    def _select_relevance_score_fn(self):
+        return self.vectorstore._select_relevance_score_fn()
+
+    def get(self, where: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        return self.vectorstore.get(where=self._filter(where), **kwargs)
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("Snapshots are immutable; ingest with scripts/build_snapshot.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Snapshots are immutable; ingest with scripts/build_snapshot.py")
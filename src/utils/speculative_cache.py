@@ -0,0 +1,97 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SpeculativeCache:
+    """
+    预测性预取：在确定需要某个结果之前提前在后台计算，结果按键缓存 ttl 秒。
+
+    - prefetch(key, fn) 提交后台计算；同一键已在缓存中时不重复提交；
+    - 正在运行与等待中的预取数达到 max_pending 时直接放弃本次预取，限制预测性计算的总量；
+    - get(key) 命中时取出结果（预取仍在运行时等待其完成），未命中返回 None，由调用方照常计算；
+    - 过期未被取用的结果计入浪费的计算（次数与耗时）。
+    """
+
+    def __init__(self, ttl: float = 60.0, max_workers: int = 2, max_pending: int = 4):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._entries: Dict[Hashable, tuple] = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "skipped": 0,
+            "hits": 0,
+            "misses": 0,
+            "wasted": 0,
+            "wasted_seconds": 0.0,
+            "failed": 0,
+        }
+
+    def _run(self, fn: Callable[[], Any]) -> tuple:
+        start = time.perf_counter()
+        return fn(), time.perf_counter() - start
+
+    def _expire(self, now: float):
+        for key in [key for key, (_, created) in self._entries.items() if now - created > self.ttl]:
+            future, _ = self._entries.pop(key)
+            self._count_waste(future)
+
+    def _count_waste(self, future: Future):
+        self.counters["wasted"] += 1
+        if future.done() and future.exception() is None:
+            self.counters["wasted_seconds"] += future.result()[1]
+
+    def _pending(self) -> int:
+        return sum(1 for future, _ in self._entries.values() if not future.done())
+
+    def prefetch(self, key: Hashable, fn: Callable[[], Any]) -> bool:
+        """
+        在后台执行 fn（复制当前上下文，上下文变量在预取中同样生效），返回是否已提交。
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                return False
+            if self._pending() >= self.max_pending:
+                self.counters["skipped"] += 1
+                return False
+            context = contextvars.copy_context()
+            future = self._executor.submit(context.run, self._run, fn)
+            self._entries[key] = (future, now)
+            self.counters["submitted"] += 1
+            return True
+
+    def get(self, key: Hashable, timeout: Optional[float] = None) -> Optional[Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+        try:
+            result, _ = entry[0].result(timeout=timeout)
+        except Exception:
+            # 预取失败或等待超时：由调用方重新计算
+            with self._lock:
+                self.counters["failed"] += 1
+            return None
+        with self._lock:
+            self.counters["hits"] += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "cached": len(self._entries),
+                "pending": self._pending(),
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "waste_rate": self.counters["wasted"] / self.counters["submitted"] if self.counters["submitted"] else 0.0,
+            }
@@ -0,0 +1,6 @@
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计文本的 token 数量，用于按 token 预算裁剪返回给 Agent 的内容。
+    俄语/中文文本在常见 BPE 分词器下大约每 3 个字符对应一个 token，这里不追求精确，只保证量级正确且足够快。
+    """
+    return len(text) // 3 + 1